@@ -3,7 +3,15 @@ from pathlib import Path
 from dotenv import load_dotenv
 
 
+_ENV_CARGADO = False
+
+
 def _load_env() -> None:
+    # Una vez por proceso (en modo worker los pasos comparten proceso)
+    global _ENV_CARGADO
+    if _ENV_CARGADO:
+        return
+    _ENV_CARGADO = True
     candidates = [
         Path.cwd() / ".env",
         Path(__file__).resolve().parents[1] / ".env",
@@ -0,0 +1,155 @@
+# checkpoints.py
+# Puntos de control para reanudar backfills largos (main_from_date).
+#
+# Cada paso lleva un fichero JSON-lines en checkpoints/<grupo>.<paso>.jsonl:
+#   1ª línea: {"clave": ..., "inicio": ...}  (si la clave cambia, se empieza de cero)
+#   resto:    un registro por unidad terminada (página, albaran, lote...)
+#   final:    {"completado": {...}} cuando el paso acaba sin errores
+# Cada registro se añade al fichero al terminar su unidad: si el proceso muere,
+# como mucho se repite la unidad en curso. Una última línea a medio escribir
+# se descarta al leer.
+#
+# Con en_memoria=False los registros no se cargan en .registros (solo se cuentan
+# en .n_registros) y se recorren desde disco con iter_registros(): para pasos
+# cuyos registros llevan filas (páginas de un export).
+#
+# main_from_date borra el grupo cuando el pipeline termina bien.
+#
+# Comprobación contra un Cloudia falso local (corta cada export from-date a mitad
+# y lo reanuda): python comprobar_reanudacion.py
+#
+# Configuración por entorno:
+#   CHECKPOINTS  (0 = ni guardar ni reanudar, por defecto 1)
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+# =========================
+# CONFIG
+# =========================
+BASE_DIR = Path(__file__).resolve().parent
+CHECKPOINTS_DIR = BASE_DIR / "checkpoints"
+ACTIVO = os.getenv("CHECKPOINTS", "1").strip().lower() not in ("0", "false", "no")
+
+
+# =========================
+# Helpers
+# =========================
+def huella(path: Optional[Path]) -> Optional[str]:
+    """name:size:mtime_ns de un fichero (None si no existe)."""
+    if path is None or not Path(path).exists():
+        return None
+    st = Path(path).stat()
+    return f"{Path(path).name}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def clave_de(valores: Iterable[Any]) -> str:
+    """Clave estable para un conjunto de ids (p.ej. los albaranes a descargar)."""
+    h = hashlib.sha1()
+    for v in valores:
+        h.update(str(v).encode("utf-8"))
+        h.update(b",")
+    return h.hexdigest()
+
+
+# =========================
+# Checkpoint
+# =========================
+class Checkpoint:
+    def __init__(self, grupo: str, paso: str, clave: Any, en_memoria: bool = True):
+        self.path = CHECKPOINTS_DIR / f"{grupo}.{paso}.jsonl"
+        self.clave = str(clave)
+        self.en_memoria = en_memoria
+        self.registros: List[Dict[str, Any]] = []  # los anotados en intentos anteriores (en_memoria)
+        self.n_registros = 0
+        self.completado: Optional[Dict[str, Any]] = None
+        self._cabecera_escrita = False
+        if ACTIVO:
+            self._cargar()
+
+    def _cargar(self) -> None:
+        if not self.path.exists():
+            return
+        cabecera: Optional[Dict[str, Any]] = None
+        registros: List[Dict[str, Any]] = []
+        n = 0
+        completado = None
+        validos = 0
+        with self.path.open("rb") as f:
+            for raw in f:
+                try:
+                    rec = json.loads(raw)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    break  # escritura interrumpida: se descarta desde aquí
+                validos += len(raw)
+                if cabecera is None:
+                    cabecera = rec
+                elif "completado" in rec:
+                    completado = rec["completado"]
+                else:
+                    n += 1
+                    if self.en_memoria:
+                        registros.append(rec)
+        if validos < self.path.stat().st_size:
+            with self.path.open("r+b") as f:
+                f.truncate(validos)
+        if cabecera is None or cabecera.get("clave") != self.clave:
+            print(f"[INFO] Checkpoint {self.path.name}: clave distinta, se empieza de cero")
+            self.path.unlink(missing_ok=True)
+            return
+        self._cabecera_escrita = True
+        self.registros = registros
+        self.n_registros = n
+        self.completado = completado
+
+    def iter_registros(self) -> Iterator[Dict[str, Any]]:
+        """Registros de intentos anteriores, leídos de disco de uno en uno."""
+        if not ACTIVO or not self.n_registros:
+            return
+        pendientes = self.n_registros  # lo anotado en este intento no se repite
+        with self.path.open("rb") as f:
+            next(f, None)  # cabecera
+            for raw in f:
+                if pendientes <= 0:
+                    break
+                rec = json.loads(raw)
+                if "completado" not in rec:
+                    pendientes -= 1
+                    yield rec
+
+    def _escribir(self, rec: Dict[str, Any]) -> None:
+        if not ACTIVO:
+            return
+        CHECKPOINTS_DIR.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            if not self._cabecera_escrita:
+                f.write(json.dumps({"clave": self.clave, "inicio": datetime.now().isoformat(timespec="seconds")}) + "\n")
+                self._cabecera_escrita = True
+            f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+
+    def anotar(self, registro: Dict[str, Any]) -> None:
+        """Registra una unidad de trabajo terminada (solo en disco: no se acumula en memoria)."""
+        self._escribir(registro)
+
+    def completar(self, resultado: Dict[str, Any]) -> None:
+        """Marca el paso como terminado (un reintento puede reutilizar su resultado)."""
+        self.completado = resultado
+        self._escribir({"completado": resultado})
+
+
+# =========================
+# API
+# =========================
+def abrir(grupo: str, paso: str, clave: Any, en_memoria: bool = True) -> Checkpoint:
+    return Checkpoint(grupo, paso, clave, en_memoria=en_memoria)
+
+
+def borrar_grupo(grupo: str) -> None:
+    if not CHECKPOINTS_DIR.exists():
+        return
+    for p in CHECKPOINTS_DIR.glob(f"{grupo}.*.jsonl"):
+        p.unlink(missing_ok=True)
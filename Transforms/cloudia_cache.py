@@ -0,0 +1,124 @@
+# cloudia_cache.py
+# Caché en disco de respuestas de Cloudia (ORDS) para re-ejecuciones y backfills.
+#
+# Cada respuesta 200 que merece guardarse va a cloudia_cache/<xx>/<sha256(url)>.json
+# con su ETag / Last-Modified. Al pedir la misma URL:
+#   - entrada inmutable (el llamante la marcó así, p.ej. líneas de un albarán
+#     cerrado) y el llamante la sigue considerando inmutable -> sin red;
+#   - entrada dentro del TTL de su endpoint -> sin red;
+#   - si no, se revalida con If-None-Match / If-Modified-Since: un 304 reutiliza
+#     el cuerpo guardado; un 200 lo sustituye.
+# Endpoints sin TTL ni validadores (p.ej. los listados por fecha) no se guardan.
+#
+# Si hay que forzar la descarga de algo ya marcado como inmutable, basta con
+# borrar la carpeta (o CLOUDIA_CACHE=0).
+#
+# Configuración por entorno:
+#   CLOUDIA_CACHE                 (0 = no usar la caché, por defecto 1)
+#   CLOUDIA_CACHE_TTL_CLIENTES_S  (TTL del listado de clientes, por defecto 14400)
+#   CLOUDIA_CACHE_TTL_LINEAS_S    (TTL de las líneas de albaranes abiertos, por defecto 0)
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import requests
+
+
+# =========================
+# CONFIG
+# =========================
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_DIR = BASE_DIR / "cloudia_cache"
+ACTIVA = os.getenv("CLOUDIA_CACHE", "1").strip().lower() not in ("0", "false", "no")
+
+# TTL por endpoint (primera regla que encaja); el resto, 0
+TTL_POR_ENDPOINT = [
+    (re.compile(r"/albaranes/\d+/linea_detalle"), int(os.getenv("CLOUDIA_CACHE_TTL_LINEAS_S", "0"))),
+    (re.compile(r"/clientes/\d+"), int(os.getenv("CLOUDIA_CACHE_TTL_CLIENTES_S", "14400"))),
+]
+
+
+# =========================
+# Helpers
+# =========================
+def _path(url: str) -> Path:
+    h = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return CACHE_DIR / h[:2] / f"{h}.json"
+
+
+def ttl_s(url: str) -> int:
+    for patron, ttl in TTL_POR_ENDPOINT:
+        if patron.search(url):
+            return ttl
+    return 0
+
+
+def _escribir(url: str, entrada: Dict[str, Any]) -> None:
+    path = _path(url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_text(json.dumps(entrada, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+
+
+# =========================
+# API
+# =========================
+def leer(url: str) -> Optional[Dict[str, Any]]:
+    if not ACTIVA:
+        return None
+    try:
+        entrada = json.loads(_path(url).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return entrada if entrada.get("url") == url else None
+
+
+def vigente(entrada: Dict[str, Any], inmutable: bool) -> bool:
+    """True si la entrada se puede servir sin preguntar al servidor."""
+    if inmutable and entrada.get("inmutable"):
+        return True
+    return time.time() - entrada.get("guardado", 0) < ttl_s(entrada["url"])
+
+
+def cabeceras_validacion(entrada: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    if not entrada:
+        return {}
+    h = {}
+    if entrada.get("etag"):
+        h["If-None-Match"] = entrada["etag"]
+    if entrada.get("last_modified"):
+        h["If-Modified-Since"] = entrada["last_modified"]
+    return h
+
+
+def guardar(url: str, resp: requests.Response, data: Any, inmutable: bool) -> None:
+    """Guarda una respuesta 200 si se podrá reutilizar (inmutable, con TTL o con validadores)."""
+    if not ACTIVA:
+        return
+    etag = resp.headers.get("ETag")
+    last_modified = resp.headers.get("Last-Modified")
+    if not (inmutable or ttl_s(url) > 0 or etag or last_modified):
+        return
+    _escribir(url, {
+        "url": url,
+        "guardado": time.time(),
+        "etag": etag,
+        "last_modified": last_modified,
+        "inmutable": bool(inmutable),
+        "data": data,
+    })
+
+
+def refrescar(entrada: Dict[str, Any], inmutable: bool) -> None:
+    """Tras un 304: la entrada sigue valiendo desde ahora."""
+    if not ACTIVA:
+        return
+    _escribir(entrada["url"], {**entrada, "guardado": time.time(), "inmutable": bool(inmutable or entrada.get("inmutable"))})
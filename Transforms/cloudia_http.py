@@ -0,0 +1,421 @@
+# cloudia_http.py
+# Cliente HTTP compartido para la API de Cloudia (ORDS).
+#
+# - Una Session con pool de conexiones dimensionado al máximo de peticiones en vuelo.
+# - Limitador de peticiones por host (token bucket).
+# - Backoff compartido: un 429/5xx/timeout pausa a todos los hilos, no solo al que falla.
+# - map_ordenado(): ejecuta descargas en paralelo y devuelve los resultados en el
+#   orden de entrada, para que la salida sea determinista; iter_ordenado() los va
+#   entregando en ese orden con una ventana acotada (la memoria no crece con el
+#   número de entradas).
+# - paginas(): iterador de páginas ORDS (offset) que descarga la siguiente página
+#   mientras se procesa la actual; paginado() lo usa para devolver la lista completa.
+# - Caché en disco de respuestas (cloudia_cache): get_json(inmutable=True) para
+#   documentos que ya no cambian; el resto según TTL / ETag del endpoint.
+#
+# Configuración por entorno:
+#   CLOUDIA_MAX_IN_FLIGHT  (peticiones simultáneas, por defecto 6)
+#   CLOUDIA_MAX_RPS        (peticiones por segundo y host, por defecto 8; 0 = sin límite)
+#   CLOUDIA_PAGE_SIZE      (filas por página pedidas con ?limit=, por defecto 25, el
+#                           tamaño por defecto de ORDS; si el handler no lo admite se
+#                           usa el "limit" que devuelva la respuesta)
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import cloudia_cache
+import pipeline_metrics
+
+
+# =========================
+# CONFIG
+# =========================
+MAX_IN_FLIGHT = int(os.getenv("CLOUDIA_MAX_IN_FLIGHT", "6"))
+MAX_RPS = float(os.getenv("CLOUDIA_MAX_RPS", "8"))
+PAGE_SIZE = int(os.getenv("CLOUDIA_PAGE_SIZE", "25"))
+ORDS_PAGE_SIZE = 25  # paginación por defecto de los handlers: no hace falta pedir ?limit=
+
+REQUEST_TIMEOUT = 180
+BACKOFF_START = 2.0
+BACKOFF_MAX = 60.0
+HEADERS = {"Content-Type": "application/json"}
+
+# Códigos que indican saturación del servidor: activan el backoff compartido
+STATUS_BACKOFF = {429, 500, 502, 503, 504}
+
+
+# =========================
+# Helpers
+# =========================
+def _retry_after_s(resp: requests.Response) -> Optional[float]:
+    raw = resp.headers.get("Retry-After")
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        return None
+
+
+def _contar_respuesta(resp: requests.Response, data: Any) -> None:
+    """Métricas del paso para una respuesta 200 de Cloudia."""
+    items = data.get("items") if isinstance(data, dict) else None
+    pipeline_metrics.sumar("api_paginas")
+    pipeline_metrics.sumar("api_filas", len(items) if isinstance(items, list) else 0)
+    pipeline_metrics.sumar("bytes_recibidos", len(resp.content))
+
+
+@dataclass
+class Pagina:
+    """Una página de un endpoint ORDS ya filtrada de repetidos."""
+    offset: int
+    items: List[Dict[str, Any]]  # solo los nuevos (sin repetidos por clave_id)
+    repetidos: int
+    fin: bool  # no hay más páginas detrás de esta
+    siguiente: int  # offset de la página siguiente (para reanudar)
+
+
+def url_pagina(base_url: str, offset: int, page_size: int = PAGE_SIZE) -> str:
+    params = {}
+    if offset:
+        params["offset"] = offset
+    if page_size != ORDS_PAGE_SIZE:
+        params["limit"] = page_size
+    return f"{base_url}?{urlencode(params)}" if params else base_url
+
+
+class _LimitadorHost:
+    """Token bucket por host: como mucho `rps` peticiones/segundo con ráfagas de `rps`."""
+
+    def __init__(self, rps: float):
+        self.rps = float(rps)
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, List[float]] = {}  # host -> [tokens, ultimo_ts]
+
+    def adquirir(self, host: str) -> None:
+        if self.rps <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, ts = self._buckets.get(host, [self.rps, now])
+                tokens = min(self.rps, tokens + (now - ts) * self.rps)
+                if tokens >= 1.0:
+                    self._buckets[host] = [tokens - 1.0, now]
+                    return
+                self._buckets[host] = [tokens, now]
+                espera = (1.0 - tokens) / self.rps
+            time.sleep(espera)
+
+
+class _BackoffCompartido:
+    """
+    Pausa común a todos los hilos. El primer fallo abre una ventana de espera;
+    los fallos que llegan durante esa ventana no la alargan (ya estaban en vuelo).
+    Un éxito fuera de la ventana devuelve la espera al valor inicial.
+    """
+
+    def __init__(self, start: float, maximo: float):
+        self.start = start
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._sleep = start
+        self._hasta = 0.0
+
+    def esperar(self) -> None:
+        while True:
+            with self._lock:
+                restante = self._hasta - time.monotonic()
+            if restante <= 0:
+                return
+            time.sleep(restante)
+
+    def fallo(self, retry_after: Optional[float] = None) -> float:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._hasta:
+                return self._hasta - now
+            espera = retry_after if retry_after is not None else self._sleep
+            espera = min(self.maximo, max(espera, 0.0))
+            self._sleep = min(self.maximo, self._sleep * 1.5)
+            self._hasta = now + espera
+            return espera
+
+    def exito(self) -> None:
+        with self._lock:
+            if time.monotonic() >= self._hasta:
+                self._sleep = self.start
+
+
+# =========================
+# Cliente
+# =========================
+class CloudiaClient:
+    """Cliente con pool de conexiones, límite por host y backoff compartido. Seguro entre hilos."""
+
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_rps: float = MAX_RPS,
+        timeout: float = REQUEST_TIMEOUT,
+        backoff_start: float = BACKOFF_START,
+        backoff_max: float = BACKOFF_MAX,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.timeout = timeout
+        self.headers = dict(headers or HEADERS)
+        self.backoff_start = backoff_start
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._limitador = _LimitadorHost(max_rps)
+        self._backoff = _BackoffCompartido(backoff_start, backoff_max)
+        self._en_vuelo = threading.BoundedSemaphore(self.max_in_flight)
+
+    def __enter__(self) -> "CloudiaClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def get_json(self, url: str, *, inmutable: bool = False) -> Dict[str, Any]:
+        """
+        GET con reintentos hasta obtener un 200 con JSON válido (misma semántica que fetch_json_until_ok).
+        Pasa antes por la caché en disco; inmutable=True indica que la respuesta ya no puede
+        cambiar (p.ej. líneas de un albarán cerrado) y, una vez guardada, no se vuelve a pedir.
+        """
+        cacheada = cloudia_cache.leer(url)
+        if cacheada is not None and cloudia_cache.vigente(cacheada, inmutable):
+            pipeline_metrics.sumar("cache_hits")
+            return cacheada["data"]
+        headers = {**self.headers, **cloudia_cache.cabeceras_validacion(cacheada)}
+
+        host = urlsplit(url).netloc
+        attempt = 0
+        sleep_local = self.backoff_start
+
+        while True:
+            attempt += 1
+            self._backoff.esperar()
+            self._limitador.adquirir(host)
+
+            compartido = False
+            retry_after = None
+            try:
+                with self._en_vuelo:
+                    resp = self.session.get(url, headers=headers, timeout=self.timeout)
+                if resp.status_code == 304 and cacheada is not None:
+                    self._backoff.exito()
+                    cloudia_cache.refrescar(cacheada, inmutable)
+                    pipeline_metrics.sumar("cache_304")
+                    return cacheada["data"]
+                if resp.status_code == 200:
+                    try:
+                        data = resp.json()
+                        self._backoff.exito()
+                        _contar_respuesta(resp, data)
+                        cloudia_cache.guardar(url, resp, data, inmutable)
+                        return data
+                    except Exception as e:
+                        print(f"   [WARN] JSON invalido (intento {attempt}) -> {e}")
+                else:
+                    print(f"   [WARN] HTTP {resp.status_code} (intento {attempt}) -> {url}")
+                    if resp.status_code in STATUS_BACKOFF:
+                        compartido = True
+                        retry_after = _retry_after_s(resp)
+
+            except requests.exceptions.Timeout:
+                print(f"   [WARN] Timeout ({self.timeout}s) (intento {attempt}) -> {url}")
+                compartido = True
+            except requests.exceptions.ConnectionError as e:
+                print(f"   [WARN] Error de conexion (intento {attempt}) -> {e}")
+                compartido = True
+            except Exception as e:
+                print(f"   [WARN] Error (intento {attempt}) -> {e}")
+
+            pipeline_metrics.sumar("http_reintentos")
+            if compartido:
+                espera = self._backoff.fallo(retry_after)
+                print(f"   [INFO] Backoff compartido: reintentando en {espera:.0f}s...")
+                self._backoff.esperar()
+            else:
+                print(f"   [INFO] Reintentando en {sleep_local:.0f}s...")
+                time.sleep(sleep_local)
+                sleep_local = min(self.backoff_max, sleep_local * 1.5)
+
+    def paginas(
+        self,
+        base_url: str,
+        *,
+        clave_id: Optional[str] = None,
+        clave: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        page_size: int = PAGE_SIZE,
+        offset: int = 0,
+        stop_if_zero_new: bool = True,
+        vistos: Optional[Set[str]] = None,
+        prefetch: bool = True,
+        inmutable: bool = False,
+    ) -> Iterator[Pagina]:
+        """
+        Páginas de un endpoint ORDS paginado por offset, sin repetidos por clave_id
+        (o por clave(item)). Corta en página vacía, hasMore=False, página incompleta
+        o (si stop_if_zero_new) página sin ids nuevos.
+
+        Con prefetch, la petición de la página siguiente sale en cuanto se sabe que
+        hay más, mientras el consumidor procesa la actual. offset/vistos permiten
+        reanudar una descarga a medias. inmutable se pasa a get_json (caché).
+        """
+        seen = vistos if vistos is not None else set()
+        if clave is None and clave_id is not None:
+            clave = lambda it: it.get(clave_id)  # noqa: E731
+
+        pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cloudia-pag") if prefetch else None
+        pendiente = None
+        try:
+            while True:
+                url = url_pagina(base_url, offset, page_size)
+                data = pendiente.result() if pendiente is not None else self.get_json(url, inmutable=inmutable)
+                pendiente = None
+
+                items = data.get("items") or []
+                # El handler puede no admitir ?limit=: manda el tamaño que devuelva
+                limite = data.get("limit") if isinstance(data.get("limit"), int) and data.get("limit") > 0 else page_size
+
+                nuevos: List[Dict[str, Any]] = []
+                repetidos = 0
+                for it in items:
+                    if not isinstance(it, dict):
+                        continue
+                    key = clave(it) if clave is not None else None
+                    if key is not None:
+                        key = str(key)
+                        if key in seen:
+                            repetidos += 1
+                            continue
+                        seen.add(key)
+                    nuevos.append(it)
+
+                fin = (
+                    not items
+                    or (stop_if_zero_new and not nuevos)
+                    or data.get("hasMore") is False
+                    or len(items) < limite
+                )
+                if items and stop_if_zero_new and not nuevos:
+                    print(f"[WARN] Pagina sin nuevos IDs -> parece repeticion/bucle. Corto: {base_url}")
+
+                siguiente = offset + limite
+                if not fin and pool is not None:
+                    pendiente = pool.submit(self.get_json, url_pagina(base_url, siguiente, page_size), inmutable=inmutable)
+
+                yield Pagina(offset=offset, items=nuevos, repetidos=repetidos, fin=fin, siguiente=siguiente)
+                if fin:
+                    return
+                offset = siguiente
+        finally:
+            # Si el consumidor corta antes, no se espera a la página adelantada
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def paginado(
+        self,
+        base_url: str,
+        *,
+        clave_id: str,
+        page_size: int = PAGE_SIZE,
+        stop_if_zero_new: bool = True,
+        inmutable: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Todos los items de un endpoint ORDS paginado (ver paginas()), en una lista."""
+        out: List[Dict[str, Any]] = []
+        # Sin prefetch: se usa desde map_ordenado, que ya reparte las descargas en hilos
+        for pagina in self.paginas(
+            base_url,
+            clave_id=clave_id,
+            page_size=page_size,
+            stop_if_zero_new=stop_if_zero_new,
+            prefetch=False,
+            inmutable=inmutable,
+        ):
+            out.extend(pagina.items)
+        return out
+
+    def map_ordenado(
+        self,
+        fn: Callable[[Any], Any],
+        entradas: Sequence[Any],
+        *,
+        al_terminar: Optional[Callable[[int, Any, Any], None]] = None,
+    ) -> List[Any]:
+        """
+        Aplica fn a cada entrada con hasta max_in_flight hilos y devuelve los
+        resultados en el orden de `entradas`. al_terminar(n_hechas, entrada, resultado)
+        se llama en el hilo principal según van acabando (orden no determinista).
+        Si alguna falla, se cancelan las pendientes y se relanza la excepción.
+        """
+        resultados: List[Any] = [None] * len(entradas)
+        if not entradas:
+            return resultados
+
+        pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="cloudia")
+        try:
+            futuros = {pool.submit(fn, e): i for i, e in enumerate(entradas)}
+            for hechas, fut in enumerate(as_completed(futuros), start=1):
+                i = futuros[fut]
+                resultados[i] = fut.result()
+                if al_terminar is not None:
+                    al_terminar(hechas, entradas[i], resultados[i])
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
+        return resultados
+
+    def iter_ordenado(
+        self,
+        fn: Callable[[Any], Any],
+        entradas: Iterable[Any],
+        *,
+        ventana: Optional[int] = None,
+    ) -> Iterator[Tuple[Any, Any]]:
+        """
+        Como map_ordenado, pero entrega (entrada, resultado) en el orden de
+        `entradas` según van estando listos, con como mucho `ventana` entradas
+        lanzadas sin entregar (por defecto 4 * max_in_flight). El consumidor
+        puede escribir cada resultado y soltarlo antes de que llegue el siguiente.
+        Si alguna falla (o se deja de consumir), se cancelan las pendientes.
+        """
+        ventana = max(1, int(ventana or 4 * self.max_in_flight))
+        pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="cloudia")
+        pendientes: deque = deque()
+        resto = iter(entradas)
+        try:
+            while True:
+                for e in resto:
+                    pendientes.append((e, pool.submit(fn, e)))
+                    if len(pendientes) >= ventana:
+                        break
+                if not pendientes:
+                    break
+                e, fut = pendientes.popleft()
+                yield e, fut.result()
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
@@ -0,0 +1,225 @@
+# comprobar_reanudacion.py
+# Comprobación manual de la reanudación de los pasos from-date contra un Cloudia
+# y un PostgREST falsos locales (no toca la API real, ni Supabase, ni el staging /
+# histórico / checkpoints / ids_cargados de Transforms).
+#
+# Para cada export (cabecera, líneas):
+#   1) lo corta a mitad (como si el proceso muriera tras anotar N unidades);
+#   2) lo vuelve a lanzar y comprueba que solo se piden las páginas / albaranes
+#      que faltaban y que el staging final tiene las mismas filas que una pasada
+#      sin cortes.
+# Y para la carga de líneas (ids_cargados): hace fallar un lote a mitad y
+# comprueba que al reintentar solo se envían las filas de los lotes no aceptados.
+#
+# Uso: python comprobar_reanudacion.py [--albaranes 120] [--corte 2]
+# Sale con código 1 si alguna comprobación falla.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+
+# =========================
+# Cloudia / PostgREST falsos
+# =========================
+class _Cloudia(BaseHTTPRequestHandler):
+    albaranes = 0
+    lineas_por_albaran = 3
+    peticiones: Counter = Counter()
+    # PostgREST: el POST número fallar_post responde 400 (0 = nunca)
+    fallar_post = 0
+    posts = 0
+    lineas_recibidas: Counter = Counter()
+    _lock = threading.Lock()
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _json(self, data) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        qs = parse_qs(url.query)
+        offset = int(qs.get("offset", ["0"])[0])
+        limit = int(qs.get("limit", ["25"])[0])
+        partes = url.path.strip("/").split("/")
+        if "linea_detalle" in partes:
+            aid = int(partes[-2])
+            _Cloudia.peticiones[f"linea:{aid}"] += 1
+            items = [
+                {"linea_id": aid * 100 + i, "albaran_id": aid, "cantidad": i + 1, "precio": 1.5, "subtotal": 1.5 * (i + 1)}
+                for i in range(self.lineas_por_albaran)
+            ]
+            return self._json({"items": items, "hasMore": False, "limit": limit})
+        _Cloudia.peticiones[f"cabecera:{offset}"] += 1
+        ids = range(offset + 1, min(offset + limit, self.albaranes) + 1)
+        items = [
+            {"albaran_id": i, "numero": i, "fecha_albaran": f"2024-01-{1 + i % 28:02d}T00:00:00Z", "estado": "Facturado", "total_general": i * 10.0}
+            for i in ids
+        ]
+        return self._json({"items": items, "hasMore": offset + limit < self.albaranes, "limit": limit})
+
+    def do_POST(self) -> None:
+        filas = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"[]")
+        with _Cloudia._lock:
+            _Cloudia.posts += 1
+            falla = _Cloudia.posts == _Cloudia.fallar_post
+            if not falla:
+                _Cloudia.lineas_recibidas.update(str(r.get("linea_id")) for r in filas)
+        self.send_response(400 if falla else 201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class _Corte(Exception):
+    """El proceso 'muere' después de anotar N unidades en el checkpoint."""
+
+
+def _cortar_tras(checkpoints_mod, n: int):
+    original = checkpoints_mod.Checkpoint.anotar
+    cuenta = {"n": 0}
+
+    def anotar(self, registro):
+        original(self, registro)
+        cuenta["n"] += 1
+        if cuenta["n"] >= n:
+            raise _Corte(f"corte tras {n} unidades")
+
+    checkpoints_mod.Checkpoint.anotar = anotar
+    return lambda: setattr(checkpoints_mod.Checkpoint, "anotar", original)
+
+
+def _filas(path) -> int:
+    import pyarrow.parquet as pq
+
+    return pq.ParquetFile(path).metadata.num_rows
+
+
+def _comprobar(fallos, ok: bool, texto: str) -> None:
+    print(f"[{'OK' if ok else 'WARN'}] {texto}")
+    if not ok:
+        fallos.append(texto)
+
+
+# =========================
+# Main
+# =========================
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--albaranes", type=int, default=120)
+    parser.add_argument("--corte", type=int, default=2, help="unidades anotadas antes de cortar")
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _Cloudia)
+    _Cloudia.albaranes = args.albaranes
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    tmp = Path(tempfile.mkdtemp(prefix="reanudacion_"))
+    # Antes de importar: los módulos leen su configuración al cargarse
+    os.environ.update({
+        "CLOUDIA_BASE_URL": f"http://127.0.0.1:{servidor.server_port}",
+        "CLOUDIA_CACHE": "0",
+        "CLOUDIA_MAX_RPS": "0",
+        "CLOUDIA_PAGE_SIZE": "25",
+        "CHECKPOINTS": "1",
+        "TRANSFORMS_RENDER_XLSX": "0",
+        "HISTORICO_DB": str(tmp / "historico.sqlite"),
+        "URL_SUPABASE": f"http://127.0.0.1:{servidor.server_port}",
+        "SUPABASE_KEY": "falsa",
+        "IDS_CARGADOS_CACHE": "1",
+        "SUPA_UPLOAD_MAX_IN_FLIGHT": "1",  # lotes en serie: el que falla es siempre el 3º
+    })
+    import checkpoints
+    import historico
+    import ids_cargados
+    import staging
+    import watermarks
+    import export_albaran_cabecera_from_date_api_to_xlsx as cab
+    import export_albaran_linea_detalle_from_cabecera_from_date_xlsx as lin
+    import load_albaran_linea_from_date_xlsx_to_supabase as carga
+
+    checkpoints.CHECKPOINTS_DIR = tmp / "checkpoints"
+    historico.BASE_DIR = staging.BASE_DIR = cab.BASE_DIR = lin.BASE_DIR = tmp  # sin sembrar con los GLOBAL.xlsx
+    staging.STAGING_DIR = tmp / "staging"
+    watermarks.WATERMARKS_FILE = tmp / "pipeline_watermarks.json"
+    ids_cargados.CACHE_DIR = tmp / "ids_cargados"
+    carga.BATCH_SIZE = 100
+
+    fallos = []
+    paginas = -(-args.albaranes // 25)
+    print(f"[INFO] Cloudia falso en {os.environ['CLOUDIA_BASE_URL']} | albaranes: {args.albaranes} | paginas: {paginas} | tmp: {tmp}")
+
+    # 1) Cabecera: una unidad = una página
+    restaurar = _cortar_tras(checkpoints, args.corte)
+    try:
+        cab.export_to_xlsx(cab.START_DATE_STR)
+        _comprobar(fallos, False, "cabecera: el corte no se produjo")
+    except _Corte as e:
+        print(f"[INFO] cabecera: {e}")
+    finally:
+        restaurar()
+    _Cloudia.peticiones.clear()
+    path = cab.export_to_xlsx(cab.START_DATE_STR)
+    pedidas = sorted(int(k.split(":")[1]) for k in _Cloudia.peticiones if k.startswith("cabecera:"))
+    _comprobar(fallos, bool(pedidas) and pedidas[0] == args.corte * 25, f"cabecera: la reanudacion empieza en offset={pedidas[:1]} (esperado {args.corte * 25})")
+    _comprobar(fallos, _filas(path) == args.albaranes, f"cabecera: staging con {_filas(path)} filas (esperado {args.albaranes})")
+
+    # 2) Líneas: una unidad = un albarán
+    restaurar = _cortar_tras(checkpoints, args.corte)
+    try:
+        lin.export_lineas_to_xlsx()
+        _comprobar(fallos, False, "lineas: el corte no se produjo")
+    except _Corte as e:
+        print(f"[INFO] lineas: {e}")
+    finally:
+        restaurar()
+    _Cloudia.peticiones.clear()
+    path = lin.export_lineas_to_xlsx()
+    pedidos = sum(1 for k in _Cloudia.peticiones if k.startswith("linea:"))
+    esperadas = args.albaranes * _Cloudia.lineas_por_albaran
+    _comprobar(fallos, pedidos == args.albaranes - args.corte, f"lineas: {pedidos} albaranes pedidos al reanudar (esperado {args.albaranes - args.corte})")
+    _comprobar(fallos, _filas(path) == esperadas, f"lineas: staging con {_filas(path)} filas (esperado {esperadas})")
+
+    # 3) Carga de líneas: falla el 3er lote; los aceptados quedan en ids_cargados
+    _Cloudia.fallar_post = 3
+    try:
+        carga.run()
+        _comprobar(fallos, False, "carga: el fallo no se produjo")
+    except RuntimeError as e:
+        print(f"[INFO] carga: {e}")
+    apuntadas_ids = ids_cargados.leer(carga.TABLE)
+    apuntadas = len(apuntadas_ids)
+    _comprobar(
+        fallos,
+        apuntadas > 0 and apuntadas_ids == set(_Cloudia.lineas_recibidas),
+        f"carga: {apuntadas} lineas en ids_cargados tras el fallo (aceptadas por la BD: {len(_Cloudia.lineas_recibidas)})",
+    )
+    _Cloudia.fallar_post = 0
+    _Cloudia.lineas_recibidas.clear()
+    carga.run()
+    reenviadas = sum(_Cloudia.lineas_recibidas.values())
+    _comprobar(fallos, reenviadas == esperadas - apuntadas, f"carga: {reenviadas} lineas enviadas al reintentar (esperado {esperadas - apuntadas})")
+    _comprobar(fallos, len(ids_cargados.leer(carga.TABLE)) == esperadas, f"carga: {len(ids_cargados.leer(carga.TABLE))} lineas en ids_cargados (esperado {esperadas})")
+
+    servidor.shutdown()
+    if fallos:
+        print(f"[WARN] {len(fallos)} comprobaciones fallidas")
+        return 1
+    print("[OK] Reanudacion comprobada")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
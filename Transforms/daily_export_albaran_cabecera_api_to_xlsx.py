@@ -1,13 +1,15 @@
 # daily_export_albaran_cabecera_api_to_xlsx.py
-import time
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional
 from pathlib import Path
 from datetime import datetime, timedelta, date
 from zoneinfo import ZoneInfo
 
 import pandas as pd
-import requests
 from api_env import get_cloudia_base_url
+from cloudia_http import CloudiaClient, PAGE_SIZE
+import historico
+import staging
+import watermarks
 
 
 # =========================
@@ -22,12 +24,6 @@ LAST_RUN_FILE = Path(__file__).resolve().parent / "pipeline_last_run.txt"
 
 TZ = ZoneInfo("Europe/Madrid")
 
-PAGE_SIZE = 25
-
-REQUEST_TIMEOUT = 180
-BACKOFF_START = 2.0
-BACKOFF_MAX = 60.0
-HEADERS = {"Content-Type": "application/json"}
 STOP_IF_ZERO_NEW = True  # corta si la API repite páginas
 
 
@@ -37,10 +33,9 @@ STOP_IF_ZERO_NEW = True  # corta si la API repite páginas
 BASE_DIR = Path(__file__).resolve().parent
 
 SHEET_NAME = "ALBARAN_CABECERA"
-GLOBAL_SHEET_NAME = SHEET_NAME
 
 OUTPUT_DAILY_XLSX = BASE_DIR / "ALBARANES_CABECERA_DAILY_DEL_DIA.xlsx"
-OUTPUT_GLOBAL_XLSX = BASE_DIR / "ALBARANES_CABECERA_GLOBAL.xlsx"
+STAGING_MODO = "daily"  # staging/albaran/fecha=<hoy>/daily.parquet (el .xlsx es solo render)
 
 
 # =========================
@@ -48,6 +43,12 @@ OUTPUT_GLOBAL_XLSX = BASE_DIR / "ALBARANES_CABECERA_GLOBAL.xlsx"
 # =========================
 def calc_fecha_desde_str() -> str:
     today = datetime.now(TZ).date()
+    # 1) Marca de agua: ultima fecha_albaran cargada (menos el solape).
+    #    Nunca despues de ayer, por si hay albaranes con fecha futura.
+    desde_wm = watermarks.fecha_desde("albaran")
+    if desde_wm is not None:
+        return min(desde_wm, today - timedelta(days=1)).strftime("%d-%m-%Y")
+    # 2) Sin marca (primera ejecucion incremental): ultimo run - 1 dia
     if LAST_RUN_FILE.exists():
         try:
             raw = LAST_RUN_FILE.read_text(encoding="utf-8").strip()
@@ -71,32 +72,6 @@ def iso_passthrough(v: Any) -> Optional[str]:
     return s or None
 
 
-def fetch_json_until_ok(session: requests.Session, url: str) -> Dict[str, Any]:
-    attempt = 0
-    sleep_s = BACKOFF_START
-
-    while True:
-        attempt += 1
-        try:
-            resp = session.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
-            if resp.status_code != 200:
-                print(f"   [WARN] HTTP {resp.status_code} (intento {attempt}) -> {url}")
-            else:
-                try:
-                    return resp.json()
-                except Exception as e:
-                    print(f"   [WARN] JSON invalido (intento {attempt}) -> {e}")
-
-        except requests.exceptions.Timeout:
-            print(f"   [WARN] Timeout ({REQUEST_TIMEOUT}s) (intento {attempt}) -> {url}")
-        except Exception as e:
-            print(f"   [WARN] Error (intento {attempt}) -> {e}")
-
-        print(f"   [INFO] Reintentando en {sleep_s:.0f}s...")
-        time.sleep(sleep_s)
-        sleep_s = min(BACKOFF_MAX, sleep_s * 1.5)
-
-
 def map_item_to_excel_row(it: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "ALBARAN_ID": it.get("albaran_id"),
@@ -143,49 +118,32 @@ def map_item_to_excel_row(it: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def _read_excel_if_exists(path: Path, sheet: str) -> Optional[pd.DataFrame]:
-    if not path.exists():
-        return None
-    df = pd.read_excel(path, sheet_name=sheet, dtype=object).dropna(how="all")
-    df.columns = [str(c).strip() for c in df.columns]
-    return df
-
-
-def merge_into_global(df_in: pd.DataFrame, excel_cols: List[str]) -> None:
-    df_global = _read_excel_if_exists(OUTPUT_GLOBAL_XLSX, GLOBAL_SHEET_NAME)
-    if df_global is None:
-        df_global = pd.DataFrame(columns=excel_cols)
-    else:
-        for c in excel_cols:
-            if c not in df_global.columns:
-                df_global[c] = None
-        df_global = df_global[excel_cols]
-
-    if df_global.empty:
-        df_all = df_in.copy()
-    else:
-        df_all = pd.concat([df_global, df_in], ignore_index=True)
-
-    if "ALBARAN_ID" in df_all.columns:
-        df_all = df_all.drop_duplicates(subset=["ALBARAN_ID"], keep="last")
-
-    sort_cols = [c for c in ["FECHA_ALBARAN", "ALBARAN_ID"] if c in df_all.columns]
-    if sort_cols:
-        df_all = df_all.sort_values(by=sort_cols, kind="stable")
+def volcar_al_global(path: Path, excel_cols: List[str]) -> Dict[str, Any]:
+    """
+    Upsert del Parquet de staging en el histórico, por lotes (sin cargarlo entero).
+    Devuelve {filas, fecha, max_id}: la mayor FECHA_ALBARAN / ALBARAN_ID vistas.
+    """
+    marca: Dict[str, Any] = {"filas": 0, "fecha": None, "max_id": None}
 
-    tmp = OUTPUT_GLOBAL_XLSX.with_suffix(".tmp.xlsx")
-    with pd.ExcelWriter(tmp, engine="openpyxl") as writer:
-        df_all.to_excel(writer, index=False, sheet_name=GLOBAL_SHEET_NAME)
-    tmp.replace(OUTPUT_GLOBAL_XLSX)
+    def lotes():
+        for df in staging.iter_lotes(path):
+            df = df.reindex(columns=excel_cols)
+            fechas = [f for f in df["FECHA_ALBARAN"].map(watermarks.fecha_iso).tolist() if f]
+            ids = pd.to_numeric(df["ALBARAN_ID"], errors="coerce").dropna()
+            if fechas:
+                marca["fecha"] = max(fechas + ([marca["fecha"]] if marca["fecha"] else []))
+            if not ids.empty:
+                marca["max_id"] = max(int(ids.max()), marca["max_id"] or 0)
+            marca["filas"] += len(df)
+            yield df
 
-    print(f"[OK] GLOBAL actualizado: {OUTPUT_GLOBAL_XLSX.name} | filas: {len(df_all)} | hoja: {GLOBAL_SHEET_NAME}")
+    historico.upsert_lotes("albaran", lotes(), excel_cols)
+    return marca
 
 
 def export_to_xlsx() -> str:
-    session = requests.Session()
-
     # 0) Volcar DAILY anterior al GLOBAL antes de sobrescribir
-    df_prev_daily = _read_excel_if_exists(OUTPUT_DAILY_XLSX, SHEET_NAME)
+    prev_staging = staging.ultimo_path("albaran", STAGING_MODO)
 
     excel_cols = [
         "ALBARAN_ID","TIPO_DOCUMENTO","NUMERO","SERIE","ID_EMPRESA","ID_TERCERO","ID_TIPO_TERCERO",
@@ -196,13 +154,10 @@ def export_to_xlsx() -> str:
         "OBSERVACIONES","OBSERVACIONES_FACTURA","RESUMEN_FACTURACION","CREADO_POR","ACTUALIZADO_POR"
     ]
 
-    if df_prev_daily is not None and not df_prev_daily.empty:
-        print(f"[INFO] Volcando DAILY anterior al GLOBAL: {OUTPUT_DAILY_XLSX.name} ({len(df_prev_daily)} filas)")
-        for c in excel_cols:
-            if c not in df_prev_daily.columns:
-                df_prev_daily[c] = None
-        df_prev_daily = df_prev_daily[excel_cols]
-        merge_into_global(df_prev_daily, excel_cols)
+    if prev_staging is not None and not watermarks.daily_ya_volcado("albaran", prev_staging):
+        print(f"[INFO] Volcando staging anterior al GLOBAL: {prev_staging.relative_to(BASE_DIR)}")
+        volcar_al_global(prev_staging, excel_cols)
+        watermarks.marcar_daily_volcado("albaran", prev_staging)
 
     # 1) Construir URL con FECHA_DESDE automática
     fecha_desde = calc_fecha_desde_str()
@@ -212,80 +167,44 @@ def export_to_xlsx() -> str:
     print(f"[INFO] FECHA_DESDE usada: {fecha_desde}")
     print(f"[INFO] ENDPOINT: {base_url}")
 
-    rows: List[Dict[str, Any]] = []
-    seen_ids: Set[str] = set()
-
-    offset = 0
+    # 2) Descargar paginado directo a staging (por trozos; la página siguiente se
+    #    descarga mientras se procesa la actual)
     total_nuevos = 0
+    with CloudiaClient() as client, staging.Escritor("albaran", STAGING_MODO, excel_cols) as esc:
+        for pagina in client.paginas(
+            base_url,
+            clave_id="albaran_id",
+            page_size=PAGE_SIZE,
+            stop_if_zero_new=STOP_IF_ZERO_NEW,
+        ):
+            esc.anadir([map_item_to_excel_row(it) for it in pagina.items])
+            total_nuevos += len(pagina.items)
+            print(
+                f"[INFO] offset={pagina.offset} | Nuevos en esta pagina: {len(pagina.items)} "
+                f"| Repetidos: {pagina.repetidos} | Total nuevos: {total_nuevos}"
+            )
 
-    while True:
-        url = base_url if offset == 0 else f"{base_url}?offset={offset}"
-        print(f"[INFO] Descargando offset={offset} ...")
-
-        data = fetch_json_until_ok(session, url)
-
-        items = data.get("items") or []
-        if not items:
-            print("[INFO] Fin real: items vacio.")
-            break
-
-        nuevos_en_pagina = 0
-        repetidos_en_pagina = 0
-
-        for it in items:
-            if not isinstance(it, dict):
-                continue
-
-            aid = it.get("albaran_id")
-            aid_key = str(aid) if aid is not None else None
-
-            row = map_item_to_excel_row(it)
-
-            if aid_key is None:
-                rows.append(row)
-                nuevos_en_pagina += 1
-                continue
-
-            if aid_key in seen_ids:
-                repetidos_en_pagina += 1
-                continue
-
-            seen_ids.add(aid_key)
-            rows.append(row)
-            nuevos_en_pagina += 1
-
-        total_nuevos += nuevos_en_pagina
-        print(
-            f"[INFO] Nuevos en esta pagina: {nuevos_en_pagina} | Repetidos: {repetidos_en_pagina} | Total nuevos: {total_nuevos}"
-        )
-
-        if STOP_IF_ZERO_NEW and nuevos_en_pagina == 0:
-            print("[WARN] Pagina sin nuevos IDs -> parece repeticion/bucle. Corto.")
-            break
-
-        has_more = data.get("hasMore")
-        if has_more is False or len(items) < PAGE_SIZE:
-            print("[INFO] Ultima pagina.")
-            break
-
-        offset += PAGE_SIZE
+        if total_nuevos == 0:
+            raise RuntimeError("No se descargo ningun item. Revisa el endpoint o conectividad.")
 
-    if not rows:
-        raise RuntimeError("No se descargo ningun item. Revisa el endpoint o conectividad.")
+    staging_path = esc.path
 
-    df = pd.DataFrame(rows, columns=excel_cols)
+    # 3) Render DAILY (sobrescribe; se omite si es demasiado grande)
+    staging.render_xlsx_parquet(staging_path, OUTPUT_DAILY_XLSX, SHEET_NAME)
 
-    # 2) Guardar DAILY (sobrescribe)
-    with pd.ExcelWriter(OUTPUT_DAILY_XLSX, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name=SHEET_NAME)
+    # 4) Volcar DAILY nuevo al GLOBAL, por lotes, y proponer la marca (la confirma el loader)
+    marca = volcar_al_global(staging_path, excel_cols)
+    print(f"[OK] DAILY generado | filas: {marca['filas']}")
+    watermarks.proponer("albaran", fecha=marca["fecha"], max_id=marca["max_id"])
+    watermarks.marcar_daily_volcado("albaran", staging_path)
 
-    print(f"[OK] DAILY generado: {OUTPUT_DAILY_XLSX.name} | filas: {len(df)} | hoja: {SHEET_NAME}")
+    return str(staging_path)
 
-    # 3) Volcar DAILY nuevo al GLOBAL
-    merge_into_global(df, excel_cols)
 
-    return str(OUTPUT_DAILY_XLSX)
+def run() -> str:
+    """Punto de entrada del paso (pipeline_runner, modo worker)."""
+    return export_to_xlsx()
 
 
 if __name__ == "__main__":
-    export_to_xlsx()
+    run()
@@ -1,4 +1,3 @@
-import time
 from typing import Any, Dict, List, Optional, Set
 from pathlib import Path
 from datetime import datetime, timedelta, date
@@ -6,8 +5,12 @@ from zoneinfo import ZoneInfo
 import argparse
 
 import pandas as pd
-import requests
 from api_env import get_cloudia_base_url
+from cloudia_http import CloudiaClient, PAGE_SIZE
+import historico
+import staging
+import watermarks
+import checkpoints
 
 
 # =========================
@@ -21,12 +24,6 @@ START_DATE_STR = "01-10-2023"  # <- cambia esto cuando quieras
 
 TZ = ZoneInfo("Europe/Madrid")
 
-PAGE_SIZE = 25
-
-REQUEST_TIMEOUT = 180
-BACKOFF_START = 2.0
-BACKOFF_MAX = 60.0
-HEADERS = {"Content-Type": "application/json"}
 STOP_IF_ZERO_NEW = True  # corta si la API repite páginas
 
 
@@ -36,11 +33,10 @@ STOP_IF_ZERO_NEW = True  # corta si la API repite páginas
 BASE_DIR = Path(__file__).resolve().parent
 
 SHEET_NAME = "ALBARAN_CABECERA"
-GLOBAL_SHEET_NAME = SHEET_NAME
 
 # Puedes cambiar nombres para distinguirlos
 OUTPUT_DAILY_XLSX = BASE_DIR / "ALBARANES_CABECERA_FROM_DATE.xlsx"
-OUTPUT_GLOBAL_XLSX = BASE_DIR / "ALBARANES_CABECERA_GLOBAL.xlsx"
+STAGING_MODO = "from_date"  # staging/albaran/fecha=<hoy>/from_date.parquet (el .xlsx es solo render)
 
 
 # =========================
@@ -53,32 +49,6 @@ def iso_passthrough(v: Any) -> Optional[str]:
     return s or None
 
 
-def fetch_json_until_ok(session: requests.Session, url: str) -> Dict[str, Any]:
-    attempt = 0
-    sleep_s = BACKOFF_START
-
-    while True:
-        attempt += 1
-        try:
-            resp = session.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
-            if resp.status_code != 200:
-                print(f"   [WARN] HTTP {resp.status_code} (intento {attempt}) -> {url}")
-            else:
-                try:
-                    return resp.json()
-                except Exception as e:
-                    print(f"   [WARN] JSON invalido (intento {attempt}) -> {e}")
-
-        except requests.exceptions.Timeout:
-            print(f"   [WARN] Timeout ({REQUEST_TIMEOUT}s) (intento {attempt}) -> {url}")
-        except Exception as e:
-            print(f"   [WARN] Error (intento {attempt}) -> {e}")
-
-        print(f"   [INFO] Reintentando en {sleep_s:.0f}s...")
-        time.sleep(sleep_s)
-        sleep_s = min(BACKOFF_MAX, sleep_s * 1.5)
-
-
 def map_item_to_excel_row(it: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "ALBARAN_ID": it.get("albaran_id"),
@@ -125,55 +95,47 @@ def map_item_to_excel_row(it: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def _read_excel_if_exists(path: Path, sheet: str) -> Optional[pd.DataFrame]:
-    if not path.exists():
-        return None
-    df = pd.read_excel(path, sheet_name=sheet, dtype=object).dropna(how="all")
-    df.columns = [str(c).strip() for c in df.columns]
-    return df
-
-
-def merge_into_global(df_in: pd.DataFrame, excel_cols: List[str]) -> None:
-    df_global = _read_excel_if_exists(OUTPUT_GLOBAL_XLSX, GLOBAL_SHEET_NAME)
-    if df_global is None:
-        df_global = pd.DataFrame(columns=excel_cols)
-    else:
-        for c in excel_cols:
-            if c not in df_global.columns:
-                df_global[c] = None
-        df_global = df_global[excel_cols]
+def volcar_al_global(path: Path, excel_cols: List[str]) -> Dict[str, Any]:
+    """
+    Upsert del Parquet de staging en el histórico, por lotes (sin cargarlo entero).
+    Devuelve {filas, fecha, max_id}: la mayor FECHA_ALBARAN / ALBARAN_ID vistas.
+    """
+    marca: Dict[str, Any] = {"filas": 0, "fecha": None, "max_id": None}
 
-    if df_global.empty:
-        df_all = df_in.copy()
-    else:
-        df_all = pd.concat([df_global, df_in], ignore_index=True)
+    def lotes():
+        for df in staging.iter_lotes(path):
+            df = df.reindex(columns=excel_cols)
+            fechas = [f for f in df["FECHA_ALBARAN"].map(watermarks.fecha_iso).tolist() if f]
+            ids = pd.to_numeric(df["ALBARAN_ID"], errors="coerce").dropna()
+            if fechas:
+                marca["fecha"] = max(fechas + ([marca["fecha"]] if marca["fecha"] else []))
+            if not ids.empty:
+                marca["max_id"] = max(int(ids.max()), marca["max_id"] or 0)
+            marca["filas"] += len(df)
+            yield df
 
-    if "ALBARAN_ID" in df_all.columns:
-        df_all = df_all.drop_duplicates(subset=["ALBARAN_ID"], keep="last")
-
-    sort_cols = [c for c in ["FECHA_ALBARAN", "ALBARAN_ID"] if c in df_all.columns]
-    if sort_cols:
-        df_all = df_all.sort_values(by=sort_cols, kind="stable")
-
-    tmp = OUTPUT_GLOBAL_XLSX.with_suffix(".tmp.xlsx")
-    with pd.ExcelWriter(tmp, engine="openpyxl") as writer:
-        df_all.to_excel(writer, index=False, sheet_name=GLOBAL_SHEET_NAME)
-    tmp.replace(OUTPUT_GLOBAL_XLSX)
-
-    print(f"[OK] GLOBAL actualizado: {OUTPUT_GLOBAL_XLSX.name} | filas: {len(df_all)} | hoja: {GLOBAL_SHEET_NAME}")
+    historico.upsert_lotes("albaran", lotes(), excel_cols)
+    return marca
 
 
 def export_to_xlsx(from_date_str: str) -> str:
-    session = requests.Session()
-
     # Validación rápida del formato
     try:
         datetime.strptime(from_date_str, "%d-%m-%Y")
     except ValueError:
         raise ValueError(f"from_date_str debe ser dd-mm-YYYY. Recibido: {from_date_str}")
 
+    # Checkpoint por pagina: un reintento reanuda desde el ultimo offset descargado
+    # (el tamaño de página forma parte de la clave: los offsets dependen de él)
+    # (las páginas se releen de disco al reanudar: en_memoria=False)
+    ck = checkpoints.abrir("from_date", "export_cabecera", clave=f"{from_date_str}|{PAGE_SIZE}", en_memoria=False)
+    hecho = ck.completado
+    if hecho and checkpoints.huella(Path(hecho["staging"])) == hecho.get("huella"):
+        print(f"[OK] Checkpoint: export ya completado para from-date={from_date_str} -> {hecho['staging']}")
+        return hecho["staging"]
+
     # 0) Volcar DAILY anterior al GLOBAL antes de sobrescribir
-    df_prev_daily = _read_excel_if_exists(OUTPUT_DAILY_XLSX, SHEET_NAME)
+    prev_staging = staging.ultimo_path("albaran", STAGING_MODO)
 
     excel_cols = [
         "ALBARAN_ID","TIPO_DOCUMENTO","NUMERO","SERIE","ID_EMPRESA","ID_TERCERO","ID_TIPO_TERCERO",
@@ -184,13 +146,10 @@ def export_to_xlsx(from_date_str: str) -> str:
         "OBSERVACIONES","OBSERVACIONES_FACTURA","RESUMEN_FACTURACION","CREADO_POR","ACTUALIZADO_POR"
     ]
 
-    if df_prev_daily is not None and not df_prev_daily.empty:
-        print(f"[INFO] Volcando DAILY anterior al GLOBAL: {OUTPUT_DAILY_XLSX.name} ({len(df_prev_daily)} filas)")
-        for c in excel_cols:
-            if c not in df_prev_daily.columns:
-                df_prev_daily[c] = None
-        df_prev_daily = df_prev_daily[excel_cols]
-        merge_into_global(df_prev_daily, excel_cols)
+    if prev_staging is not None and not watermarks.daily_ya_volcado("albaran", prev_staging):
+        print(f"[INFO] Volcando staging anterior al GLOBAL: {prev_staging.relative_to(BASE_DIR)}")
+        volcar_al_global(prev_staging, excel_cols)
+        watermarks.marcar_daily_volcado("albaran", prev_staging)
 
     # 1) Construir URL con FECHA_DESDE fija
     fecha_desde = from_date_str
@@ -200,88 +159,74 @@ def export_to_xlsx(from_date_str: str) -> str:
     print(f"[INFO] FECHA_DESDE usada: {fecha_desde}")
     print(f"[INFO] ENDPOINT: {base_url}")
 
-    rows: List[Dict[str, Any]] = []
+    # 2) Descargar paginado directo a staging (por trozos; la página siguiente se
+    #    descarga mientras se procesa la actual)
     seen_ids: Set[str] = set()
-
     offset = 0
     total_nuevos = 0
-
-    while True:
-        url = base_url if offset == 0 else f"{base_url}?offset={offset}"
-        print(f"[INFO] Descargando offset={offset} ...")
-
-        data = fetch_json_until_ok(session, url)
-
-        items = data.get("items") or []
-        if not items:
-            print("[INFO] Fin real: items vacio.")
-            break
-
-        nuevos_en_pagina = 0
-        repetidos_en_pagina = 0
-
-        for it in items:
-            if not isinstance(it, dict):
-                continue
-
-            aid = it.get("albaran_id")
-            aid_key = str(aid) if aid is not None else None
-
-            row = map_item_to_excel_row(it)
-
-            if aid_key is None:
-                rows.append(row)
-                nuevos_en_pagina += 1
-                continue
-
-            if aid_key in seen_ids:
-                repetidos_en_pagina += 1
-                continue
-
-            seen_ids.add(aid_key)
-            rows.append(row)
-            nuevos_en_pagina += 1
-
-        total_nuevos += nuevos_en_pagina
-        print(
-            f"[INFO] Nuevos en esta pagina: {nuevos_en_pagina} | Repetidos: {repetidos_en_pagina} | Total nuevos: {total_nuevos}"
+    fin = False
+
+    with CloudiaClient() as client, staging.Escritor("albaran", STAGING_MODO, excel_cols) as esc:
+        # Páginas descargadas en un intento anterior
+        for rec in ck.iter_registros():
+            esc.anadir(rec["rows"])
+            for row in rec["rows"]:
+                if row.get("ALBARAN_ID") is not None:
+                    seen_ids.add(str(row["ALBARAN_ID"]))
+            total_nuevos += len(rec["rows"])
+            offset = rec["siguiente"]
+            fin = bool(rec.get("fin"))
+        if ck.n_registros:
+            print(f"[INFO] Checkpoint: {ck.n_registros} paginas ya descargadas ({total_nuevos} filas). Sigo en offset={offset}")
+
+        paginas = [] if fin else client.paginas(
+            base_url,
+            clave_id="albaran_id",
+            page_size=PAGE_SIZE,
+            offset=offset,
+            stop_if_zero_new=STOP_IF_ZERO_NEW,
+            vistos=seen_ids,
         )
+        for pagina in paginas:
+            page_rows = [map_item_to_excel_row(it) for it in pagina.items]
+            esc.anadir(page_rows)
+            total_nuevos += len(page_rows)
+            print(
+                f"[INFO] offset={pagina.offset} | Nuevos en esta pagina: {len(page_rows)} "
+                f"| Repetidos: {pagina.repetidos} | Total nuevos: {total_nuevos}"
+            )
+            ck.anotar({"offset": pagina.offset, "siguiente": pagina.siguiente, "rows": page_rows, "fin": pagina.fin})
 
-        if STOP_IF_ZERO_NEW and nuevos_en_pagina == 0:
-            print("[WARN] Pagina sin nuevos IDs -> parece repeticion/bucle. Corto.")
-            break
+        if total_nuevos == 0:
+            raise RuntimeError("No se descargo ningun item. Revisa el endpoint o conectividad.")
 
-        has_more = data.get("hasMore")
-        if has_more is False or len(items) < PAGE_SIZE:
-            print("[INFO] Ultima pagina.")
-            break
+    staging_path = esc.path
 
-        offset += PAGE_SIZE
+    # 3) Render FROM_DATE (sobrescribe; se omite si es demasiado grande)
+    staging.render_xlsx_parquet(staging_path, OUTPUT_DAILY_XLSX, SHEET_NAME)
 
-    if not rows:
-        raise RuntimeError("No se descargo ningun item. Revisa el endpoint o conectividad.")
+    # 4) Volcar FROM_DATE nuevo al GLOBAL, por lotes, y proponer la marca (la confirma el loader)
+    marca = volcar_al_global(staging_path, excel_cols)
+    print(f"[OK] FROM_DATE generado | filas: {marca['filas']}")
+    watermarks.proponer("albaran", fecha=marca["fecha"], max_id=marca["max_id"])
+    watermarks.marcar_daily_volcado("albaran", staging_path)
+    ck.completar({"staging": str(staging_path), "huella": checkpoints.huella(staging_path)})
 
-    df = pd.DataFrame(rows, columns=excel_cols)
+    return str(staging_path)
 
-    # 2) Guardar DAILY (sobrescribe)
-    with pd.ExcelWriter(OUTPUT_DAILY_XLSX, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name=SHEET_NAME)
 
-    print(f"[OK] FROM_DATE generado: {OUTPUT_DAILY_XLSX.name} | filas: {len(df)} | hoja: {SHEET_NAME}")
-
-    # 3) Volcar DAILY nuevo al GLOBAL
-    merge_into_global(df, excel_cols)
-
-    return str(OUTPUT_DAILY_XLSX)
-
-
-if __name__ == "__main__":
+def run(argv: Optional[List[str]] = None) -> str:
+    """Punto de entrada del paso (pipeline_runner, modo worker); argv como en la CLI."""
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--from-date",
         default=START_DATE_STR,
         help='Fecha desde la que descargar (formato dd-mm-YYYY). Ej: "01-10-2023"',
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    return export_to_xlsx(args.from_date)
 
-    export_to_xlsx(args.from_date)
+
+if __name__ == "__main__":
+    run()
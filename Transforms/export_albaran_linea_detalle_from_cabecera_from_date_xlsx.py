@@ -1,10 +1,14 @@
-import time
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 from pathlib import Path
 
 import pandas as pd
-import requests
 from api_env import get_cloudia_base_url
+import historico
+import loader_schema
+import staging
+import watermarks
+import checkpoints
+from cloudia_http import CloudiaClient, MAX_IN_FLIGHT, MAX_RPS, PAGE_SIZE
 
 
 # =========================
@@ -13,6 +17,11 @@ from api_env import get_cloudia_base_url
 CABECERA_XLSX = "ALBARANES_CABECERA_FROM_DATE.xlsx"  # <- apunta al nuevo
 CABECERA_SHEET = "ALBARAN_CABECERA"
 CABECERA_COL_ID = "ALBARAN_ID"
+CABECERA_COL_FECHA = "FECHA_ALBARAN"
+CABECERA_COL_ESTADO = "ESTADO"
+
+# Albaranes cerrados: sus lineas ya no cambian y se cachean como inmutables (cloudia_cache)
+ESTADOS_CERRADOS = {"Facturado", "Anulado"}
 
 CLOUDIA_BASE = get_cloudia_base_url()
 LINEA_URL_TMPL = f"{CLOUDIA_BASE}/ords/cloudia_integracion_ia/albaranes/{{albaran_id}}/linea_detalle"
@@ -24,100 +33,64 @@ BACKOFF_START = 2.0
 BACKOFF_MAX = 60.0
 HEADERS = {"Content-Type": "application/json"}
 
-PAGE_SIZE = 25
 STOP_IF_ZERO_NEW = True
 
+# Descarga concurrente (CLOUDIA_MAX_IN_FLIGHT / CLOUDIA_MAX_RPS en .env)
+MAX_IN_FLIGHT_LINEAS = MAX_IN_FLIGHT
+MAX_RPS_LINEAS = MAX_RPS
+
 # =========================
 # OUTPUTS: mismo directorio del script
 # =========================
 BASE_DIR = Path(__file__).resolve().parent
 OUTPUT_DAILY_XLSX = BASE_DIR / "ALBARANES_LINEA_FROM_DATE.xlsx"
-OUTPUT_GLOBAL_XLSX = BASE_DIR / "ALBARANES_LINEA_GLOBAL.xlsx"
-GLOBAL_SHEET_NAME = SHEET_NAME
+STAGING_MODO = "from_date"  # staging/albaran_linea/fecha=<hoy>/from_date.parquet (el .xlsx es solo render)
 
 
 # =========================
 # Helpers
 # =========================
-def n_int(v: Any) -> Optional[int]:
-    if v is None:
-        return None
-    try:
-        s = str(v).strip()
-        if s.endswith(".0"):
-            s = s[:-2]
-        return int(float(s))
-    except Exception:
-        return None
-
-
-def n_num(v: Any) -> Optional[float]:
-    if v is None:
-        return None
-    if isinstance(v, (int, float)):
-        return float(v)
-    s = str(v).strip()
-    if not s:
-        return None
-    s = s.replace("\u00A0", "").replace(" ", "").replace("'", "")
-    if "," in s:
-        s = s.replace(".", "").replace(",", ".")
-    try:
-        return float(s)
-    except Exception:
-        return None
-
-
-def fetch_json_until_ok(session: requests.Session, url: str) -> Dict[str, Any]:
-    attempt = 0
-    sleep_s = BACKOFF_START
-
-    while True:
-        attempt += 1
-        try:
-            resp = session.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
-            if resp.status_code != 200:
-                print(f"   [WARN] HTTP {resp.status_code} (intento {attempt}) -> {url}")
-            else:
-                try:
-                    return resp.json()
-                except Exception as e:
-                    print(f"   [WARN] JSON invalido (intento {attempt}) -> {e}")
-
-        except requests.exceptions.Timeout:
-            print(f"   [WARN] Timeout ({REQUEST_TIMEOUT}s) (intento {attempt}) -> {url}")
-        except Exception as e:
-            print(f"   [WARN] Error (intento {attempt}) -> {e}")
-
-        print(f"   [INFO] Reintentando en {sleep_s:.0f}s...")
-        time.sleep(sleep_s)
-        sleep_s = min(BACKOFF_MAX, sleep_s * 1.5)
-
-
-def load_albaran_ids_from_cabecera_xlsx() -> List[int]:
-    excel_path = BASE_DIR / CABECERA_XLSX
-    if not excel_path.exists():
-        excel_path = Path.cwd() / CABECERA_XLSX
-    if not excel_path.exists():
-        raise FileNotFoundError(f"No existe el Excel cabecera en: {excel_path}")
-
-    df = pd.read_excel(excel_path, sheet_name=CABECERA_SHEET, dtype=object).dropna(how="all")
-    df.columns = [str(c).strip() for c in df.columns]
+def load_albaran_fechas_from_cabecera_xlsx() -> Dict[int, Optional[str]]:
+    """ALBARAN_ID -> FECHA_ALBARAN (YYYY-MM-DD) de la cabecera, ordenado por id."""
+    df = staging.leer_ultimo("albaran", STAGING_MODO)
+    if df is None:
+        # Sin staging (primera ejecucion tras migrar): Excel de cabecera
+        excel_path = BASE_DIR / CABECERA_XLSX
+        if not excel_path.exists():
+            excel_path = Path.cwd() / CABECERA_XLSX
+        if not excel_path.exists():
+            raise FileNotFoundError(f"No existe staging ni Excel cabecera en: {excel_path}")
+
+        df = pd.read_excel(excel_path, sheet_name=CABECERA_SHEET, dtype=object).dropna(how="all")
+        df.columns = [str(c).strip() for c in df.columns]
 
     if CABECERA_COL_ID not in df.columns:
         raise RuntimeError(
             f"No existe columna '{CABECERA_COL_ID}' en cabecera. Columnas: {list(df.columns)[:50]}"
         )
 
-    ids: List[int] = []
-    for v in df[CABECERA_COL_ID].tolist():
-        aid = n_int(v)
+    fechas_col = df[CABECERA_COL_FECHA].tolist() if CABECERA_COL_FECHA in df.columns else [None] * len(df)
+    fechas: Dict[int, Optional[str]] = {}
+    for aid, f in zip(loader_schema.col_int(df[CABECERA_COL_ID]).tolist(), fechas_col):
         if aid is not None:
-            ids.append(aid)
+            fechas[int(aid)] = watermarks.fecha_iso(f)
+
+    fechas = dict(sorted(fechas.items()))
+    print(f"[INFO] Albaranes en cabecera: {len(fechas)}")
+    return fechas
+
+
+def albaranes_cerrados() -> Set[int]:
+    """ALBARAN_ID de la cabecera en staging con ESTADO cerrado (vacío si no hay staging)."""
+    df = staging.leer_ultimo("albaran", STAGING_MODO)
+    if df is None or CABECERA_COL_ESTADO not in df.columns:
+        return set()
+    cerrados = df[df[CABECERA_COL_ESTADO].isin(ESTADOS_CERRADOS).fillna(False)]
+    return {int(aid) for aid in loader_schema.col_int(cerrados[CABECERA_COL_ID]).tolist() if aid is not None}
 
-    ids = sorted(set(ids))
-    print(f"[INFO] Albaranes en cabecera: {len(ids)}")
-    return ids
+
+def load_albaran_ids_from_cabecera_xlsx() -> List[int]:
+    return list(load_albaran_fechas_from_cabecera_xlsx())
 
 
 def map_linea_to_excel_row(it: Dict[str, Any]) -> Dict[str, Any]:
@@ -147,47 +120,35 @@ def map_linea_to_excel_row(it: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def _read_excel_if_exists(path: Path, sheet: str) -> Optional[pd.DataFrame]:
-    if not path.exists():
-        return None
-    df = pd.read_excel(path, sheet_name=sheet, dtype=object).dropna(how="all")
-    df.columns = [str(c).strip() for c in df.columns]
-    return df
-
-
-def merge_into_global(df_in: pd.DataFrame, excel_cols: List[str]) -> None:
-    df_global = _read_excel_if_exists(OUTPUT_GLOBAL_XLSX, GLOBAL_SHEET_NAME)
-    if df_global is None:
-        df_global = pd.DataFrame(columns=excel_cols)
-    else:
-        for c in excel_cols:
-            if c not in df_global.columns:
-                df_global[c] = None
-        df_global = df_global[excel_cols]
-
-    if df_global.empty:
-        df_all = df_in.copy()
-    else:
-        df_all = pd.concat([df_global, df_in], ignore_index=True)
+def volcar_al_global(path: Path, excel_cols: List[str]) -> None:
+    """Upsert del Parquet de staging en el histórico, por lotes (sin cargarlo entero)."""
+    historico.upsert_lotes(
+        "albaran_linea", (df.reindex(columns=excel_cols) for df in staging.iter_lotes(path)), excel_cols
+    )
 
-    if "LINEA_ID" in df_all.columns:
-        df_all = df_all.drop_duplicates(subset=["LINEA_ID"], keep="last")
 
-    sort_cols = [c for c in ["ALBARAN_ID", "LINEA_ID"] if c in df_all.columns]
-    if sort_cols:
-        df_all = df_all.sort_values(by=sort_cols, kind="stable")
-
-    tmp = OUTPUT_GLOBAL_XLSX.with_suffix(".tmp.xlsx")
-    with pd.ExcelWriter(tmp, engine="openpyxl") as writer:
-        df_all.to_excel(writer, index=False, sheet_name=GLOBAL_SHEET_NAME)
-    tmp.replace(OUTPUT_GLOBAL_XLSX)
-
-    print(f"[OK] GLOBAL actualizado: {OUTPUT_GLOBAL_XLSX.name} | filas: {len(df_all)} | hoja: {GLOBAL_SHEET_NAME}")
+def escribir_lineas(
+    esc: staging.Escritor, items: List[Dict[str, Any]], seen_linea_ids: Set[str]
+) -> Tuple[int, int]:
+    """Añade al staging las líneas de un albarán sin las ya vistas por LINEA_ID. Devuelve (escritas, repetidas)."""
+    rows: List[Dict[str, Any]] = []
+    repetidas = 0
+    for it in items:
+        lid = it.get("linea_id")
+        lid_key = str(lid) if lid is not None else None
+        if lid_key is not None:
+            if lid_key in seen_linea_ids:
+                repetidas += 1
+                continue
+            seen_linea_ids.add(lid_key)
+        rows.append(map_linea_to_excel_row(it))
+    esc.anadir(rows)
+    return len(rows), repetidas
 
 
 def export_lineas_to_xlsx() -> str:
-    session = requests.Session()
-    albaran_ids = load_albaran_ids_from_cabecera_xlsx()
+    fechas_por_albaran = load_albaran_fechas_from_cabecera_xlsx()
+    albaran_ids = list(fechas_por_albaran)
 
     excel_cols = [
         "LINEA_ID","ALBARAN_ID","PRODUCTO_ID_ORIGEN","ALBARAN_NUMERO","ALBARAN_SERIE",
@@ -196,101 +157,96 @@ def export_lineas_to_xlsx() -> str:
         "PEDIDO_LINEA_ID","CUENTA_INGRESO","PRODUCTO_EXTERNO","PRODUCTO_OBSERVACION","PRODUCTO_ID"
     ]
 
+    # Checkpoint por albaran: un reintento solo descarga los que faltan
+    # (las líneas ya descargadas se releen de disco al reanudar: en_memoria=False)
+    ck = checkpoints.abrir("from_date", "export_linea", clave=checkpoints.clave_de(albaran_ids), en_memoria=False)
+    hecho = ck.completado
+    if hecho and checkpoints.huella(Path(hecho["staging"])) == hecho.get("huella"):
+        print(f"[OK] Checkpoint: export de lineas ya completado -> {hecho['staging']}")
+        return hecho["staging"]
+
     # 0) Volcar DAILY anterior al GLOBAL antes de sobrescribir
-    df_prev_daily = _read_excel_if_exists(OUTPUT_DAILY_XLSX, SHEET_NAME)
-    if df_prev_daily is not None and not df_prev_daily.empty:
-        print(f"[INFO] Volcando DAILY anterior al GLOBAL: {OUTPUT_DAILY_XLSX.name} ({len(df_prev_daily)} filas)")
-        for c in excel_cols:
-            if c not in df_prev_daily.columns:
-                df_prev_daily[c] = None
-        df_prev_daily = df_prev_daily[excel_cols]
-        merge_into_global(df_prev_daily, excel_cols)
+    prev_staging = staging.ultimo_path("albaran_linea", STAGING_MODO)
+    if prev_staging is not None and not watermarks.daily_ya_volcado("albaran_linea", prev_staging):
+        print(f"[INFO] Volcando staging anterior al GLOBAL: {prev_staging.relative_to(BASE_DIR)}")
+        volcar_al_global(prev_staging, excel_cols)
+        watermarks.marcar_daily_volcado("albaran_linea", prev_staging)
+
+    # 1) Descarga en paralelo: las paginas de cada albaran van en serie,
+    #    los albaranes se reparten entre MAX_IN_FLIGHT_LINEAS hilos. Los
+    #    resultados llegan en orden de albaran_id y se escriben al staging uno a
+    #    uno (con dedupe global por LINEA_ID): la memoria no crece con el export.
+    #    El checkpoint se anota en ese mismo orden, así que lo ya descargado es
+    #    siempre un prefijo de albaran_ids y se relee de disco al reanudar.
+    hechos = {int(r["albaran_id"]) for r in ck.iter_registros()}
+    pendientes = [aid for aid in albaran_ids if aid not in hechos]
+    if hechos:
+        print(f"[INFO] Checkpoint: {len(hechos)} albaranes ya descargados | quedan: {len(pendientes)}")
+
+    cerrados = albaranes_cerrados()
+    print(f"[INFO] Descarga concurrente: max_in_flight={MAX_IN_FLIGHT_LINEAS} | max_rps={MAX_RPS_LINEAS}")
+    print(f"[INFO] Albaranes cerrados (lineas inmutables en cache): {len(cerrados)}")
+    total = len(pendientes)
 
-    rows: List[Dict[str, Any]] = []
     seen_linea_ids: Set[str] = set()
+    n_lineas = 0
+    repetidas = 0
+
+    with CloudiaClient(
+        max_in_flight=MAX_IN_FLIGHT_LINEAS,
+        max_rps=MAX_RPS_LINEAS,
+        timeout=REQUEST_TIMEOUT,
+        backoff_start=BACKOFF_START,
+        backoff_max=BACKOFF_MAX,
+        headers=HEADERS,
+    ) as client, staging.Escritor("albaran_linea", STAGING_MODO, excel_cols) as esc:
+        for rec in ck.iter_registros():
+            escritas, rep = escribir_lineas(esc, rec["items"], seen_linea_ids)
+            n_lineas += escritas
+            repetidas += rep
+
+        descargas = client.iter_ordenado(
+            lambda aid: client.paginado(
+                LINEA_URL_TMPL.format(albaran_id=aid),
+                clave_id="linea_id",
+                page_size=PAGE_SIZE,
+                stop_if_zero_new=STOP_IF_ZERO_NEW,
+                inmutable=aid in cerrados,
+            ),
+            pendientes,
+        )
+        for hechas, (aid, items) in enumerate(descargas, start=1):
+            ck.anotar({"albaran_id": aid, "items": items})
+            escritas, rep = escribir_lineas(esc, items, seen_linea_ids)
+            n_lineas += escritas
+            repetidas += rep
+            print(f"[INFO] ({hechas}/{total}) albaran_id={aid} | lineas: {len(items)}")
 
-    for idx, aid in enumerate(albaran_ids, start=1):
-        base_url = LINEA_URL_TMPL.format(albaran_id=aid)
-        print(f"[INFO] ({idx}/{len(albaran_ids)}) Descargando lineas de albaran_id={aid}")
-
-        offset = 0
-        total_nuevos_albaran = 0
-
-        while True:
-            url = base_url if offset == 0 else f"{base_url}?offset={offset}"
-            data = fetch_json_until_ok(session, url)
-
-            items = data.get("items") or []
-            if not items:
-                break
-
-            nuevos_en_pagina = 0
-            repetidos_en_pagina = 0
-
-            for it in items:
-                if not isinstance(it, dict):
-                    continue
-
-                lid = it.get("linea_id")
-                lid_key = str(lid) if lid is not None else None
-
-                row = map_linea_to_excel_row(it)
-
-                if lid_key is None:
-                    rows.append(row)
-                    nuevos_en_pagina += 1
-                    continue
-
-                if lid_key in seen_linea_ids:
-                    repetidos_en_pagina += 1
-                    continue
-
-                seen_linea_ids.add(lid_key)
-                rows.append(row)
-                nuevos_en_pagina += 1
-
-            total_nuevos_albaran += nuevos_en_pagina
-            print(
-                f"   [INFO] Nuevas: {nuevos_en_pagina} | Repetidas: {repetidos_en_pagina} | Total albaran: {total_nuevos_albaran}"
-            )
-
-            if STOP_IF_ZERO_NEW and nuevos_en_pagina == 0:
-                print("[WARN] Pagina sin nuevas lineas -> parece repeticion/bucle. Corto este albaran.")
-                break
-
-            has_more = data.get("hasMore")
-            if has_more is False or len(items) < PAGE_SIZE:
-                break
-
-            offset += PAGE_SIZE
-
-    if not rows:
-        raise RuntimeError("No se descargo ninguna linea. Revisa cabecera, endpoint o conectividad.")
-
-    df = pd.DataFrame(rows, columns=excel_cols)
+        print(f"[INFO] Lineas: {n_lineas} | Repetidas entre albaranes: {repetidas}")
+        if not n_lineas and albaran_ids:
+            raise RuntimeError("No se descargo ninguna linea. Revisa cabecera, endpoint o conectividad.")
 
-    # Normaliza numericos
-    num_cols = ["CANTIDAD","PRECIO","DESCUENTO_PCT","PRECIO_TRAS_DTO","SUBTOTAL","TASA_IMPUESTO","CUOTA_IMPUESTO","TASA_RECARGO","CUOTA_RECARGO"]
-    for c in num_cols:
-        if c in df.columns:
-            df[c] = df[c].apply(n_num)
+    # 2) Render FROM_DATE (sobrescribe; se omite si es demasiado grande)
+    staging_path = esc.path
+    staging.render_xlsx_parquet(staging_path, OUTPUT_DAILY_XLSX, SHEET_NAME)
 
-    int_cols = ["LINEA_ID","ALBARAN_ID","PRODUCTO_REF_ORIGEN","IDPRODUCTO","ALBARAN_NUMERO","PEDIDO_LINEA_ID"]
-    for c in int_cols:
-        if c in df.columns:
-            df[c] = df[c].apply(n_int)
+    print(f"[OK] FROM_DATE generado | filas: {n_lineas}")
+    if albaran_ids:
+        fechas = [fechas_por_albaran[a] for a in albaran_ids if fechas_por_albaran.get(a)]
+        watermarks.proponer("albaran_linea", fecha=max(fechas) if fechas else None, max_id=max(albaran_ids))
 
-    # 1) Guardar DAILY (sobrescribe)
-    with pd.ExcelWriter(OUTPUT_DAILY_XLSX, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name=SHEET_NAME)
+    # 3) Volcar FROM_DATE nuevo al GLOBAL, por lotes
+    volcar_al_global(staging_path, excel_cols)
+    watermarks.marcar_daily_volcado("albaran_linea", staging_path)
+    ck.completar({"staging": str(staging_path), "huella": checkpoints.huella(staging_path)})
 
-    print(f"[OK] FROM_DATE generado: {OUTPUT_DAILY_XLSX.name} | filas: {len(df)} | hoja: {SHEET_NAME}")
+    return str(staging_path)
 
-    # 2) Volcar DAILY nuevo al GLOBAL
-    merge_into_global(df, excel_cols)
 
-    return str(OUTPUT_DAILY_XLSX)
+def run() -> str:
+    """Punto de entrada del paso (pipeline_runner, modo worker)."""
+    return export_lineas_to_xlsx()
 
 
 if __name__ == "__main__":
-    export_lineas_to_xlsx()
+    run()
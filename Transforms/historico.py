@@ -0,0 +1,286 @@
+# historico.py
+# Histórico local de albaranes / líneas / clientes en SQLite (sustituye a los Excel GLOBAL).
+#
+# Antes, cada ejecución mantenía un ALBARANES_*_GLOBAL.xlsx / CLIENTES_GLOBAL.xlsx
+# (lectura, merge y reescritura del libro, que además se subía a git). Ahora:
+#   - el delta de cada ejecución se hace UPSERT en historico.sqlite, una tabla por
+#     entidad con su clave primaria (ALBARAN_ID, LINEA_ID, CODIGOCUENTA): el coste
+#     es proporcional al delta, no al histórico;
+#   - el Excel GLOBAL pasa a ser una exportación bajo demanda:
+#       python historico.py exportar [albaran|albaran_linea|clientes ...]
+#       python historico.py estado
+#   - la primera vez que se usa una tabla vacía se siembra con el GLOBAL.xlsx que
+#     hubiera (y su diario .delta.jsonl pendiente), así no se pierde historia.
+#
+# El orden de exportación es el de llegada (rowid): un upsert no mueve la fila.
+# Las filas sin clave no se guardan (no hay forma de actualizarlas después).
+#
+# Configuración por entorno:
+#   HISTORICO_DB  (ruta del fichero SQLite, por defecto Transforms/historico.sqlite)
+import json
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+
+# =========================
+# CONFIG
+# =========================
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = Path(os.getenv("HISTORICO_DB", str(BASE_DIR / "historico.sqlite")))
+
+# entidad (la de staging) -> (clave primaria, Excel GLOBAL, hoja)
+ENTIDADES: Dict[str, Tuple[str, str, str]] = {
+    "albaran": ("ALBARAN_ID", "ALBARANES_CABECERA_GLOBAL.xlsx", "ALBARAN_CABECERA"),
+    "albaran_linea": ("LINEA_ID", "ALBARANES_LINEA_GLOBAL.xlsx", "ALBARAN_LINEA"),
+    "clientes": ("CODIGOCUENTA", "CLIENTES_GLOBAL.xlsx", "CLIENTE"),
+}
+
+LOTE_FILAS = 5000
+
+
+# =========================
+# Helpers
+# =========================
+def _clave(v: Any) -> Optional[str]:
+    if v is None:
+        return None
+    try:
+        if pd.isna(v):
+            return None
+    except (TypeError, ValueError):
+        pass
+    s = str(v).strip()
+    if s.endswith(".0"):
+        s = s[:-2]
+    if not s or s.upper() in ("NAN", "NONE"):
+        return None
+    return s
+
+
+def _celda(v: Any) -> Any:
+    if v is None:
+        return None
+    try:
+        if pd.isna(v):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if hasattr(v, "item"):  # escalares NumPy
+        return v.item()
+    if hasattr(v, "isoformat"):  # fechas (SQLite no tiene tipo propio)
+        return v.isoformat()
+    if isinstance(v, (int, float, str, bytes)):
+        return v
+    return str(v)
+
+
+def _q(nombre: str) -> str:
+    return '"' + nombre.replace('"', '""') + '"'
+
+
+def conectar(db_path: Path = DB_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=60)
+    # WAL: lectores (exportar, pasos en paralelo) no bloquean al que escribe
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _columnas(conn: sqlite3.Connection, tabla: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({_q(tabla)})")]
+
+
+def _preparar_tabla(conn: sqlite3.Connection, entidad: str, cols: List[str]) -> None:
+    """Crea la tabla o añade las columnas que falten."""
+    key_col = ENTIDADES[entidad][0]
+    existentes = _columnas(conn, entidad)
+    if not existentes:
+        resto = [c for c in cols if c != key_col]
+        defs = ", ".join([f"{_q(key_col)} TEXT PRIMARY KEY"] + [_q(c) for c in resto])
+        conn.execute(f"CREATE TABLE {_q(entidad)} ({defs})")
+        return
+    for c in cols:
+        if c not in existentes:
+            conn.execute(f"ALTER TABLE {_q(entidad)} ADD COLUMN {_q(c)}")
+
+
+def _upsert_filas(conn: sqlite3.Connection, entidad: str, df: pd.DataFrame, cols: List[str]) -> Tuple[int, int]:
+    """UPSERT por clave primaria (gana lo último). Devuelve (filas guardadas, filas sin clave)."""
+    key_col = ENTIDADES[entidad][0]
+    resto = [c for c in cols if c != key_col]
+    todas = [key_col] + resto
+    set_sql = ", ".join(f"{_q(c)}=excluded.{_q(c)}" for c in resto) or f"{_q(key_col)}=excluded.{_q(key_col)}"
+    sql = (
+        f"INSERT INTO {_q(entidad)} ({', '.join(_q(c) for c in todas)}) "
+        f"VALUES ({', '.join('?' for _ in todas)}) "
+        f"ON CONFLICT({_q(key_col)}) DO UPDATE SET {set_sql}"
+    )
+
+    guardadas = 0
+    sin_clave = 0
+    lote: List[tuple] = []
+    for rec in df.reindex(columns=todas).to_dict(orient="records"):
+        k = _clave(rec.get(key_col))
+        if k is None:
+            sin_clave += 1
+            continue
+        lote.append((k, *(_celda(rec.get(c)) for c in resto)))
+        if len(lote) >= LOTE_FILAS:
+            conn.executemany(sql, lote)
+            guardadas += len(lote)
+            lote = []
+    if lote:
+        conn.executemany(sql, lote)
+        guardadas += len(lote)
+    return guardadas, sin_clave
+
+
+def _leer_global_xlsx(entidad: str, cols: List[str]) -> pd.DataFrame:
+    """GLOBAL.xlsx + diario pendiente (formato anterior), para sembrar la tabla."""
+    _, xlsx_name, sheet = ENTIDADES[entidad]
+    xlsx = BASE_DIR / xlsx_name
+    partes = []
+    if xlsx.exists():
+        try:
+            partes.append(pd.read_excel(xlsx, sheet_name=sheet, dtype=object))
+        except ValueError:  # hoja con otro nombre: la primera
+            partes.append(pd.read_excel(xlsx, dtype=object))
+    diario = xlsx.with_name(xlsx.stem + ".delta.jsonl")
+    if diario.exists():
+        with diario.open("r", encoding="utf-8") as f:
+            recs = [json.loads(line) for line in f if line.strip()]
+        if recs:
+            partes.append(pd.DataFrame(recs))
+    if not partes:
+        return pd.DataFrame(columns=cols)
+    df = pd.concat(partes, ignore_index=True)
+    return df.reindex(columns=list(dict.fromkeys([c for c in df.columns if isinstance(c, str)] + cols)))
+
+
+def _sembrar(conn: sqlite3.Connection, entidad: str, cols: List[str]) -> None:
+    """Crea la tabla y, si había un GLOBAL.xlsx del formato anterior, la rellena con él."""
+    df = _leer_global_xlsx(entidad, cols)
+    _preparar_tabla(conn, entidad, list(df.columns))
+    if df.empty:
+        return
+    guardadas, _ = _upsert_filas(conn, entidad, df, list(df.columns))
+    print(f"[INFO] Historico '{entidad}' sembrado desde {ENTIDADES[entidad][1]}: {guardadas} filas")
+
+
+# =========================
+# API
+# =========================
+def upsert(entidad: str, df_delta: pd.DataFrame, cols: List[str], *, db_path: Path = DB_PATH) -> None:
+    """Guarda df_delta en el histórico de la entidad (upsert por su clave primaria)."""
+    if entidad not in ENTIDADES:
+        raise ValueError(f"Entidad sin historico: {entidad}")
+    if df_delta.empty:
+        print(f"[INFO] Historico sin cambios: {entidad} (delta vacio)")
+        return
+
+    with closing(conectar(db_path)) as conn:
+        with conn:
+            if not _columnas(conn, entidad):
+                _sembrar(conn, entidad, cols)
+            _preparar_tabla(conn, entidad, cols)
+            guardadas, sin_clave = _upsert_filas(conn, entidad, df_delta, cols)
+        total = conn.execute(f"SELECT COUNT(*) FROM {_q(entidad)}").fetchone()[0]
+
+    print(f"[OK] Historico '{entidad}': upsert {guardadas} filas | total: {total}")
+    if sin_clave:
+        print(f"[WARN] Historico '{entidad}': {sin_clave} filas sin {ENTIDADES[entidad][0]} descartadas")
+
+
+def upsert_lotes(entidad: str, lotes: Iterable[pd.DataFrame], cols: List[str], *, db_path: Path = DB_PATH) -> int:
+    """Como upsert(), con el delta por lotes (p.ej. staging.iter_lotes): una transacción, sin juntarlo en memoria."""
+    if entidad not in ENTIDADES:
+        raise ValueError(f"Entidad sin historico: {entidad}")
+
+    guardadas = 0
+    sin_clave = 0
+    with closing(conectar(db_path)) as conn:
+        with conn:
+            if not _columnas(conn, entidad):
+                _sembrar(conn, entidad, cols)
+            _preparar_tabla(conn, entidad, cols)
+            for df in lotes:
+                if df.empty:
+                    continue
+                g, s = _upsert_filas(conn, entidad, df, cols)
+                guardadas += g
+                sin_clave += s
+        total = conn.execute(f"SELECT COUNT(*) FROM {_q(entidad)}").fetchone()[0]
+
+    print(f"[OK] Historico '{entidad}': upsert {guardadas} filas | total: {total}")
+    if sin_clave:
+        print(f"[WARN] Historico '{entidad}': {sin_clave} filas sin {ENTIDADES[entidad][0]} descartadas")
+    return guardadas
+
+
+def leer(entidad: str, *, db_path: Path = DB_PATH) -> pd.DataFrame:
+    """Histórico completo de la entidad, en orden de llegada."""
+    if not Path(db_path).exists():
+        return pd.DataFrame()
+    with closing(conectar(db_path)) as conn:
+        if not _columnas(conn, entidad):
+            return pd.DataFrame()
+        return pd.read_sql_query(f"SELECT * FROM {_q(entidad)} ORDER BY rowid", conn)
+
+
+def exportar_xlsx(entidad: str, destino: Optional[Path] = None, *, db_path: Path = DB_PATH) -> Optional[Path]:
+    """Vuelca el histórico de la entidad a su Excel GLOBAL (snapshot bajo demanda)."""
+    _, xlsx_name, sheet = ENTIDADES[entidad]
+    destino = Path(destino) if destino else BASE_DIR / xlsx_name
+    df = leer(entidad, db_path=db_path)
+    if df.empty:
+        print(f"[WARN] Historico '{entidad}' vacio: no se exporta {destino.name}")
+        return None
+    tmp = destino.with_suffix(".tmp.xlsx")
+    with pd.ExcelWriter(tmp, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet)
+    tmp.replace(destino)
+    print(f"[OK] GLOBAL exportado: {destino.name} | filas: {len(df)} | hoja: {sheet}")
+    return destino
+
+
+def estado(*, db_path: Path = DB_PATH) -> Dict[str, int]:
+    """Filas por entidad en el histórico."""
+    res: Dict[str, int] = {}
+    if not Path(db_path).exists():
+        return res
+    with closing(conectar(db_path)) as conn:
+        for entidad in ENTIDADES:
+            if _columnas(conn, entidad):
+                res[entidad] = conn.execute(f"SELECT COUNT(*) FROM {_q(entidad)}").fetchone()[0]
+    return res
+
+
+def main(argv: List[str]) -> int:
+    orden = argv[0] if argv else "estado"
+    if orden == "exportar":
+        entidades = argv[1:] or list(ENTIDADES)
+        for e in entidades:
+            if e not in ENTIDADES:
+                print(f"[WARN] Entidad desconocida: {e} (validas: {', '.join(ENTIDADES)})")
+                return 2
+        for e in entidades:
+            exportar_xlsx(e)
+        return 0
+    if orden == "estado":
+        filas = estado()
+        print(f"[INFO] {DB_PATH}")
+        for e in ENTIDADES:
+            print(f"[INFO] {e}: {filas.get(e, 0)} filas")
+        return 0
+    print("Uso: python historico.py [estado | exportar [entidad ...]]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
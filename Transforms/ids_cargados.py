@@ -0,0 +1,121 @@
+# ids_cargados.py
+# Caché local de ids ya cargados en Supabase (p.ej. albaran_linea.linea_id).
+#
+# Los loaders insert-only la usan para no reenviar, en ejecuciones posteriores,
+# filas que ya se subieron, sin consultar la BD. Es un conjunto exacto y no un
+# filtro probabilístico: un falso positivo dejaría una fila sin cargar.
+#
+# La BD sigue mandando: lo que no está en la caché se envía con on_conflict +
+# resolution=ignore-duplicates, así que una caché perdida o atrasada solo cuesta
+# reenvíos. Si se borran filas a mano en la BD, hay que borrar también la caché.
+#
+# Fichero: ids_cargados/<tabla>.txt (un id por línea, solo se añade).
+#
+# Para los loaders UPSERT hay además huellas por fila (hash del contenido enviado):
+# ids_cargados/<tabla>.huellas.tsv con "id<TAB>huella" (solo se añade; manda la
+# última línea de cada id). Una fila cuya huella no ha cambiado no se reenvía.
+# Igual que con los ids, la BD sigue mandando: sin caché se reenvía todo. Si se
+# editan filas a mano en la BD y se quiere que la carga las vuelva a pisar, hay
+# que borrar las huellas de esa tabla.
+#
+# Configuración por entorno:
+#   IDS_CARGADOS_CACHE  (0 = no usar la caché, por defecto 1)
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Mapping, Set
+
+
+# =========================
+# CONFIG
+# =========================
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_DIR = BASE_DIR / "ids_cargados"
+ACTIVA = os.getenv("IDS_CARGADOS_CACHE", "1").strip().lower() not in ("0", "false", "no")
+
+
+def _path(tabla: str) -> Path:
+    return CACHE_DIR / f"{tabla}.txt"
+
+
+def _path_huellas(tabla: str) -> Path:
+    return CACHE_DIR / f"{tabla}.huellas.tsv"
+
+
+# =========================
+# API
+# =========================
+def leer(tabla: str) -> Set[str]:
+    """Ids ya cargados de la tabla (vacío si la caché está desactivada o no existe)."""
+    path = _path(tabla)
+    if not ACTIVA or not path.exists():
+        return set()
+    with path.open("r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def anadir(tabla: str, ids: Iterable[str], conocidos: Set[str] = frozenset()) -> int:
+    """Añade a la caché los ids confirmados por la BD. Devuelve cuántos eran nuevos."""
+    if not ACTIVA:
+        return 0
+    nuevos = sorted({str(i).strip() for i in ids if i is not None and str(i).strip()} - set(conocidos))
+    if not nuevos:
+        return 0
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with _path(tabla).open("a", encoding="utf-8") as f:
+        f.write("\n".join(nuevos) + "\n")
+    print(f"[OK] Cache de ids ({tabla}): +{len(nuevos)}")
+    return len(nuevos)
+
+
+def borrar(tabla: str) -> None:
+    _path(tabla).unlink(missing_ok=True)
+
+
+# =========================
+# Huellas (loaders UPSERT)
+# =========================
+def huella(fila: Mapping[str, Any]) -> str:
+    """Hash del contenido de una fila tal como se envía (independiente del orden de claves)."""
+    txt = json.dumps(fila, sort_keys=True, ensure_ascii=False, default=str, separators=(",", ":"))
+    return hashlib.sha1(txt.encode("utf-8")).hexdigest()
+
+
+def leer_huellas(tabla: str) -> Dict[str, str]:
+    """id -> huella de lo último cargado (vacío si la caché está desactivada o no existe)."""
+    path = _path_huellas(tabla)
+    if not ACTIVA or not path.exists():
+        return {}
+    huellas: Dict[str, str] = {}
+    lineas = 0
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            partes = line.rstrip("\n").split("\t")
+            if len(partes) == 2 and partes[0]:
+                huellas[partes[0]] = partes[1]
+                lineas += 1
+    # Compactar si el fichero acumula demasiadas versiones antiguas
+    if lineas > 2 * len(huellas) + 1000:
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            f.writelines(f"{k}\t{v}\n" for k, v in huellas.items())
+        tmp.replace(path)
+    return huellas
+
+
+def anadir_huellas(tabla: str, huellas: Mapping[str, str], conocidas: Mapping[str, str] = {}) -> int:
+    """Guarda las huellas confirmadas por la BD (solo las que cambian). Devuelve cuántas."""
+    if not ACTIVA:
+        return 0
+    nuevas = {str(k): v for k, v in huellas.items() if conocidas.get(str(k)) != v}
+    if not nuevas:
+        return 0
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with _path_huellas(tabla).open("a", encoding="utf-8") as f:
+        f.writelines(f"{k}\t{v}\n" for k, v in nuevas.items())
+    return len(nuevas)
+
+
+def borrar_huellas(tabla: str) -> None:
+    _path_huellas(tabla).unlink(missing_ok=True)
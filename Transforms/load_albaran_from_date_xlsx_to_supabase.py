@@ -1,12 +1,14 @@
 import math
-import time
-from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any
 
 import pandas as pd
-import requests
 from supa_env import get_supabase_creds
+import staging
+import watermarks
+import loader_schema
+import supa_upload
+import checkpoints
 
 # ============================================================
 # CONFIG
@@ -18,6 +20,8 @@ TABLE = "albaran"
 # ✅ apunta al excel nuevo "desde fecha"
 EXCEL_FILE = "ALBARANES_CABECERA_FROM_DATE.xlsx"
 SHEET_NAME = "ALBARAN_CABECERA"
+STAGING_ENTIDAD = "albaran"
+STAGING_MODO = "from_date"
 
 BATCH_SIZE = 500
 TIMEOUT = 180
@@ -34,68 +38,6 @@ HEADERS = {
 }
 
 
-def n_str(v: Any) -> Optional[str]:
-    if v is None or pd.isna(v):
-        return None
-    s = str(v).strip()
-    if s.upper() in ("NAN", "NONE", ""):
-        return None
-    return s[:-2] if s.endswith(".0") else s
-
-
-def n_int(v: Any) -> Optional[int]:
-    if v is None or pd.isna(v):
-        return None
-    try:
-        s = str(v).strip()
-        if s.endswith(".0"):
-            s = s[:-2]
-        if not s:
-            return None
-        return int(float(s))
-    except Exception:
-        return None
-
-
-def n_num(v: Any) -> Optional[float]:
-    if v is None or pd.isna(v):
-        return None
-    if isinstance(v, (int, float)):
-        try:
-            if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
-                return None
-            return float(v)
-        except Exception:
-            return None
-
-    s = str(v).strip()
-    if not s:
-        return None
-    s = s.replace("\u00A0", "").replace(" ", "").replace("'", "")
-    if "," in s:
-        s = s.replace(".", "").replace(",", ".")
-    try:
-        return float(s)
-    except Exception:
-        return None
-
-
-def n_dt_utc(v: Any) -> Optional[str]:
-    if v is None or pd.isna(v):
-        return None
-    if isinstance(v, str) and v.strip():
-        return v.strip()
-    if isinstance(v, datetime):
-        return v.isoformat()
-    try:
-        dt = pd.to_datetime(v, errors="coerce", utc=True)
-        if pd.isna(dt):
-            return None
-        return dt.to_pydatetime().isoformat()
-    except Exception:
-        return None
-
-
 def drop_nullish(rec: Dict[str, Any]) -> Dict[str, Any]:
     """Quita nulls/vacios/NaN/inf para no pisar datos existentes."""
     out: Dict[str, Any] = {}
@@ -111,6 +53,12 @@ def drop_nullish(rec: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def load_excel() -> pd.DataFrame:
+    """Ultima salida del export en staging (Parquet); el Excel queda como respaldo."""
+    df = staging.leer_ultimo(STAGING_ENTIDAD, STAGING_MODO)
+    if df is not None:
+        print(f"[INFO] Leyendo staging: {staging.ultimo_path(STAGING_ENTIDAD, STAGING_MODO).relative_to(staging.BASE_DIR)}")
+        return df
+
     base_dir = Path(__file__).resolve().parent
     excel_path = base_dir / EXCEL_FILE
     if not excel_path.exists():
@@ -145,98 +93,50 @@ def normalize_batch_keys(batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return normalized
 
 
-def post_with_retry_upsert(payload: List[Dict[str, Any]]) -> None:
-    url = f"{REST_URL}?on_conflict=albaran_id"
-
-    for attempt in range(1, MAX_RETRIES + 1):
-        resp = requests.post(url, headers=HEADERS, json=payload, timeout=TIMEOUT)
-
-        if resp.status_code in (200, 201, 204):
-            return
-
-        if resp.status_code in (408, 429, 500, 502, 503, 504):
-            time.sleep(min(2 ** attempt, 30))
-            continue
-
-        raise RuntimeError(f"UPSERT HTTP {resp.status_code}: {resp.text[:2000]}")
-
-    raise RuntimeError(f"Fallo UPSERT tras {MAX_RETRIES} reintentos. Ultimo: {resp.status_code} {resp.text[:2000]}")
-
-
 def run():
     df = load_excel()
-    rows: List[Dict[str, Any]] = []
 
-    for _, r in df.iterrows():
-        albaran_id = n_int(r.get("ALBARAN_ID"))
-        if albaran_id is None:
-            continue
+    # Normalizacion por columnas segun el esquema compartido (loader_schema)
+    norm = loader_schema.normalizar(df, loader_schema.ALBARAN_CABECERA)
+    norm = norm[norm["albaran_id"].notna()]
 
-        rec: Dict[str, Any] = {
-            "albaran_id": albaran_id,
-
-            "tipo_documento": n_str(r.get("TIPO_DOCUMENTO")),
-            "numero": n_int(r.get("NUMERO")),
-            "serie": n_str(r.get("SERIE")),
-
-            # ✅ FIX: en tu tabla NO existe id_empresa -> usamos empresa_id
-            "empresa_id": n_int(r.get("ID_EMPRESA")),
-
-            "id_tercero": n_int(r.get("ID_TERCERO")),
-            "id_tipo_tercero": n_int(r.get("ID_TIPO_TERCERO")),
-            "cliente": n_str(r.get("CLIENTE")),
-            "cif_cliente": n_str(r.get("CIF_CLIENTE")),
-            "cuenta_cliente_proveedor": n_str(r.get("CUENTA_CLIENTE_PROVEEDOR")),
-            "id_direccion_origen": n_int(r.get("ID_DIRECCION")),
-
-            "tipo_tercero": n_str(r.get("TIPO_TERCERO")),
-            "estado": n_str(r.get("ESTADO")),
-            "forma_de_pago": n_str(r.get("FORMA_DE_PAGO")),
-            "impuesto_envio": n_num(r.get("IMPUESTO_ENVIO")),
-
-            "base_gastos_envio": n_num(r.get("BASE_GASTOS_ENVIO")),
-            "base_imponible": n_num(r.get("BASE_IMPONIBLE")),
-            "total_impuestos": n_num(r.get("TOTAL_IMPUESTOS")),
-            "total_descuentos": n_num(r.get("TOTAL_DESCUENTOS")),
-            "total_recargos": n_num(r.get("TOTAL_RECARGOS")),
-            "total_general": n_num(r.get("TOTAL_GENERAL")),
-
-            "fecha_albaran": n_dt_utc(r.get("FECHA_ALBARAN")),
-            "fecha_facturar": n_dt_utc(r.get("FECHA_FACTURAR")),
-            "fecha_facturacion": n_dt_utc(r.get("FECHA_FACTURACION")),
-            "fecha_vencimiento": n_dt_utc(r.get("FECHA_VENCIMIENTO")),
-
-            "observaciones": n_str(r.get("OBSERVACIONES")),
-            "observaciones_factura": n_str(r.get("OBSERVACIONES_FACTURA")),
-            "resumen_facturacion": n_str(r.get("RESUMEN_FACTURACION")),
-            "creado_por": n_str(r.get("CREADO_POR")),
-            "actualizado_por": n_str(r.get("ACTUALIZADO_POR")),
-        }
-
-        # no pisar con nulls/vacios
-        rec = drop_nullish(rec)
-
-        # no tocar campos normalizados
-        rec.pop("clienteid", None)
-        rec.pop("clientes_direccionid", None)
-        rec.pop("forma_pagoid", None)
-        rec.pop("albaran_estadoid", None)
-
-        rows.append(rec)
+    # no pisar con nulls/vacios (los FKs normalizados no estan en el esquema)
+    rows: List[Dict[str, Any]] = [drop_nullish(rec) for rec in loader_schema.registros(norm)]
 
     print(f"[INFO] Preparados: {len(rows)} albaranes (UPSERT merge, sin pisar con NULLs, sin tocar FKs)")
 
+    # Checkpoint por lote confirmado: un reintento no vuelve a subir lo ya aceptado
+    origen = staging.ultimo_path(STAGING_ENTIDAD, STAGING_MODO)
+    ck = checkpoints.abrir("from_date", "load_cabecera", clave=checkpoints.huella(origen) or EXCEL_FILE)
+    ya_subidos = {str(aid) for rec in ck.registros for aid in rec["albaran_ids"]}
+    if ya_subidos:
+        rows = [r for r in rows if str(r["albaran_id"]) not in ya_subidos]
+        print(f"[INFO] Checkpoint: {len(ya_subidos)} albaranes ya subidos | quedan: {len(rows)}")
+
     if not rows:
         print("[OK] Nada que cargar.")
+        watermarks.confirmar("albaran")
         return
 
-    for i in range(0, len(rows), BATCH_SIZE):
-        batch = rows[i:i + BATCH_SIZE]
-        batch = normalize_batch_keys(batch)  # FIX PGRST102
-        post_with_retry_upsert(batch)
-        print(f"[OK]  Lote {i//BATCH_SIZE + 1} | {min(i + len(batch), len(rows))}/{len(rows)}")
+    with supa_upload.SupabaseUploader(
+        f"{REST_URL}?on_conflict=albaran_id",
+        HEADERS,
+        tabla=TABLE,
+        etiqueta="UPSERT",
+        batch_rows=BATCH_SIZE,
+        timeout=TIMEOUT,
+        max_retries=MAX_RETRIES,
+        preparar_lote=normalize_batch_keys,  # FIX PGRST102
+    ) as uploader:
+        uploader.subir(
+            rows,
+            clave="albaran_id",
+            al_confirmar=lambda lote: ck.anotar({"albaran_ids": [r["albaran_id"] for r in lote]}),
+        )
+    ck.completar({"filas": len(rows)})
 
     print("[OK] UPSERT COMPLETADO (merge-duplicates, triggers intactos)")
+    watermarks.confirmar("albaran")
 
 
 if __name__ == "__main__":
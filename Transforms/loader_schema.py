@@ -0,0 +1,230 @@
+# loader_schema.py
+# Esquema declarativo (columna Excel/staging -> columna Supabase) y normalización
+# vectorizada para los loaders de albaran y albaran_linea.
+#
+# Sustituye a los bucles df.iterrows() + n_str/n_int/n_num/n_dt_utc por celda:
+# cada columna se normaliza de una vez con pandas/NumPy y el resultado produce
+# los mismos payloads JSON que las funciones escalares originales.
+#
+# Tipos:
+#   str  -> texto recortado; "", "nan", "none" -> None; quita ".0" final
+#   int  -> int(float(x)) (trunca); lo no numérico -> None
+#   num  -> float; admite "1.234,56", espacios, NBSP y '; NaN/inf -> None
+#   dt   -> texto ISO tal cual si es str; fechas -> isoformat() (UTC si no es str)
+#   bool -> true/t/1/si/sí/yes/y/verdadero | false/f/0/no/n/falso; resto -> None
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+Esquema = List[Tuple[str, str, str]]  # (columna_db, columna_origen, tipo)
+
+
+# =========================
+# ESQUEMAS
+# =========================
+# Los FKs normalizados (clienteid, clientes_direccionid, forma_pagoid,
+# albaran_estadoid) no están en el esquema a propósito: los rellenan los triggers.
+ALBARAN_CABECERA: Esquema = [
+    ("albaran_id", "ALBARAN_ID", "int"),
+
+    ("tipo_documento", "TIPO_DOCUMENTO", "str"),
+    ("numero", "NUMERO", "int"),
+    ("serie", "SERIE", "str"),
+
+    # en la tabla NO existe id_empresa -> empresa_id
+    ("empresa_id", "ID_EMPRESA", "int"),
+
+    ("id_tercero", "ID_TERCERO", "int"),
+    ("id_tipo_tercero", "ID_TIPO_TERCERO", "int"),
+    ("cliente", "CLIENTE", "str"),
+    ("cif_cliente", "CIF_CLIENTE", "str"),
+    ("cuenta_cliente_proveedor", "CUENTA_CLIENTE_PROVEEDOR", "str"),
+    ("id_direccion_origen", "ID_DIRECCION", "int"),
+
+    ("tipo_tercero", "TIPO_TERCERO", "str"),
+    ("estado", "ESTADO", "str"),
+    ("forma_de_pago", "FORMA_DE_PAGO", "str"),
+    ("impuesto_envio", "IMPUESTO_ENVIO", "num"),
+
+    ("base_gastos_envio", "BASE_GASTOS_ENVIO", "num"),
+    ("base_imponible", "BASE_IMPONIBLE", "num"),
+    ("total_impuestos", "TOTAL_IMPUESTOS", "num"),
+    ("total_descuentos", "TOTAL_DESCUENTOS", "num"),
+    ("total_recargos", "TOTAL_RECARGOS", "num"),
+    ("total_general", "TOTAL_GENERAL", "num"),
+
+    ("fecha_albaran", "FECHA_ALBARAN", "dt"),
+    ("fecha_facturar", "FECHA_FACTURAR", "dt"),
+    ("fecha_facturacion", "FECHA_FACTURACION", "dt"),
+    ("fecha_vencimiento", "FECHA_VENCIMIENTO", "dt"),
+
+    ("observaciones", "OBSERVACIONES", "str"),
+    ("observaciones_factura", "OBSERVACIONES_FACTURA", "str"),
+    ("resumen_facturacion", "RESUMEN_FACTURACION", "str"),
+    ("creado_por", "CREADO_POR", "str"),
+    ("actualizado_por", "ACTUALIZADO_POR", "str"),
+]
+
+# ids como texto: en BD linea_id / albaran_id son text
+ALBARAN_LINEA: Esquema = [
+    ("linea_id", "LINEA_ID", "str"),
+    ("albaran_id", "ALBARAN_ID", "str"),
+
+    ("producto_id_origen", "PRODUCTO_ID_ORIGEN", "int"),
+    ("albaran_numero", "ALBARAN_NUMERO", "int"),
+    ("albaran_serie", "ALBARAN_SERIE", "str"),
+    ("producto_ref_origen", "PRODUCTO_REF_ORIGEN", "int"),
+    ("idproducto", "IDPRODUCTO", "int"),
+    ("descripcion", "DESCRIPCION", "str"),
+    ("cantidad", "CANTIDAD", "num"),
+    ("precio", "PRECIO", "num"),
+    ("descuento_pct", "DESCUENTO_PCT", "num"),
+    ("precio_tras_dto", "PRECIO_TRAS_DTO", "num"),
+    ("subtotal", "SUBTOTAL", "num"),
+    ("tasa_impuesto", "TASA_IMPUESTO", "num"),
+    ("cuota_impuesto", "CUOTA_IMPUESTO", "num"),
+    ("tasa_recargo", "TASA_RECARGO", "num"),
+    ("cuota_recargo", "CUOTA_RECARGO", "num"),
+    ("pedido_linea_id", "PEDIDO_LINEA_ID", "int"),
+    ("cuenta_ingreso", "CUENTA_INGRESO", "str"),
+
+    ("producto_externo", "PRODUCTO_EXTERNO", "bool"),
+    ("producto_observacion", "PRODUCTO_OBSERVACION", "str"),
+    ("producto_id", "PRODUCTO_ID", "int"),
+]
+
+_BOOL_TRUE = ["true", "t", "1", "si", "sí", "yes", "y", "verdadero"]
+_BOOL_FALSE = ["false", "f", "0", "no", "n", "falso"]
+
+
+# =========================
+# Normalizadores por columna
+# =========================
+def _texto(s: pd.Series) -> pd.Series:
+    """str(v) de cada valor no nulo (pd.NA/NaN/None -> <NA>)."""
+    out = pd.Series(pd.NA, index=s.index, dtype="string")
+    ok = s.notna()
+    if ok.any():
+        out[ok] = s[ok].astype(object).map(str).astype("string")
+    return out
+
+
+def _a_objeto(s: pd.Series) -> pd.Series:
+    """Series object con None en los nulos, lista para to_dict()."""
+    return s.astype(object).where(s.notna(), None)
+
+
+def col_str(s: pd.Series) -> pd.Series:
+    txt = _texto(s).str.strip()
+    txt = txt.mask(txt.str.upper().isin(["NAN", "NONE", ""]))
+    return _a_objeto(txt.str.replace(r"\.0$", "", regex=True))
+
+
+def _sin_guiones(txt: pd.Series) -> pd.Series:
+    """float() de Python admite '1_000' (guion bajo entre dígitos); to_numeric no."""
+    return txt.str.replace(r"(?<=\d)_(?=\d)", "", regex=True)
+
+
+def _finito(num: pd.Series) -> pd.Series:
+    return num.where(np.isfinite(num.astype("float64")))
+
+
+def col_int(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_integer_dtype(s.dtype):
+        return _a_objeto(s.astype("Int64"))
+    txt = _sin_guiones(_texto(s).str.strip().str.replace(r"\.0$", "", regex=True))
+    num = _finito(pd.to_numeric(txt, errors="coerce").astype("float64"))
+    return _a_objeto(np.trunc(num).astype("Int64"))
+
+
+def col_num(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_float_dtype(s.dtype) or (
+        pd.api.types.is_integer_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype)
+    ):
+        return _a_objeto(_finito(s.astype("float64")))
+
+    obj = s.astype(object)
+    # int/float (y bool) nativos se convierten directamente, como en n_num
+    nativo = obj.map(lambda v: isinstance(v, (int, float))) & obj.notna()
+    out = pd.Series(np.nan, index=s.index, dtype="float64")
+    if nativo.any():
+        out[nativo] = obj[nativo].astype("float64")
+
+    resto = ~nativo & obj.notna()
+    if resto.any():
+        txt = _texto(obj[resto]).str.strip()
+        txt = txt.str.replace("\u00A0", "", regex=False).str.replace(" ", "", regex=False).str.replace("'", "", regex=False)
+        coma = txt.str.contains(",", regex=False).fillna(False)
+        txt = txt.where(~coma, txt.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+        out[resto] = pd.to_numeric(_sin_guiones(txt), errors="coerce").astype("float64")
+    return _a_objeto(_finito(out))
+
+
+def _dt_escalar(v: Any) -> Optional[str]:
+    if isinstance(v, datetime):
+        return v.isoformat()
+    try:
+        dt = pd.to_datetime(v, errors="coerce", utc=True)
+        if pd.isna(dt):
+            return None
+        return dt.to_pydatetime().isoformat()
+    except Exception:
+        return None
+
+
+def col_dt(s: pd.Series) -> pd.Series:
+    obj = s.astype(object)
+    ok = obj.notna()
+    es_str = obj.map(lambda v: isinstance(v, str)) & ok
+    out = pd.Series(None, index=s.index, dtype=object)
+    if es_str.any():
+        txt = obj[es_str].str.strip()
+        out[es_str] = txt.where(txt != "", None)
+    resto = ok & (~es_str | out.isna())
+    if resto.any():
+        out[resto] = obj[resto].map(_dt_escalar)
+    return out
+
+
+def col_bool(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(s.dtype):
+        return _a_objeto(s.astype("boolean"))
+    txt = _texto(s).str.strip().str.lower()
+    out = pd.Series(None, index=s.index, dtype=object)
+    out[txt.isin(_BOOL_TRUE).fillna(False).to_numpy(dtype=bool)] = True
+    out[txt.isin(_BOOL_FALSE).fillna(False).to_numpy(dtype=bool)] = False
+    return out
+
+
+NORMALIZADORES: Dict[str, Callable[[pd.Series], pd.Series]] = {
+    "str": col_str,
+    "int": col_int,
+    "num": col_num,
+    "dt": col_dt,
+    "bool": col_bool,
+}
+
+
+# =========================
+# API
+# =========================
+def normalizar(df: pd.DataFrame, esquema: Esquema) -> pd.DataFrame:
+    """
+    DataFrame con las columnas de BD (en el orden del esquema) y valores ya
+    normalizados (object, None en nulos). Columnas de origen ausentes -> None.
+    """
+    cols: Dict[str, pd.Series] = {}
+    for col_db, col_origen, tipo in esquema:
+        if col_origen in df.columns:
+            cols[col_db] = NORMALIZADORES[tipo](df[col_origen])
+        else:
+            cols[col_db] = pd.Series(None, index=df.index, dtype=object)
+    return pd.DataFrame(cols, index=df.index)
+
+
+def registros(df_norm: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Filas como dicts con tipos nativos de Python (int/float/str/bool/None)."""
+    return df_norm.to_dict(orient="records")
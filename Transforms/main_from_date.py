@@ -1,73 +1,43 @@
 import os
-import sys
-import subprocess
 import argparse
 from pathlib import Path
-from datetime import datetime
-from zoneinfo import ZoneInfo
 
-TZ = ZoneInfo("Europe/Madrid")
+import checkpoints
+from pipeline_runner import Paso, run_pipeline
+
 os.environ["PYTHONUTF8"] = "1"
 
 DEFAULT_FROM_DATE = "01-10-2023"
 
-SCRIPTS = [
-    ("export_albaran_cabecera_from_date_api_to_xlsx.py", True),   # recibe --from-date
-    ("export_albaran_linea_detalle_from_cabecera_from_date_xlsx.py", False),
-    ("load_albaran_from_date_xlsx_to_supabase.py", False),
-    ("load_albaran_linea_from_date_xlsx_to_supabase.py", False),
-]
+EXPORT_CABECERA = "export_albaran_cabecera_from_date_api_to_xlsx.py"  # recibe --from-date
+EXPORT_LINEA = "export_albaran_linea_detalle_from_cabecera_from_date_xlsx.py"
+LOAD_CABECERA = "load_albaran_from_date_xlsx_to_supabase.py"
+LOAD_LINEA = "load_albaran_linea_from_date_xlsx_to_supabase.py"
+SYNC_VENTAS = "sync_ventas_producto_diario.py"
 
 LOG_FILE_NAME = "pipeline_from_date.log"
-
-
-def run_step_live(py: Path, log_path: Path, extra_args: list[str]) -> None:
-    cmd = [sys.executable, "-X", "utf8", str(py), *extra_args]
-    ts = datetime.now(TZ).isoformat()
-
-    # encabezado en log
-    with log_path.open("a", encoding="utf-8") as lf:
-        lf.write("\n" + "=" * 90 + "\n")
-        lf.write(f"[{ts}] RUN: {' '.join(cmd)}\n")
-        lf.flush()
-
-    # ejecuta y “tee” stdout+stderr a consola y log
-    p = subprocess.Popen(
-        cmd,
-        cwd=str(py.parent),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1,  # line-buffered
-        env=os.environ.copy(),
-    )
-
-    with log_path.open("a", encoding="utf-8") as lf:
-        try:
-            assert p.stdout is not None
-            for line in p.stdout:
-                # consola
-                print(line, end="")
-                # log
-                lf.write(line)
-        except KeyboardInterrupt:
-            # si cortas, paramos el proceso hijo limpio
-            try:
-                p.terminate()
-            except Exception:
-                pass
-            raise
-        finally:
-            try:
-                if p.stdout:
-                    p.stdout.close()
-            except Exception:
-                pass
-
-        code = p.wait()
-
-    if code != 0:
-        raise RuntimeError(f"Fallo {py.name} (exit={code}). Mira el log: {log_path}")
+METRICS_FILE_NAME = "pipeline_metrics.jsonl"  # historico por paso (lo lee modules/pipeline_albaranes)
+CHECKPOINT_GRUPO = "from_date"
+
+# Con checkpoints, reintentar un paso solo repite la pagina/albaran/lote en curso
+RETRYABLE_PREFIXES = ("export_", "load_", "sync_")
+MAX_ATTEMPTS_RETRYABLE = 3
+SLEEP_BETWEEN_RETRIES_S = 30
+MAX_WORKERS = 2
+# "worker": pasos en procesos calientes (run()); "subprocess": un interprete por paso
+STEP_MODE = os.getenv("PIPELINE_STEP_MODE", "worker")
+
+
+def build_pasos(from_date: str) -> list[Paso]:
+    # La carga de cabecera corre en paralelo con el export de lineas;
+    # la carga de lineas espera a ambos; el acumulado de ventas, a la carga de lineas.
+    return [
+        Paso(EXPORT_CABECERA, args=("--from-date", from_date)),
+        Paso(EXPORT_LINEA, depende_de=(EXPORT_CABECERA,)),
+        Paso(LOAD_CABECERA, depende_de=(EXPORT_CABECERA,)),
+        Paso(LOAD_LINEA, depende_de=(EXPORT_LINEA, LOAD_CABECERA)),
+        Paso(SYNC_VENTAS, depende_de=(LOAD_LINEA,), args=("--modo", "from_date")),
+    ]
 
 
 def main():
@@ -77,29 +47,35 @@ def main():
         default=DEFAULT_FROM_DATE,
         help='Fecha desde la que descargar (formato dd-mm-YYYY). Ej: "01-10-2023"',
     )
+    parser.add_argument(
+        "--sin-reanudar",
+        action="store_true",
+        help="Descarta los checkpoints de un backfill anterior y empieza de cero",
+    )
     args = parser.parse_args()
 
-    base_dir = Path(__file__).resolve().parent
-    log_path = base_dir / LOG_FILE_NAME
-
-    with log_path.open("a", encoding="utf-8") as f:
-        f.write("\n" + "#" * 90 + "\n")
-        f.write(f"PIPELINE FROM_DATE START {datetime.now(TZ).isoformat()} | from-date={args.from_date}\n")
-
-    for script_name, needs_from_date in SCRIPTS:
-        py = base_dir / script_name
-        if not py.exists():
-            raise FileNotFoundError(f"No existe el script: {py}")
-
-        extra_args = ["--from-date", args.from_date] if needs_from_date else []
-
-        print(f"\n[RUN] {script_name} {' '.join(extra_args)}".strip())
-        run_step_live(py, log_path, extra_args)
-        print(f"[OK]  {script_name}")
-
-    print(f"\n[OK] PIPELINE COMPLETADO. Log: {log_path}")
+    if args.sin_reanudar:
+        checkpoints.borrar_grupo(CHECKPOINT_GRUPO)
+
+    # Sin timeout (un backfill largo se vigila a mano); los reintentos y las
+    # re-ejecuciones tras un fallo reanudan desde los checkpoints de cada paso.
+    # La salida de cada paso se ve en consola con su prefijo y queda en el log.
+    run_pipeline(
+        scripts=build_pasos(args.from_date),
+        log_file_name=LOG_FILE_NAME,
+        default_timeout=None,
+        retryable_prefixes=RETRYABLE_PREFIXES,
+        max_attempts_retryable=MAX_ATTEMPTS_RETRYABLE,
+        sleep_between_retries_s=SLEEP_BETWEEN_RETRIES_S,
+        base_dir=Path(__file__).resolve().parent,
+        max_workers=MAX_WORKERS,
+        echo_console=True,
+        step_mode=STEP_MODE,
+        metrics_file_name=METRICS_FILE_NAME,
+        log_header=f"FROM_DATE from-date={args.from_date}",
+    )
+    checkpoints.borrar_grupo(CHECKPOINT_GRUPO)
 
 
 if __name__ == "__main__":
     main()
-
@@ -1,28 +1,43 @@
 import os
 from pathlib import Path
-from pipeline_runner import run_pipeline
+from pipeline_runner import Paso, run_pipeline
 
 # Fuerza UTF-8 en Windows
 os.environ["PYTHONUTF8"] = "1"
 
-SCRIPTS = [
-    "daily_export_albaran_cabecera_api_to_xlsx.py",
-    "load_albaran_from_api_xlsx_v5_upsert_merge_skip_nulls_daily.py",
-    "daily_export_albaran_linea_detalle_from_cabecera_xlsx_2026.py",
-    "load_albaran_linea_from_xlsx_v1_insert_only_skip_existing.py",
+EXPORT_CABECERA = "daily_export_albaran_cabecera_api_to_xlsx.py"
+LOAD_CABECERA = "load_albaran_from_api_xlsx_v5_upsert_merge_skip_nulls_daily.py"
+EXPORT_LINEA = "daily_export_albaran_linea_detalle_from_cabecera_xlsx_2026.py"
+LOAD_LINEA = "load_albaran_linea_from_xlsx_v1_insert_only_skip_existing.py"
+SYNC_VENTAS = "sync_ventas_producto_diario.py"
+
+# DAG: la linea solo necesita la cabecera EXPORTADA (no cargada); la carga de
+# lineas espera a la de cabecera para que los triggers encuentren el albaran.
+# El acumulado de ventas se recalcula tras las cargas.
+PASOS = [
+    Paso(EXPORT_CABECERA),
+    Paso(LOAD_CABECERA, depende_de=(EXPORT_CABECERA,)),
+    Paso(EXPORT_LINEA, depende_de=(EXPORT_CABECERA,)),
+    Paso(LOAD_LINEA, depende_de=(EXPORT_LINEA, LOAD_CABECERA)),
+    Paso(SYNC_VENTAS, depende_de=(LOAD_LINEA,)),
 ]
+MAX_WORKERS = 3
+# "worker": pasos en procesos calientes (run()); "subprocess": un interprete por paso
+STEP_MODE = os.getenv("PIPELINE_STEP_MODE", "worker")
 
 LOG_FILE_NAME = "pipeline_daily.log"
 LAST_RUN_FILE = "pipeline_last_run.txt"
 LOCK_FILE_NAME = "pipeline_daily.lock"
+METRICS_FILE_NAME = "pipeline_metrics.jsonl"  # historico por paso (lo lee modules/pipeline_albaranes)
 MAX_LOG_BYTES = 10 * 1024 * 1024
 KEEP_LOG_FILES = 5
 
 TIMEOUTS = {
-    "daily_export_albaran_cabecera_api_to_xlsx.py": 12 * 60,
-    "load_albaran_from_api_xlsx_v5_upsert_merge_skip_nulls_daily.py": 12 * 60,
-    "daily_export_albaran_linea_detalle_from_cabecera_xlsx_2026.py": 20 * 60,
-    "load_albaran_linea_from_xlsx_v1_insert_only_skip_existing.py": 15 * 60,
+    EXPORT_CABECERA: 12 * 60,
+    LOAD_CABECERA: 12 * 60,
+    EXPORT_LINEA: 20 * 60,
+    LOAD_LINEA: 15 * 60,
+    SYNC_VENTAS: 10 * 60,
 }
 DEFAULT_TIMEOUT = 15 * 60
 
@@ -31,11 +46,12 @@ MAX_ATTEMPTS_RETRYABLE = 3
 SLEEP_BETWEEN_RETRIES_S = 60
 BACKOFF_MAX_S = 300
 
+# El historico (GLOBAL) vive en historico.sqlite, fuera de git; el Excel GLOBAL
+# se genera bajo demanda con: python historico.py exportar. Las marcas de agua
+# y las metricas por paso son estado local de la maquina (tambien fuera de git).
 AUTO_COMMIT_FILES = [
     "ALBARANES_CABECERA_DAILY_DEL_DIA.xlsx",
-    "ALBARANES_CABECERA_GLOBAL.xlsx",
     "ALBARANES_LINEA_DAILY_DEL_DIA.xlsx",
-    "ALBARANES_LINEA_GLOBAL.xlsx",
 ]
 AUTO_COMMIT_MESSAGE = "chore: update albaranes excels"
 
@@ -46,7 +62,7 @@ def main():
     auto_commit_paths = [base_dir / f for f in AUTO_COMMIT_FILES]
 
     run_pipeline(
-        scripts=SCRIPTS,
+        scripts=PASOS,
         log_file_name=LOG_FILE_NAME,
         timeouts=TIMEOUTS,
         default_timeout=DEFAULT_TIMEOUT,
@@ -63,6 +79,9 @@ def main():
         auto_commit_message=AUTO_COMMIT_MESSAGE,
         auto_commit_repo_root=repo_root,
         base_dir=base_dir,
+        max_workers=MAX_WORKERS,
+        step_mode=STEP_MODE,
+        metrics_file_name=METRICS_FILE_NAME,
     )
 
 
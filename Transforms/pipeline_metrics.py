@@ -0,0 +1,140 @@
+# pipeline_metrics.py
+# Métricas por paso del pipeline (para ver la evolución del rendimiento entre ejecuciones).
+#
+# Dentro de un paso, los módulos compartidos suman contadores con sumar():
+#   api_paginas      respuestas 200 de Cloudia
+#   api_filas        items recibidos en esas respuestas
+#   bytes_recibidos  cuerpo de las respuestas de Cloudia
+#   http_reintentos  reintentos HTTP (Cloudia y Supabase)
+#   bytes_enviados   cuerpo de los POST a Supabase (incluidos los reintentos)
+#   filas_subidas    filas aceptadas por Supabase
+#   filas_staging    filas escritas en staging
+#   cache_hits       respuestas de Cloudia servidas de la caché en disco sin red
+#   cache_304        respuestas revalidadas con un 304 (cuerpo de la caché)
+#   rollup_filas     filas recalculadas en ventas_producto_diario
+# Al acabar el paso se añade una línea (contadores + pico de memoria) a un fichero
+# parcial que pipeline_runner suma y vuelca en el histórico JSON-lines:
+#   - modo subprocess: el runner pasa el parcial en PIPELINE_METRICS_PART y se
+#     escribe al salir del intérprete;
+#   - modo worker: pipeline_worker llama a iniciar()/volcar() alrededor del paso.
+#     Ahí rss_pico_mb es el pico del worker hasta ese paso, no solo del paso.
+import atexit
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+ENV_PARCIAL = "PIPELINE_METRICS_PART"
+
+_lock = threading.Lock()
+_contadores: Dict[str, int] = {}
+_parcial: Optional[Path] = None
+
+
+# =========================
+# Lado paso
+# =========================
+def sumar(nombre: str, n: int = 1) -> None:
+    with _lock:
+        _contadores[nombre] = _contadores.get(nombre, 0) + int(n)
+
+
+def iniciar(parcial: Optional[Path]) -> None:
+    """Empieza un paso: contadores a cero y destino del volcado."""
+    global _parcial
+    with _lock:
+        _contadores.clear()
+        _parcial = Path(parcial) if parcial else None
+
+
+def volcar() -> None:
+    """Añade los contadores del paso (y el pico de memoria) al fichero parcial."""
+    global _parcial
+    with _lock:
+        if _parcial is None:
+            return
+        rec = {**_contadores, "rss_pico_mb": rss_pico_mb()}
+        path, _parcial = _parcial, None
+    try:
+        with path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(rec) + "\n")
+    except OSError:
+        pass
+
+
+def rss_pico_mb() -> Optional[float]:
+    """Pico de memoria residente del proceso en MB (None si no se puede medir)."""
+    try:
+        import resource
+    except ImportError:
+        return _rss_pico_windows()
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux da KB; macOS, bytes
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _rss_pico_windows() -> Optional[float]:
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class _Contadores(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        c = _Contadores()
+        c.cb = ctypes.sizeof(c)
+        proc = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(proc, ctypes.byref(c), c.cb):
+            return None
+        return round(c.PeakWorkingSetSize / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+
+# Modo subprocess: el paso es el intérprete entero
+if os.getenv(ENV_PARCIAL):
+    iniciar(Path(os.environ[ENV_PARCIAL]))
+    atexit.register(volcar)
+
+
+# =========================
+# Lado pipeline
+# =========================
+def leer_parcial(path: Path) -> Dict[str, Any]:
+    """Suma los contadores de todos los intentos de un paso (memoria: el máximo)."""
+    total: Dict[str, Any] = {}
+    if not path.exists():
+        return total
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            for k, v in rec.items():
+                if v is None:
+                    continue
+                if k == "rss_pico_mb":
+                    total[k] = max(total.get(k, 0), v)
+                else:
+                    total[k] = total.get(k, 0) + v
+    return total
+
+
+def registrar(path: Path, registro: Dict[str, Any]) -> None:
+    """Añade un registro al histórico de métricas (JSON-lines)."""
+    with path.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
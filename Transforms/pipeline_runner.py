@@ -1,14 +1,47 @@
 import os
 import sys
 import time
+import threading
 import subprocess
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from pathlib import Path
 from datetime import datetime, date
 from zoneinfo import ZoneInfo
 
+import pipeline_metrics
+from pipeline_worker import PasoCancelado, Worker, WorkerPool
+
 TZ = ZoneInfo("Europe/Madrid")
 
 
+@dataclass(frozen=True)
+class Paso:
+    """
+    Paso del pipeline (un script de Transforms).
+
+    depende_de: scripts que tienen que terminar bien antes de lanzar este.
+    bloqueos:   recursos exclusivos; dos pasos con un bloqueo en comun nunca
+                corren a la vez aunque no dependan entre si.
+    timeout_s:  si se indica, manda sobre timeouts/default_timeout.
+    """
+    script: str
+    depende_de: tuple[str, ...] = ()
+    args: tuple[str, ...] = ()
+    timeout_s: int | None = None
+    bloqueos: tuple[str, ...] = ()
+
+
+_print_lock = threading.Lock()
+
+
+def _say(msg: str) -> None:
+    """print() seguro entre hilos (los pasos paralelos no mezclan lineas)."""
+    with _print_lock:
+        sys.stdout.write(msg + "\n")
+        sys.stdout.flush()
+
+
 def now_ts() -> str:
     return datetime.now(TZ).isoformat(timespec="seconds")
 
@@ -22,10 +55,10 @@ def tail_file(path: Path, n_lines: int = 300) -> str:
 
 
 def run_pipeline(
-    scripts: list[str],
+    scripts: list[str | Paso],
     log_file_name: str,
     timeouts: dict[str, int] | None = None,
-    default_timeout: int = 15 * 60,
+    default_timeout: int | None = 15 * 60,
     retryable_prefixes: tuple[str, ...] = (),
     max_attempts_retryable: int = 3,
     sleep_between_retries_s: int = 60,
@@ -40,10 +73,36 @@ def run_pipeline(
     auto_commit_paths: list[Path] | None = None,
     auto_commit_message: str | None = None,
     auto_commit_repo_root: Path | None = None,
+    max_workers: int = 1,
+    echo_console: bool = False,
+    log_header: str = "",
+    step_mode: str = "subprocess",
+    metrics_file_name: str | None = None,
 ) -> None:
+    """
+    Ejecuta los pasos respetando sus dependencias, con hasta max_workers a la vez.
+    Los str sueltos en `scripts` dependen del anterior (ejecucion en serie, como antes).
+    Si un paso falla no se lanzan mas; se espera a los que estan en curso y se relanza el error.
+
+    step_mode:
+      "subprocess" -> cada paso en un interprete nuevo (python -X utf8 script.py args)
+      "worker"     -> run() del paso en un proceso caliente reutilizable (pipeline_worker)
+
+    metrics_file_name: historico JSON-lines con un registro por paso (filas, paginas,
+    reintentos, bytes, duracion, pico de memoria) y otro por ejecucion (pipeline_metrics).
+    """
+    if step_mode not in ("subprocess", "worker"):
+        raise ValueError(f"step_mode desconocido: {step_mode}")
     base_dir = base_dir or Path(__file__).resolve().parent
     log_path = base_dir / log_file_name
+    metrics_path = base_dir / metrics_file_name if metrics_file_name else None
     timeouts = timeouts or {}
+    pasos = _como_pasos(scripts)
+
+    for p in pasos:
+        py = base_dir / p.script
+        if not py.exists():
+            raise FileNotFoundError(f"No existe el script: {py}")
 
     if max_log_bytes:
         _rotate_logs(log_path, max_log_bytes=max_log_bytes, keep=keep_log_files)
@@ -59,23 +118,61 @@ def run_pipeline(
                 print(f"[INFO] Ya se ejecutó hoy ({last_run_path.read_text().strip()}).")
                 return
 
+        inicio = now_ts()
+        t0 = time.time()
         with log_path.open("a", encoding="utf-8") as f:
             f.write("\n" + "#" * 90 + "\n")
-            f.write(f"PIPELINE START {now_ts()}\n")
-
-        for name in scripts:
-            py = base_dir / name
-            if not py.exists():
-                raise FileNotFoundError(f"No existe el script: {py}")
-            _run_step(
-                py=py,
-                log_path=log_path,
-                timeout_s=timeouts.get(name, default_timeout),
-                retryable_prefixes=retryable_prefixes,
-                max_attempts_retryable=max_attempts_retryable,
-                sleep_between_retries_s=sleep_between_retries_s,
-                backoff_max_s=backoff_max_s,
-            )
+            f.write(f"PIPELINE START {inicio}{(' | ' + log_header) if log_header else ''}\n")
+
+        # Campos comunes de los registros de metricas de esta ejecucion
+        ejecucion = {"ejecucion": inicio, "pipeline": log_path.stem, "modo": step_mode}
+
+        log_lock = threading.Lock()
+        cancelar = threading.Event()
+        pool = WorkerPool(max_workers, base_dir) if step_mode == "worker" else None
+
+        def ejecutar(paso: Paso) -> None:
+            if lock_path:
+                _touch_lock(lock_path)
+            worker = pool.adquirir(paso.depende_de) if pool else None
+            try:
+                _run_paso(
+                    paso=paso,
+                    worker=worker,
+                    base_dir=base_dir,
+                    log_path=log_path,
+                    log_lock=log_lock,
+                    timeout_s=paso.timeout_s if paso.timeout_s is not None else timeouts.get(paso.script, default_timeout),
+                    retryable_prefixes=retryable_prefixes,
+                    max_attempts_retryable=max_attempts_retryable,
+                    sleep_between_retries_s=sleep_between_retries_s,
+                    backoff_max_s=backoff_max_s,
+                    cancelar=cancelar,
+                    echo_console=echo_console,
+                    metrics_path=metrics_path,
+                    ejecucion=ejecucion,
+                )
+            finally:
+                if pool:
+                    pool.liberar(worker)
+
+        estado = "error"
+        try:
+            _run_dag(pasos, ejecutar, max_workers=max_workers, cancelar=cancelar)
+            estado = "ok"
+        finally:
+            if pool:
+                pool.cerrar()
+            if metrics_path:
+                with log_lock:
+                    _registrar_metricas(metrics_path, {
+                        **ejecucion,
+                        "tipo": "pipeline",
+                        "estado": estado,
+                        "dur_s": round(time.time() - t0, 1),
+                        "pasos": len(pasos),
+                        "max_workers": max_workers,
+                    })
 
         with log_path.open("a", encoding="utf-8") as f:
             f.write(f"PIPELINE END   {now_ts()}\n")
@@ -100,16 +197,167 @@ def run_pipeline(
             _release_lock(lock_path)
 
 
+def _como_pasos(scripts: list[str | Paso]) -> list[Paso]:
+    pasos: list[Paso] = []
+    for s in scripts:
+        if isinstance(s, Paso):
+            pasos.append(s)
+        else:
+            prev = (pasos[-1].script,) if pasos else ()
+            pasos.append(Paso(script=s, depende_de=prev))
+
+    nombres = [p.script for p in pasos]
+    if len(set(nombres)) != len(nombres):
+        raise ValueError(f"Pasos repetidos en el pipeline: {nombres}")
+    for p in pasos:
+        faltan = [d for d in p.depende_de if d not in nombres]
+        if faltan:
+            raise ValueError(f"{p.script} depende de pasos que no estan en el pipeline: {faltan}")
+
+    # Deteccion de ciclos (orden topologico)
+    hechos: set[str] = set()
+    restantes = list(pasos)
+    while restantes:
+        listos = [p for p in restantes if all(d in hechos for d in p.depende_de)]
+        if not listos:
+            raise ValueError(f"Dependencias circulares entre: {[p.script for p in restantes]}")
+        hechos.update(p.script for p in listos)
+        restantes = [p for p in restantes if p.script not in hechos]
+    return pasos
+
+
+def _run_dag(pasos: list[Paso], ejecutar, max_workers: int, cancelar: threading.Event) -> None:
+    """Planificador: lanza (en el orden declarado) los pasos listos y sin bloqueos ocupados."""
+    max_workers = max(1, int(max_workers))
+    pendientes = {p.script: p for p in pasos}
+    hechos: set[str] = set()
+    ocupados: set[str] = set()
+    en_curso: dict = {}
+    error: BaseException | None = None
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="paso")
+    try:
+        while pendientes or en_curso:
+            if error is None:
+                for nombre, p in list(pendientes.items()):
+                    if len(en_curso) >= max_workers:
+                        break
+                    if all(d in hechos for d in p.depende_de) and not (set(p.bloqueos) & ocupados):
+                        del pendientes[nombre]
+                        ocupados.update(p.bloqueos)
+                        en_curso[pool.submit(ejecutar, p)] = p
+
+            if not en_curso:
+                break
+
+            listos, _ = wait(list(en_curso), return_when=FIRST_COMPLETED)
+            for fut in listos:
+                p = en_curso.pop(fut)
+                ocupados.difference_update(p.bloqueos)
+                try:
+                    fut.result()
+                    hechos.add(p.script)
+                except Exception as e:
+                    if error is None:
+                        error = e
+    except BaseException:
+        cancelar.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
+
+    if error is not None:
+        if pendientes:
+            print(f"[INFO] Pasos no ejecutados por el fallo: {', '.join(pendientes)}")
+        raise error
+
+
+def _run_paso(
+    paso: Paso,
+    base_dir: Path,
+    log_path: Path,
+    log_lock: threading.Lock,
+    cancelar: threading.Event,
+    echo_console: bool,
+    worker: Worker | None = None,
+    metrics_path: Path | None = None,
+    ejecucion: dict | None = None,
+    **kwargs,
+) -> None:
+    """
+    Ejecuta un paso escribiendo su salida en un log parcial propio, que se
+    vuelca entero al log del pipeline al terminar (sin mezclar pasos paralelos).
+    Con metrics_path, añade al historico el registro de metricas del paso.
+    """
+    py = base_dir / paso.script
+    part_path = log_path.with_name(f"{log_path.name}.{py.stem}.part")
+    part_path.unlink(missing_ok=True)
+    metrics_part = log_path.with_name(f"{log_path.name}.{py.stem}.metrics.part") if metrics_path else None
+    if metrics_part:
+        metrics_part.unlink(missing_ok=True)
+
+    _say(f"[RUN] {paso.script} {' '.join(paso.args)}".rstrip())
+    inicio = now_ts()
+    start = time.time()
+    resultado: dict = {}
+    try:
+        _run_step(
+            py=py,
+            log_path=part_path,
+            args=list(paso.args),
+            cancelar=cancelar,
+            echo_prefix=f"[{py.stem}] " if echo_console else None,
+            log_ref=log_path,
+            worker=worker,
+            metrics_part=metrics_part,
+            resultado=resultado,
+            **kwargs,
+        )
+    finally:
+        with log_lock:
+            try:
+                with log_path.open("a", encoding="utf-8") as f:
+                    f.write(part_path.read_text(encoding="utf-8", errors="ignore"))
+                part_path.unlink(missing_ok=True)
+            except Exception:
+                pass
+            if metrics_part:
+                _registrar_metricas(metrics_path, {
+                    **(ejecucion or {}),
+                    "tipo": "paso",
+                    "paso": paso.script,
+                    "estado": "ok" if resultado.get("exit") == 0 else "error",
+                    "inicio": inicio,
+                    "dur_s": round(time.time() - start, 1),
+                    **resultado,
+                    **pipeline_metrics.leer_parcial(metrics_part),
+                })
+                metrics_part.unlink(missing_ok=True)
+    _say(f"[OK]  {paso.script} ({time.time() - start:.1f}s)")
+
+
 def _run_step(
     py: Path,
     log_path: Path,
-    timeout_s: int,
+    timeout_s: int | None,
     retryable_prefixes: tuple[str, ...],
     max_attempts_retryable: int,
     sleep_between_retries_s: int,
     backoff_max_s: int,
+    args: list[str] | None = None,
+    cancelar: threading.Event | None = None,
+    echo_prefix: str | None = None,
+    log_ref: Path | None = None,
+    worker: Worker | None = None,
+    metrics_part: Path | None = None,
+    resultado: dict | None = None,
 ) -> None:
-    cmd = [sys.executable, "-X", "utf8", str(py)]
+    """
+    Ejecuta un paso con sus reintentos. Si se pasa resultado, deja en el los
+    intentos hechos y el ultimo exit code.
+    """
+    resultado = resultado if resultado is not None else {}
+    cmd = [sys.executable, "-X", "utf8", str(py), *(args or [])]
     attempts = max_attempts_retryable if _is_retryable(py.name, retryable_prefixes) else 1
 
     last_code = None
@@ -125,57 +373,138 @@ def _run_step(
             f.write(f"[{ts}] CMD: {' '.join(cmd)}\n")
             f.flush()
 
-            p = subprocess.Popen(
-                cmd,
-                cwd=str(py.parent),
-                stdout=f,
-                stderr=f,
-                text=True,
-                env=os.environ.copy(),
-            )
+            if worker is None:
+                p = subprocess.Popen(
+                    cmd,
+                    cwd=str(py.parent),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    encoding="utf-8",
+                    errors="replace",
+                    bufsize=1,
+                    env=_entorno_paso(metrics_part),
+                )
+                lector = threading.Thread(target=_pump_output, args=(p.stdout, f, echo_prefix), daemon=True)
+                lector.start()
+
+                def esperar() -> int:
+                    return _wait_process(p, timeout_s, cancelar)
+
+                def parar() -> None:
+                    _kill(p)
+                    lector.join()
+
+                def terminar() -> None:
+                    lector.join()
+            else:
+                f.write(f"[{ts}] WORKER: run() en proceso caliente (pid={worker.pid or 'nuevo'})\n")
+                f.flush()
+                eco = (lambda line: _say(f"{echo_prefix}{line}")) if echo_prefix is not None else None
+
+                def esperar() -> int:
+                    return worker.ejecutar(py, args or [], log_path, timeout_s, cancelar, eco, metricas=metrics_part)
+
+                parar = worker.matar
+
+                def terminar() -> None:
+                    pass
 
             try:
-                code = p.wait(timeout=timeout_s)
+                code = esperar()
             except subprocess.TimeoutExpired:
+                parar()
                 f.write(f"[{now_ts()}] TIMEOUT -> KILL {py.name}\n")
-                try:
-                    p.kill()
-                except Exception:
-                    pass
                 code = 124
                 last_error = "timeout"
+            except PasoCancelado:
+                parar()
+                f.write(f"[{now_ts()}] CANCELADO -> KILL {py.name}\n")
+                code = 130
+                last_error = "cancelado"
             except Exception as e:
+                parar()
                 f.write(f"[{now_ts()}] ERROR waiting process: {repr(e)}\n")
-                try:
-                    p.kill()
-                except Exception:
-                    pass
                 code = 125
                 last_error = repr(e)
+            else:
+                terminar()
 
             dur = time.time() - start
             f.write(f"[{now_ts()}] EXIT={code} | dur={dur:.1f}s | {py.name}\n")
 
         last_code = code
+        resultado.update(intentos=attempt, exit=code)
 
         if code == 0:
             return
 
-        if not _is_retryable(py.name, retryable_prefixes):
+        if code == 130 or not _is_retryable(py.name, retryable_prefixes):
             break
 
         if attempt < attempts:
             delay = min(sleep_between_retries_s * (2 ** (attempt - 1)), backoff_max_s)
-            time.sleep(delay)
+            if cancelar is not None:
+                if cancelar.wait(delay):
+                    break
+            else:
+                time.sleep(delay)
+
+    _say(
+        "\n" + "!" * 90 + "\n"
+        + f"[ERROR] Fallo: {py.name} (exit={last_code})\n"
+        + (f"[INFO] Motivo: {last_error}\n" if last_error else "")
+        + "[INFO] Ultimas lineas del log:\n\n"
+        + tail_file(log_path, n_lines=350) + "\n"
+        + "!" * 90 + "\n"
+    )
+    raise RuntimeError(f"Fallo {py.name} (exit={last_code}). Mira el log: {log_ref or log_path}")
+
+
+def _entorno_paso(metrics_part: Path | None) -> dict:
+    env = os.environ.copy()
+    env.pop(pipeline_metrics.ENV_PARCIAL, None)
+    if metrics_part:
+        env[pipeline_metrics.ENV_PARCIAL] = str(metrics_part)
+    return env
+
+
+def _registrar_metricas(metrics_path: Path, registro: dict) -> None:
+    """Las metricas nunca tumban el pipeline: si no se pueden escribir, se avisa."""
+    try:
+        pipeline_metrics.registrar(metrics_path, registro)
+    except Exception as e:
+        _say(f"[WARN] No se pudieron registrar metricas en {metrics_path.name}: {e!r}")
+
 
-    print("\n" + "!" * 90)
-    print(f"[ERROR] Fallo: {py.name} (exit={last_code})")
-    if last_error:
-        print(f"[INFO] Motivo: {last_error}")
-    print("[INFO] Ultimas lineas del log:\n")
-    print(tail_file(log_path, n_lines=350))
-    print("!" * 90 + "\n")
-    raise RuntimeError(f"Fallo {py.name} (exit={last_code}). Mira el log: {log_path}")
+def _pump_output(stream, f, echo_prefix: str | None) -> None:
+    """Copia la salida del hijo al log (y a consola con prefijo si echo_prefix)."""
+    for line in stream:
+        f.write(line)
+        f.flush()
+        if echo_prefix is not None:
+            _say(f"{echo_prefix}{line.rstrip(chr(10))}")
+    stream.close()
+
+
+def _wait_process(p: subprocess.Popen, timeout_s: int | None, cancelar: threading.Event | None) -> int:
+    deadline = None if timeout_s is None else time.monotonic() + timeout_s
+    while True:
+        try:
+            return p.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            if cancelar is not None and cancelar.is_set():
+                raise PasoCancelado()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(p.args, timeout_s)
+
+
+def _kill(p: subprocess.Popen) -> None:
+    try:
+        p.kill()
+        p.wait(timeout=30)
+    except Exception:
+        pass
 
 
 def _is_retryable(script_name: str, prefixes: tuple[str, ...]) -> bool:
@@ -233,6 +562,14 @@ def _acquire_lock(lock_path: Path, lock_timeout_s: int) -> None:
     lock_path.write_text(payload, encoding="utf-8")
 
 
+def _touch_lock(lock_path: Path) -> None:
+    """Refresca el lock al empezar cada paso (pipelines largos no lo dejan caducar)."""
+    try:
+        os.utime(lock_path)
+    except Exception:
+        pass
+
+
 def _release_lock(lock_path: Path) -> None:
     try:
         lock_path.unlink()
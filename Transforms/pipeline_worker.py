@@ -0,0 +1,262 @@
+# pipeline_worker.py
+# Ejecución de pasos del pipeline dentro de procesos "calientes".
+#
+# Lanzar cada paso con un intérprete nuevo obliga a reimportar pandas, requests,
+# openpyxl y pyarrow (varios segundos por paso). Aquí cada worker es un proceso
+# propio (multiprocessing "spawn", válido también en Windows) que importa esas
+# librerías una vez y luego ejecuta pasos uno detrás de otro:
+#   - el módulo del paso se ejecuta de nuevo en cada paso y se llama a su run();
+#   - stdout/stderr del paso van a su log (a nivel de descriptor);
+#   - timeout o cancelación -> se mata el worker y se arranca otro al pedirlo.
+# Los módulos auxiliares (staging, watermarks...) siguen cargados entre pasos, lo
+# que permite a staging pasar el último DataFrame en memoria al paso siguiente.
+import importlib.util
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import pipeline_metrics
+
+# Se importan al arrancar cada worker (los que falten se ignoran)
+PRECARGA = (
+    "numpy", "pandas", "requests", "openpyxl", "pyarrow.parquet", "dotenv",
+    "staging", "watermarks", "cloudia_http", "historico", "loader_schema", "supa_upload", "ids_cargados",
+)
+
+
+class PasoCancelado(Exception):
+    pass
+
+
+# =========================
+# Lado worker (proceso hijo)
+# =========================
+def _worker_main(conn, base_dir: str, precarga: Sequence[str]) -> None:
+    if base_dir not in sys.path:
+        sys.path.insert(0, base_dir)
+    for mod in precarga:
+        try:
+            importlib.import_module(mod)
+        except Exception:
+            pass
+
+    while True:
+        try:
+            tarea = conn.recv()
+        except EOFError:
+            return
+        if tarea is None:
+            return
+        conn.send({"code": _ejecutar_tarea(tarea)})
+
+
+def _exit_code(e: SystemExit) -> int:
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+def _ejecutar_tarea(tarea: Dict) -> int:
+    py = Path(tarea["script"])
+    args: List[str] = list(tarea["args"])
+    nombre = py.stem
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    prev_cwd = os.getcwd()
+    prev_argv = sys.argv
+    pipeline_metrics.iniciar(tarea.get("metricas"))
+    with open(tarea["log"], "a", encoding="utf-8") as log:
+        fd_out, fd_err = os.dup(1), os.dup(2)
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            os.chdir(py.parent)
+            sys.argv = [str(py), *args]
+            sys.modules.pop(nombre, None)
+            spec = importlib.util.spec_from_file_location(nombre, py)
+            mod = importlib.util.module_from_spec(spec)
+            sys.modules[nombre] = mod
+            spec.loader.exec_module(mod)
+
+            run = getattr(mod, "run", None)
+            if not callable(run):
+                raise RuntimeError(f"{py.name} no expone run()")
+            run(args) if args else run()
+            code = 0
+        except SystemExit as e:
+            code = _exit_code(e)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            pipeline_metrics.volcar()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(fd_out, 1)
+            os.dup2(fd_err, 2)
+            os.close(fd_out)
+            os.close(fd_err)
+            sys.modules.pop(nombre, None)
+            sys.argv = prev_argv
+            os.chdir(prev_cwd)
+    return code
+
+
+# =========================
+# Lado pipeline (proceso padre)
+# =========================
+class Worker:
+    """Un proceso caliente que ejecuta pasos de uno en uno."""
+
+    def __init__(self, base_dir: Path):
+        self.base_dir = base_dir
+        self.proc = None
+        self.conn = None
+        self.ejecutados: set = set()  # scripts ya ejecutados en este proceso
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.proc.pid if self.proc is not None and self.proc.is_alive() else None
+
+    def _arrancar(self) -> None:
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, hijo = ctx.Pipe()
+        self.proc = ctx.Process(
+            target=_worker_main,
+            args=(hijo, str(self.base_dir), PRECARGA),
+            name="pipeline-worker",
+            daemon=True,
+        )
+        self.proc.start()
+        hijo.close()
+        self.ejecutados = set()
+
+    def ejecutar(
+        self,
+        py: Path,
+        args: List[str],
+        log_path: Path,
+        timeout_s: Optional[int],
+        cancelar: Optional[threading.Event] = None,
+        eco: Optional[Callable[[str], None]] = None,
+        metricas: Optional[Path] = None,
+    ) -> int:
+        """
+        Ejecuta run() de py en el worker. Devuelve el exit code; lanza
+        subprocess.TimeoutExpired o PasoCancelado (el worker queda muerto).
+        Si se indica metricas, el worker añade ahí los contadores del paso.
+        """
+        if self.pid is None:
+            self._arrancar()
+        offset = log_path.stat().st_size if log_path.exists() else 0
+        self.conn.send({
+            "script": str(py),
+            "args": list(args),
+            "log": str(log_path),
+            "metricas": str(metricas) if metricas else None,
+        })
+
+        deadline = None if timeout_s is None else time.monotonic() + timeout_s
+        while True:
+            listo = self.conn.poll(0.5)
+            if eco is not None:
+                offset = _eco_nuevo(log_path, offset, eco)
+            if listo:
+                try:
+                    code = int(self.conn.recv()["code"])
+                except (EOFError, OSError):
+                    code = self._caido()
+                self.ejecutados.add(py.name)
+                if eco is not None:
+                    _eco_nuevo(log_path, offset, eco)
+                return code
+            if not self.proc.is_alive():
+                return self._caido()
+            if cancelar is not None and cancelar.is_set():
+                raise PasoCancelado()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(py.name, timeout_s)
+
+    def _caido(self) -> int:
+        """El worker murió a mitad de paso (crash nativo, os._exit...)."""
+        self.proc.join(timeout=5)
+        code = self.proc.exitcode
+        self.proc = None
+        return code if code not in (None, 0) else 1
+
+    def matar(self) -> None:
+        if self.proc is None:
+            return
+        try:
+            self.proc.kill()
+            self.proc.join(timeout=30)
+        except Exception:
+            pass
+        self.proc = None
+
+    def cerrar(self) -> None:
+        if self.proc is None:
+            return
+        try:
+            self.conn.send(None)
+            self.proc.join(timeout=10)
+        except Exception:
+            pass
+        self.matar()
+
+
+def _eco_nuevo(log_path: Path, offset: int, eco: Callable[[str], None]) -> int:
+    """Pasa a eco() las líneas completas añadidas al log desde offset."""
+    try:
+        with log_path.open("rb") as f:
+            f.seek(offset)
+            nuevo = f.read()
+    except OSError:
+        return offset
+    fin = nuevo.rfind(b"\n")
+    if fin < 0:
+        return offset
+    for line in nuevo[:fin].decode("utf-8", errors="replace").split("\n"):
+        eco(line)
+    return offset + fin + 1
+
+
+class WorkerPool:
+    """
+    Workers calientes compartidos por los pasos de un pipeline. Un paso se asigna
+    preferentemente al worker que ejecutó alguna de sus dependencias, para que
+    reciba en memoria lo que esta dejó en staging.
+    """
+
+    def __init__(self, n: int, base_dir: Path):
+        self._libres: List[Worker] = [Worker(base_dir) for _ in range(max(1, int(n)))]
+        self._todos = list(self._libres)
+        self._cond = threading.Condition()
+
+    def adquirir(self, preferidos: Sequence[str] = ()) -> Worker:
+        with self._cond:
+            while not self._libres:
+                self._cond.wait()
+            elegido = next((w for w in self._libres if w.ejecutados & set(preferidos)), None)
+            elegido = elegido or next((w for w in self._libres if w.pid is not None), self._libres[0])
+            self._libres.remove(elegido)
+            return elegido
+
+    def liberar(self, w: Worker) -> None:
+        with self._cond:
+            self._libres.append(w)
+            self._cond.notify()
+
+    def cerrar(self) -> None:
+        for w in self._todos:
+            w.cerrar()
@@ -0,0 +1,303 @@
+# staging.py
+# Staging en Parquet para el intercambio entre pasos del pipeline Transforms.
+#
+# Cada export escribe su salida tipada en:
+#   staging/<entidad>/fecha=<YYYY-MM-DD>/<modo>.parquet
+# (entidad: albaran | albaran_linea | clientes; modo: daily | from_date;
+#  fecha: día de ejecución en Europe/Madrid). Los loaders leen la última
+# partición de su modo por columnas, sin parsear XML.
+#
+# El Excel DAILY pasa a ser un render opcional para consulta humana.
+#
+# Los exports paginados escriben por trozos con Escritor (un row group por trozo),
+# así la descarga no acumula todas las filas en memoria; después recorren lo
+# escrito con iter_lotes() (histórico, marcas) en lugar de releerlo entero.
+#
+# En modo worker (pipeline_runner/pipeline_worker) varios pasos comparten proceso:
+# la última salida escrita de cada (entidad, modo) se guarda también en memoria y
+# leer_ultimo() la devuelve sin releer el Parquet mientras el fichero no cambie.
+#
+# Configuración por entorno:
+#   TRANSFORMS_RENDER_XLSX  (1 = seguir generando el DAILY .xlsx, por defecto 1)
+#   TRANSFORMS_RENDER_XLSX_MAX_FILAS  (por encima no se genera el .xlsx desde
+#                           un Parquet, por defecto 100000; 0 = sin límite)
+#   STAGING_KEEP_DIAS       (particiones que se conservan por entidad, por defecto 30)
+#   STAGING_CHUNK_FILAS     (filas por row group en Escritor, por defecto 5000)
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import pipeline_metrics
+
+
+# =========================
+# CONFIG
+# =========================
+BASE_DIR = Path(__file__).resolve().parent
+STAGING_DIR = BASE_DIR / "staging"
+TZ = ZoneInfo("Europe/Madrid")
+
+RENDER_XLSX = os.getenv("TRANSFORMS_RENDER_XLSX", "1").strip().lower() not in ("0", "false", "no")
+RENDER_XLSX_MAX_FILAS = int(os.getenv("TRANSFORMS_RENDER_XLSX_MAX_FILAS", "100000"))
+KEEP_DIAS = int(os.getenv("STAGING_KEEP_DIAS", "30"))
+CHUNK_FILAS = int(os.getenv("STAGING_CHUNK_FILAS", "5000"))
+
+# Tipos por entidad: int -> Int64, float -> float64, str -> string, bool -> boolean.
+# Las columnas no listadas se guardan como string.
+TIPOS: Dict[str, Dict[str, str]] = {
+    "albaran": {
+        "ALBARAN_ID": "int", "NUMERO": "int", "ID_EMPRESA": "int", "ID_TERCERO": "int",
+        "ID_TIPO_TERCERO": "int", "ID_DIRECCION": "int",
+        "IMPUESTO_ENVIO": "float", "BASE_GASTOS_ENVIO": "float", "BASE_IMPONIBLE": "float",
+        "TOTAL_IMPUESTOS": "float", "TOTAL_DESCUENTOS": "float", "TOTAL_RECARGOS": "float",
+        "TOTAL_GENERAL": "float",
+    },
+    "albaran_linea": {
+        "LINEA_ID": "int", "ALBARAN_ID": "int", "PRODUCTO_ID_ORIGEN": "int", "ALBARAN_NUMERO": "int",
+        "PRODUCTO_REF_ORIGEN": "int", "IDPRODUCTO": "int", "PEDIDO_LINEA_ID": "int", "PRODUCTO_ID": "int",
+        "CANTIDAD": "float", "PRECIO": "float", "DESCUENTO_PCT": "float", "PRECIO_TRAS_DTO": "float",
+        "SUBTOTAL": "float", "TASA_IMPUESTO": "float", "CUOTA_IMPUESTO": "float",
+        "TASA_RECARGO": "float", "CUOTA_RECARGO": "float",
+        "PRODUCTO_EXTERNO": "bool",
+    },
+    "clientes": {},
+}
+
+
+# (entidad, modo) -> (parquet, huella del fichero, DataFrame tipado)
+_MEMORIA: Dict[Tuple[str, str], Tuple[Path, Tuple[int, int], pd.DataFrame]] = {}
+
+
+# =========================
+# Tipado
+# =========================
+def _a_float(s: pd.Series) -> pd.Series:
+    """Como n_num: admite '1.234,56', espacios y NBSP; lo no numérico queda NaN."""
+    txt = s.astype("string").str.strip()
+    txt = txt.str.replace("\u00A0", "", regex=False).str.replace(" ", "", regex=False).str.replace("'", "", regex=False)
+    coma = txt.str.contains(",", regex=False).fillna(False)
+    txt = txt.where(~coma, txt.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    num = pd.to_numeric(txt, errors="coerce").astype("float64")
+    return num.where(np.isfinite(num))
+
+
+def _a_int(s: pd.Series) -> pd.Series:
+    """Como n_int: trunca '12.0' / 12.7 a 12; lo no numérico queda <NA>."""
+    num = pd.to_numeric(s.astype("string").str.strip(), errors="coerce")
+    num = num.where(np.isfinite(num))
+    return np.trunc(num).astype("Int64")
+
+
+def _a_bool(s: pd.Series) -> pd.Series:
+    txt = s.astype("string").str.strip().str.lower()
+    out = pd.Series(pd.NA, index=s.index, dtype="boolean")
+    out[txt.isin(["true", "t", "1", "si", "sí", "yes", "y", "verdadero"]).fillna(False)] = True
+    out[txt.isin(["false", "f", "0", "no", "n", "falso"]).fillna(False)] = False
+    return out
+
+
+def _nulo(v) -> bool:
+    try:
+        return v is None or bool(pd.isna(v))
+    except (TypeError, ValueError):
+        return False
+
+
+def _a_str(s: pd.Series) -> pd.Series:
+    return s.map(lambda v: None if _nulo(v) else str(v)).astype("string")
+
+
+def tipar(df: pd.DataFrame, entidad: str) -> pd.DataFrame:
+    tipos = TIPOS.get(entidad, {})
+    out = pd.DataFrame(index=df.index)
+    for c in df.columns:
+        t = tipos.get(c, "str")
+        s = df[c]
+        if t == "int":
+            out[c] = _a_int(s)
+        elif t == "float":
+            out[c] = _a_float(s)
+        elif t == "bool":
+            out[c] = _a_bool(s)
+        else:
+            out[c] = _a_str(s)
+    return out
+
+
+# =========================
+# Escritura / lectura
+# =========================
+def _hoy() -> str:
+    return datetime.now(TZ).date().isoformat()
+
+
+def _particiones(entidad: str) -> List[Path]:
+    base = STAGING_DIR / entidad
+    if not base.exists():
+        return []
+    return sorted(p for p in base.iterdir() if p.is_dir() and p.name.startswith("fecha="))
+
+
+def _podar(entidad: str) -> None:
+    for p in _particiones(entidad)[:-KEEP_DIAS] if KEEP_DIAS > 0 else []:
+        shutil.rmtree(p, ignore_errors=True)
+
+
+def _destino(entidad: str, modo: str, fecha: Optional[str]) -> Path:
+    destino = STAGING_DIR / entidad / f"fecha={fecha or _hoy()}" / f"{modo}.parquet"
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    return destino
+
+
+def escribir(entidad: str, modo: str, df: pd.DataFrame, *, fecha: Optional[str] = None) -> Path:
+    """Escribe df tipado en la partición del día (sobrescribe la del mismo modo)."""
+    destino = _destino(entidad, modo, fecha)
+    tmp = destino.with_suffix(".tmp.parquet")
+    tipado = tipar(df, entidad).reset_index(drop=True)
+    tipado.to_parquet(tmp, engine="pyarrow", index=False)
+    tmp.replace(destino)
+    _MEMORIA[(entidad, modo)] = (destino, _huella(destino), tipado)
+    _podar(entidad)
+    pipeline_metrics.sumar("filas_staging", len(tipado))
+    print(f"[OK] STAGING: {destino.relative_to(BASE_DIR)} | filas: {len(df)}")
+    return destino
+
+
+class Escritor:
+    """
+    Escritura por trozos en la partición del día (mismo destino y tipado que escribir()).
+    Las filas se acumulan hasta CHUNK_FILAS y se escriben como un row group; el
+    Parquet solo sustituye al anterior al cerrar sin errores. Usar como context manager:
+
+        with staging.Escritor("albaran", "daily", columnas) as esc:
+            for pagina in client.paginas(...):
+                esc.anadir([mapear(it) for it in pagina.items])
+        esc.path
+    """
+
+    def __init__(
+        self,
+        entidad: str,
+        modo: str,
+        columnas: List[str],
+        *,
+        fecha: Optional[str] = None,
+        chunk_filas: int = CHUNK_FILAS,
+    ):
+        self.entidad = entidad
+        self.modo = modo
+        self.columnas = list(columnas)
+        self.chunk_filas = max(1, int(chunk_filas))
+        self.filas = 0
+        self.path: Optional[Path] = None
+        self._destino = _destino(entidad, modo, fecha)
+        self._tmp = self._destino.with_suffix(".tmp.parquet")
+        self._buffer: List[Dict[str, Any]] = []
+        self._writer: Optional[pq.ParquetWriter] = None
+
+    def __enter__(self) -> "Escritor":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.cerrar()
+        else:
+            self.abortar()
+
+    def anadir(self, rows: List[Dict[str, Any]]) -> None:
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.chunk_filas:
+            self._volcar()
+
+    def _volcar(self) -> None:
+        if not self._buffer and self._writer is not None:
+            return
+        df = pd.DataFrame(self._buffer, columns=self.columnas)
+        self._buffer = []
+        tabla = pa.Table.from_pandas(tipar(df, self.entidad), preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._tmp, tabla.schema)
+        self._writer.write_table(tabla.cast(self._writer.schema))
+        self.filas += len(df)
+
+    def cerrar(self) -> Path:
+        if self.path is not None:
+            return self.path
+        self._volcar()
+        self._writer.close()
+        self._tmp.replace(self._destino)
+        self.path = self._destino
+        _MEMORIA.pop((self.entidad, self.modo), None)
+        _podar(self.entidad)
+        pipeline_metrics.sumar("filas_staging", self.filas)
+        print(f"[OK] STAGING: {self._destino.relative_to(BASE_DIR)} | filas: {self.filas}")
+        return self._destino
+
+    def abortar(self) -> None:
+        """Descarta lo escrito: el Parquet anterior (si lo hay) queda intacto."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._tmp.unlink(missing_ok=True)
+        self._buffer = []
+
+
+def _huella(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def ultimo_path(entidad: str, modo: str) -> Optional[Path]:
+    for p in reversed(_particiones(entidad)):
+        f = p / f"{modo}.parquet"
+        if f.exists():
+            return f
+    return None
+
+
+def leer_ultimo(entidad: str, modo: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """Última salida de (entidad, modo), o None si aún no hay staging."""
+    path = ultimo_path(entidad, modo)
+    if path is None:
+        return None
+    mem = _MEMORIA.get((entidad, modo))
+    if mem is not None and mem[0] == path and mem[1] == _huella(path):
+        print(f"[INFO] STAGING en memoria: {path.relative_to(BASE_DIR)}")
+        df = mem[2]
+        return (df[columns] if columns is not None else df).copy()
+    return pd.read_parquet(path, engine="pyarrow", columns=columns)
+
+
+def iter_lotes(path: Path, columns: Optional[List[str]] = None, filas: int = CHUNK_FILAS) -> Iterator[pd.DataFrame]:
+    """Recorre un Parquet de staging por lotes de hasta `filas` filas, sin cargarlo entero."""
+    pf = pq.ParquetFile(path)
+    for batch in pf.iter_batches(batch_size=max(1, int(filas)), columns=columns):
+        yield batch.to_pandas()
+
+
+def render_xlsx_parquet(path: Path, xlsx: Path, sheet: str, max_filas: int = RENDER_XLSX_MAX_FILAS) -> None:
+    """render_xlsx de un Parquet de staging; se omite si pasa de max_filas (0 = sin límite)."""
+    if not RENDER_XLSX:
+        return
+    filas = pq.ParquetFile(path).metadata.num_rows
+    if max_filas > 0 and filas > max_filas:
+        print(f"[INFO] Excel omitido: {xlsx.name} tendria {filas} filas (TRANSFORMS_RENDER_XLSX_MAX_FILAS={max_filas})")
+        return
+    render_xlsx(pd.read_parquet(path, engine="pyarrow"), xlsx, sheet)
+
+
+def render_xlsx(df: pd.DataFrame, path: Path, sheet: str) -> None:
+    """Render opcional del DAILY en Excel (TRANSFORMS_RENDER_XLSX)."""
+    if not RENDER_XLSX:
+        return
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet)
+    print(f"[OK] Excel: {path.name} | filas: {len(df)} | hoja: {sheet}")
@@ -0,0 +1,279 @@
+# supa_upload.py
+# Subida por lotes a Supabase (PostgREST) compartida por los loaders de Transforms.
+#
+# - Una Session con pool de conexiones: las conexiones TLS se reutilizan entre lotes.
+# - Hasta SUPA_UPLOAD_MAX_IN_FLIGHT lotes en vuelo a la vez.
+# - Tamaño de lote adaptativo: acotado por los bytes del cuerpo (SUPA_UPLOAD_MAX_BYTES)
+#   y ajustado con la latencia observada (crece si los lotes van sobrados respecto a
+#   SUPA_UPLOAD_OBJETIVO_S, se reduce si la superan).
+# - 413 / 408 / timeout / statement timeout (57014): el lote se parte en dos y se reenvía.
+# - 429/5xx: backoff compartido entre hilos (respeta Retry-After).
+# - Al terminar informa de filas/s por tabla.
+#
+# Con lotes en paralelo el orden entre lotes no está garantizado: subir(clave=...)
+# deja una sola fila por clave (gana la última), igual que el envío secuencial.
+#
+# Configuración por entorno:
+#   SUPA_UPLOAD_MAX_IN_FLIGHT  (lotes simultáneos, por defecto 4)
+#   SUPA_UPLOAD_MAX_BYTES      (bytes máximos por lote, por defecto 2000000)
+#   SUPA_UPLOAD_OBJETIVO_S     (latencia objetivo por lote en segundos, por defecto 3)
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import pipeline_metrics
+from cloudia_http import _BackoffCompartido, _retry_after_s
+
+
+# =========================
+# CONFIG
+# =========================
+MAX_IN_FLIGHT = int(os.getenv("SUPA_UPLOAD_MAX_IN_FLIGHT", "4"))
+MAX_BYTES = int(os.getenv("SUPA_UPLOAD_MAX_BYTES", "2000000"))
+OBJETIVO_S = float(os.getenv("SUPA_UPLOAD_OBJETIVO_S", "3"))
+
+REQUEST_TIMEOUT = 180
+MAX_RETRIES = 6
+BACKOFF_START = 2.0
+BACKOFF_MAX = 30.0
+
+MIN_FILAS_LOTE = 25
+MAX_FILAS_LOTE = 5000
+
+STATUS_OK = (200, 201, 204)
+STATUS_REINTENTO = (429, 500, 502, 503, 504)
+STATUS_PARTIR = (408, 413)
+
+
+# =========================
+# Helpers
+# =========================
+def _cuerpo(lote: List[Dict[str, Any]]) -> bytes:
+    return json.dumps(lote, ensure_ascii=False, allow_nan=False).encode("utf-8")
+
+
+def _es_statement_timeout(resp: requests.Response) -> bool:
+    return resp.status_code == 500 and "57014" in (resp.text or "")
+
+
+def ultimo_por_clave(rows: List[Dict[str, Any]], clave: str) -> List[Dict[str, Any]]:
+    """Una fila por clave (gana la última). Las filas sin clave se mantienen."""
+    por_clave: Dict[str, Dict[str, Any]] = {}
+    sin_clave: List[Dict[str, Any]] = []
+    for r in rows:
+        k = r.get(clave)
+        if k is None:
+            sin_clave.append(r)
+        else:
+            por_clave[str(k)] = r
+    return list(por_clave.values()) + sin_clave
+
+
+# =========================
+# Uploader
+# =========================
+class SupabaseUploader:
+    """POST concurrente por lotes contra un endpoint PostgREST. Usar como context manager."""
+
+    def __init__(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        *,
+        tabla: str,
+        etiqueta: str = "POST",
+        batch_rows: int = 500,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_bytes: int = MAX_BYTES,
+        objetivo_s: float = OBJETIVO_S,
+        timeout: float = REQUEST_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        reintentables: Iterable[int] = STATUS_REINTENTO,
+        preparar_lote: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None,
+    ):
+        self.url = url
+        self.headers = dict(headers)
+        self.tabla = tabla
+        self.etiqueta = etiqueta
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_bytes = max(1, int(max_bytes))
+        self.objetivo_s = float(objetivo_s)
+        self.timeout = timeout
+        self.max_retries = max(1, int(max_retries))
+        self.reintentables = set(reintentables)
+        self.preparar_lote = preparar_lote
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._backoff = _BackoffCompartido(BACKOFF_START, BACKOFF_MAX)
+        self._lock = threading.Lock()
+        self._filas_lote = min(MAX_FILAS_LOTE, max(MIN_FILAS_LOTE, int(batch_rows)))
+        self._partidos = 0
+        self._reintentos = 0
+
+    def __enter__(self) -> "SupabaseUploader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    # ---------- tamaño de lote ----------
+    def _preparar(self, filas: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], bytes]:
+        lote = self.preparar_lote(filas) if self.preparar_lote else filas
+        return lote, _cuerpo(lote)
+
+    def _siguiente_lote(self, rows: List[Dict[str, Any]], pos: int) -> Tuple[int, List[Dict[str, Any]], bytes]:
+        with self._lock:
+            n = self._filas_lote
+        lote, cuerpo = self._preparar(rows[pos:pos + n])
+        # Cota por bytes: se recorta proporcionalmente hasta caber
+        while len(cuerpo) > self.max_bytes and len(lote) > 1:
+            n = max(1, int(len(lote) * self.max_bytes / len(cuerpo) * 0.9))
+            lote, cuerpo = self._preparar(rows[pos:pos + n])
+            with self._lock:
+                self._filas_lote = max(MIN_FILAS_LOTE, min(self._filas_lote, n))
+        return len(lote), lote, cuerpo
+
+    def _ajustar(self, n: int, latencia: float) -> None:
+        with self._lock:
+            if latencia > self.objetivo_s:
+                self._filas_lote = max(MIN_FILAS_LOTE, int(self._filas_lote * self.objetivo_s / latencia))
+            elif latencia < self.objetivo_s / 2 and n >= self._filas_lote:
+                self._filas_lote = min(MAX_FILAS_LOTE, int(self._filas_lote * 1.5))
+
+    def _reducir(self, n: int) -> None:
+        with self._lock:
+            self._filas_lote = max(MIN_FILAS_LOTE, min(self._filas_lote, n))
+            self._partidos += 1
+
+    # ---------- envío ----------
+    def _partir(self, lote: List[Dict[str, Any]], motivo: str) -> int:
+        mitad = len(lote) // 2
+        print(f"   [WARN] {self.tabla}: {motivo} con {len(lote)} filas -> parto el lote en {mitad} + {len(lote) - mitad}")
+        self._reducir(mitad)
+        return self._enviar(*self._preparar(lote[:mitad])) + self._enviar(*self._preparar(lote[mitad:]))
+
+    def _enviar(self, lote: List[Dict[str, Any]], cuerpo: bytes) -> int:
+        """Envía un lote (partiéndolo si hace falta). Devuelve las filas enviadas."""
+        attempt = 0
+        while True:
+            attempt += 1
+            self._backoff.esperar()
+
+            retry_after = None
+            t0 = time.monotonic()
+            pipeline_metrics.sumar("bytes_enviados", len(cuerpo))
+            try:
+                resp = self.session.post(self.url, headers=self.headers, data=cuerpo, timeout=self.timeout)
+            except requests.exceptions.Timeout:
+                if len(lote) > 1:
+                    return self._partir(lote, f"timeout ({self.timeout}s)")
+                motivo = f"timeout ({self.timeout}s)"
+            except requests.exceptions.ConnectionError as e:
+                motivo = f"error de conexion: {e}"
+            else:
+                latencia = time.monotonic() - t0
+                if resp.status_code in STATUS_OK:
+                    self._backoff.exito()
+                    self._ajustar(len(lote), latencia)
+                    pipeline_metrics.sumar("filas_subidas", len(lote))
+                    return len(lote)
+
+                if resp.status_code in STATUS_PARTIR or _es_statement_timeout(resp):
+                    if len(lote) > 1:
+                        return self._partir(lote, f"HTTP {resp.status_code}")
+                    if resp.status_code == 413:
+                        raise RuntimeError(f"{self.etiqueta} HTTP 413 con una sola fila: {resp.text[:2000]}")
+
+                elif resp.status_code not in self.reintentables:
+                    raise RuntimeError(f"{self.etiqueta} HTTP {resp.status_code}: {resp.text[:2000]}")
+
+                motivo = f"HTTP {resp.status_code}"
+                retry_after = _retry_after_s(resp)
+
+            if attempt >= self.max_retries:
+                raise RuntimeError(f"Fallo {self.etiqueta} tras {self.max_retries} reintentos. Ultimo: {motivo}")
+
+            with self._lock:
+                self._reintentos += 1
+            pipeline_metrics.sumar("http_reintentos")
+            espera = self._backoff.fallo(retry_after)
+            print(f"   [WARN] {self.tabla}: {motivo} (intento {attempt}) -> reintento en {espera:.0f}s")
+
+    def subir(
+        self,
+        rows: List[Dict[str, Any]],
+        *,
+        clave: Optional[str] = None,
+        al_confirmar: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Sube rows en lotes concurrentes. Si se indica clave, antes deja una fila por
+        clave (gana la última). al_confirmar(lote) se llama en el hilo principal por
+        cada lote aceptado por la BD (p.ej. para checkpoints).
+        Devuelve el resumen con filas, segundos y filas/s.
+        """
+        if clave:
+            unicas = ultimo_por_clave(rows, clave)
+            if len(unicas) != len(rows):
+                print(f"[WARN] {self.tabla}: {len(rows) - len(unicas)} filas con {clave} repetido (gana la ultima)")
+            rows = unicas
+
+        total = len(rows)
+        enviadas = 0
+        n_lote = 0
+        pos = 0
+        t0 = time.monotonic()
+
+        pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="supa")
+        pendientes: Dict[Any, List[Dict[str, Any]]] = {}
+        try:
+            while pos < total or pendientes:
+                while pos < total and len(pendientes) < self.max_in_flight:
+                    n, lote, cuerpo = self._siguiente_lote(rows, pos)
+                    pos += n
+                    pendientes[pool.submit(self._enviar, lote, cuerpo)] = lote
+
+                hechos, _ = wait(list(pendientes), return_when=FIRST_COMPLETED)
+                for fut in hechos:
+                    lote = pendientes.pop(fut)
+                    enviadas += fut.result()
+                    n_lote += 1
+                    if al_confirmar is not None:
+                        al_confirmar(lote)
+                    rps = enviadas / max(time.monotonic() - t0, 1e-9)
+                    print(f"[OK]  Lote {n_lote} | {enviadas}/{total} | {rps:.0f} filas/s")
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
+
+        segundos = time.monotonic() - t0
+        resumen = {
+            "tabla": self.tabla,
+            "filas": enviadas,
+            "lotes": n_lote,
+            "partidos": self._partidos,
+            "reintentos": self._reintentos,
+            "segundos": round(segundos, 3),
+            "filas_s": round(enviadas / segundos, 1) if segundos > 0 else None,
+            "filas_lote_final": self._filas_lote,
+        }
+        print(
+            f"[OK] {self.tabla}: {enviadas} filas en {segundos:.1f}s "
+            f"({resumen['filas_s'] or 0:.0f} filas/s) | lotes: {n_lote} | partidos: {self._partidos} "
+            f"| reintentos: {self._reintentos} | lote final: {self._filas_lote} filas"
+        )
+        return resumen
@@ -0,0 +1,109 @@
+# sync_ventas_producto_diario.py
+# Mantiene el acumulado diario de ventas por producto y cliente (ventas_producto_diario)
+# después de las cargas del pipeline. Ver modules/sql/ventas_producto_diario.sql.
+#
+# Solo se recalculan los días que pueden haber cambiado, con la RPC
+# refrescar_ventas_producto_diario(desde, hasta, origenes):
+#   - albaran: desde la FECHA_ALBARAN más antigua del delta recién cargado (staging)
+#     hasta el día siguiente a la más reciente;
+#   - pedido: los últimos VENTAS_ROLLUP_DIAS_PEDIDO días hasta hoy, para avanzar el
+#     corte del acumulado (los de hoy los suma la consulta en vivo). Las altas,
+#     cambios y bajas de líneas de cualquier fecha ya acumulada las recalculan los
+#     triggers de pedido_linea/pedido en la base, así que esta ventana no limita
+#     qué ediciones se reflejan.
+# La RPC empieza siempre como tarde en el corte anterior del acumulado, así que
+# una pasada perdida o un delta que empieza después del corte no dejan días sin
+# acumular. La primera vez de cada origen recalcula toda la historia.
+#
+# Si la RPC aún no existe en la base, avisa y termina sin error.
+#
+# Uso: python sync_ventas_producto_diario.py [--modo daily|from_date]
+#
+# Configuración por entorno:
+#   VENTAS_ROLLUP_DIAS_PEDIDO  (días de pedidos que se recalculan en cada pasada, por defecto 7)
+import argparse
+import os
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import requests
+
+from supa_env import get_supabase_creds
+import pipeline_metrics
+import staging
+import watermarks
+
+# =========================
+# CONFIG
+# =========================
+URL_SUPABASE, SUPABASE_KEY = get_supabase_creds()
+
+RPC = "refrescar_ventas_producto_diario"
+RPC_URL = f"{URL_SUPABASE}/rest/v1/rpc/{RPC}"
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+}
+
+DIAS_PEDIDO = int(os.getenv("VENTAS_ROLLUP_DIAS_PEDIDO", "7"))
+TIMEOUT = 300
+TZ = ZoneInfo("Europe/Madrid")
+
+
+def _rango_albaran(modo: str) -> Optional[Tuple[date, date]]:
+    """[primer día, último día + 1) de las FECHA_ALBARAN del último delta en staging."""
+    df = staging.leer_ultimo("albaran", modo, columns=["FECHA_ALBARAN"])
+    if df is None or df.empty:
+        return None
+    fechas = sorted(f for f in df["FECHA_ALBARAN"].map(watermarks.fecha_iso).tolist() if f)
+    if not fechas:
+        return None
+    return date.fromisoformat(fechas[0]), date.fromisoformat(fechas[-1]) + timedelta(days=1)
+
+
+def refrescar(desde: date, hasta: date, origenes: List[str]) -> Optional[List[dict]]:
+    """Llama a la RPC; None si no existe en la base."""
+    resp = requests.post(
+        RPC_URL,
+        headers=HEADERS,
+        json={"p_desde": desde.isoformat(), "p_hasta": hasta.isoformat(), "p_origenes": origenes},
+        timeout=TIMEOUT,
+    )
+    if resp.status_code == 404:
+        return None
+    if resp.status_code not in (200, 201):
+        raise RuntimeError(f"RPC {RPC} HTTP {resp.status_code}: {resp.text[:2000]}")
+    return resp.json() or []
+
+
+def run(argv: Optional[List[str]] = None) -> None:
+    """Punto de entrada del paso (pipeline_runner, modo worker); argv como en la CLI."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modo", choices=("daily", "from_date"), default="daily")
+    args = parser.parse_args(argv)
+
+    hoy = datetime.now(TZ).date()
+    tramos = [(hoy - timedelta(days=DIAS_PEDIDO), hoy, ["pedido"])]
+    rango = _rango_albaran(args.modo)
+    if rango:
+        tramos.append((rango[0], rango[1], ["albaran"]))
+    else:
+        print(f"[INFO] Sin albaranes en staging ({args.modo}): no se recalcula el acumulado de albaranes")
+
+    for desde, hasta, origenes in tramos:
+        print(f"[INFO] Recalculando ventas_producto_diario {'/'.join(origenes)}: {desde} -> {hasta}")
+        res = refrescar(desde, hasta, origenes)
+        if res is None:
+            print(f"[WARN] No existe la RPC {RPC} en Supabase (ver modules/sql/ventas_producto_diario.sql). Se omite.")
+            return
+        for r in res:
+            desde_real = r.get("desde") or "inicio (primera vez)"
+            print(f"[OK] ventas_producto_diario {r.get('origen')}: {desde_real} -> {r.get('hasta')} | filas: {r.get('filas')}")
+            pipeline_metrics.sumar("rollup_filas", int(r.get("filas") or 0))
+
+
+if __name__ == "__main__":
+    run()
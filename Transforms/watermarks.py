@@ -0,0 +1,176 @@
+# watermarks.py
+# Marcas de agua por entidad (albaran, albaran_linea, clientes) para la extracción incremental.
+#
+# Cada entidad guarda la fecha y el id más altos YA CARGADOS en Supabase:
+#   - el export lee la marca y pide solo el delta (con un día de solape),
+#     y deja la marca del delta descargado como "pendiente";
+#   - el loader, al terminar sin errores, confirma la pendiente.
+# Así, si la carga falla, la siguiente ejecución vuelve a pedir el mismo delta.
+#
+# También recuerda qué fichero DAILY ya se volcó al GLOBAL, para no volcarlo dos veces.
+#
+# Varios pasos del pipeline pueden correr a la vez (pipeline_runner): cada
+# lectura-modificación-escritura se hace con un lock de fichero entre procesos.
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+
+# =========================
+# CONFIG
+# =========================
+BASE_DIR = Path(__file__).resolve().parent
+WATERMARKS_FILE = BASE_DIR / "pipeline_watermarks.json"
+LOCK_STALE_S = 120  # un lock más viejo que esto se considera abandonado
+
+ENTIDADES = ("albaran", "albaran_linea", "clientes")
+SOLAPE_DIAS = 1  # se vuelve a pedir el último día cargado (documentos editados tarde)
+
+
+# =========================
+# Helpers
+# =========================
+def _vacia() -> Dict[str, Any]:
+    return {"fecha": None, "max_id": None, "pendiente": None, "daily_en_global": None, "actualizado": None}
+
+
+def _leer_todo() -> Dict[str, Dict[str, Any]]:
+    if not WATERMARKS_FILE.exists():
+        return {}
+    try:
+        data = json.loads(WATERMARKS_FILE.read_text(encoding="utf-8"))
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        print(f"[WARN] {WATERMARKS_FILE.name} ilegible. Se ignora (extraccion completa).")
+        return {}
+
+
+def _guardar_todo(data: Dict[str, Dict[str, Any]]) -> None:
+    tmp = WATERMARKS_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(WATERMARKS_FILE)
+
+
+@contextmanager
+def _bloqueo() -> Iterator[None]:
+    lock = WATERMARKS_FILE.with_suffix(".lock")
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock.stat().st_mtime > LOCK_STALE_S:
+                    lock.unlink(missing_ok=True)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        lock.unlink(missing_ok=True)
+
+
+def _entidad(data: Dict[str, Dict[str, Any]], entidad: str) -> Dict[str, Any]:
+    if entidad not in ENTIDADES:
+        raise ValueError(f"Entidad sin marca de agua: {entidad}")
+    wm = _vacia()
+    wm.update(data.get(entidad) or {})
+    data[entidad] = wm
+    return wm
+
+
+def _max_fecha(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    vals = [v for v in (a, b) if v]
+    return max(vals) if vals else None
+
+
+def _max_id(a: Any, b: Any) -> Any:
+    vals = [v for v in (a, b) if v is not None]
+    if not vals:
+        return None
+    try:
+        return max(vals, key=lambda v: int(float(v)))
+    except (TypeError, ValueError):
+        return max(vals, key=str)
+
+
+def fecha_iso(v: Any) -> Optional[str]:
+    """'2025-03-01T10:00:00Z', datetime, date o Timestamp -> '2025-03-01'."""
+    if v is None:
+        return None
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()[:10]
+    s = str(v).strip()
+    if not s or s.upper() in ("NAN", "NAT", "NONE"):
+        return None
+    return s[:10]
+
+
+def _huella_fichero(path: Path) -> Optional[str]:
+    if not path.exists():
+        return None
+    st = path.stat()
+    return f"{path.name}:{st.st_size}:{st.st_mtime_ns}"
+
+
+# =========================
+# API
+# =========================
+def leer(entidad: str) -> Dict[str, Any]:
+    return dict(_entidad(_leer_todo(), entidad))
+
+
+def fecha_desde(entidad: str, solape_dias: int = SOLAPE_DIAS) -> Optional[date]:
+    """Fecha desde la que pedir el delta, o None si la entidad nunca se ha cargado."""
+    fecha = leer(entidad).get("fecha")
+    if not fecha:
+        return None
+    return date.fromisoformat(fecha) - timedelta(days=solape_dias)
+
+
+def proponer(entidad: str, *, fecha: Optional[str] = None, max_id: Any = None) -> None:
+    """El export deja la marca del delta descargado a la espera de que el loader la confirme."""
+    with _bloqueo():
+        data = _leer_todo()
+        wm = _entidad(data, entidad)
+        previa = wm.get("pendiente") or {}
+        wm["pendiente"] = {
+            "fecha": _max_fecha(previa.get("fecha"), fecha_iso(fecha)),
+            "max_id": _max_id(previa.get("max_id"), max_id),
+        }
+        _guardar_todo(data)
+    print(f"[INFO] Marca de agua pendiente ({entidad}): {wm['pendiente']}")
+
+
+def confirmar(entidad: str) -> None:
+    """El loader confirma la marca pendiente tras cargar sin errores. Nunca retrocede."""
+    with _bloqueo():
+        data = _leer_todo()
+        wm = _entidad(data, entidad)
+        pendiente = wm.get("pendiente")
+        if not pendiente:
+            return
+        wm["fecha"] = _max_fecha(wm.get("fecha"), pendiente.get("fecha"))
+        wm["max_id"] = _max_id(wm.get("max_id"), pendiente.get("max_id"))
+        wm["pendiente"] = None
+        wm["actualizado"] = datetime.now().isoformat(timespec="seconds")
+        _guardar_todo(data)
+    print(f"[OK] Marca de agua ({entidad}): fecha={wm['fecha']} | max_id={wm['max_id']}")
+
+
+def daily_ya_volcado(entidad: str, daily_path: Path) -> bool:
+    huella = _huella_fichero(daily_path)
+    return huella is not None and leer(entidad).get("daily_en_global") == huella
+
+
+def marcar_daily_volcado(entidad: str, daily_path: Path) -> None:
+    with _bloqueo():
+        data = _leer_todo()
+        _entidad(data, entidad)["daily_en_global"] = _huella_fichero(daily_path)
+        _guardar_todo(data)
@@ -0,0 +1,227 @@
+# ======================================================
+# 🌐 CLIENTE HTTP COMPARTIDO (FastAPI) — EnteNova Gnosis
+# ======================================================
+# Una sola requests.Session por proceso para todas las llamadas de la UI a la
+# API: conexiones keep-alive reutilizadas (pool), gzip, timeouts por defecto y
+# un histograma de latencias por endpoint (latencias()).
+#
+# La base de la API (get_api_base) se resuelve en cada llamada: puede venir de
+# st.session_state["ORBE_API_URL"], que es de cada sesión, así que no se guarda
+# a nivel de proceso (lo compartido es solo el pool de conexiones).
+#
+# Uso: api_client.get("/api/pedidos", params=...) devuelve el requests.Response
+# de siempre, así que _handle / raise_for_status / requests.HTTPError no cambian.
+#
+# Las páginas que necesitan varias lecturas independientes las declaran juntas
+# con en_paralelo({...}): se lanzan a la vez y la página espera lo que tarde la
+# más lenta, no la suma.
+#
+# Configuración por entorno:
+#   ORBE_API_POOL            (conexiones máximas por host, por defecto 20)
+#   ORBE_API_TIMEOUT_S       (timeout de lectura por defecto, 20)
+#   ORBE_API_CONNECT_TIMEOUT (timeout de conexión, 5)
+#   ORBE_API_PARALELO        (hilos para en_paralelo, por defecto 8)
+
+import bisect
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from modules.api_base import get_api_base
+
+
+POOL_SIZE = int(os.getenv("ORBE_API_POOL", "20"))
+TIMEOUT_S = float(os.getenv("ORBE_API_TIMEOUT_S", "20"))
+CONNECT_TIMEOUT_S = float(os.getenv("ORBE_API_CONNECT_TIMEOUT", "5"))
+PARALELO = int(os.getenv("ORBE_API_PARALELO", "8"))
+
+# Límites superiores (ms) de los tramos del histograma; el último tramo es "más"
+TRAMOS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_latencias: Dict[str, Dict[str, Any]] = {}
+_pool: Optional[ThreadPoolExecutor] = None
+
+# /api/pedidos/123/lineas/45 -> /api/pedidos/{id}/lineas/{id}
+_RE_ID = re.compile(r"/\d+(?=/|$)")
+
+
+def _get_session() -> requests.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            s.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip, deflate"})
+            _session = s
+        return _session
+
+
+def base_url() -> str:
+    """Base de la API de la sesión actual (secrets, entorno o session_state)."""
+    return str(get_api_base()).rstrip("/")
+
+
+def reset() -> None:
+    """Cierra el pool de conexiones (se recrea en la siguiente llamada)."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def _endpoint(method: str, url: str) -> str:
+    path = urlsplit(url).path or "/"
+    return f"{method.upper()} {_RE_ID.sub('/{id}', path)}"
+
+
+def _anotar(endpoint: str, ms: float, error: bool) -> None:
+    with _lock:
+        h = _latencias.get(endpoint)
+        if h is None:
+            h = _latencias[endpoint] = {
+                "llamadas": 0, "errores": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "tramos": [0] * (len(TRAMOS_MS) + 1),
+            }
+        h["llamadas"] += 1
+        h["errores"] += int(error)
+        h["total_ms"] += ms
+        h["max_ms"] = max(h["max_ms"], ms)
+        h["tramos"][bisect.bisect_left(TRAMOS_MS, ms)] += 1
+
+
+def request(
+    method: str,
+    path: str,
+    *,
+    params: Optional[dict] = None,
+    json: Any = None,
+    timeout: Union[float, Tuple[float, float], None] = None,
+) -> requests.Response:
+    """Llamada a la API con la sesión compartida. path relativo a la base o URL completa."""
+    url = path if path.startswith(("http://", "https://")) else f"{base_url()}{path}"
+    if timeout is None:
+        timeout = TIMEOUT_S
+    if not isinstance(timeout, tuple):
+        timeout = (min(CONNECT_TIMEOUT_S, float(timeout)), float(timeout))
+
+    t0 = time.perf_counter()
+    error = True
+    try:
+        resp = _get_session().request(method, url, params=params, json=json, timeout=timeout)
+        error = resp.status_code >= 500
+        return resp
+    finally:
+        _anotar(_endpoint(method, url), (time.perf_counter() - t0) * 1000, error)
+
+
+def get(path: str, **kwargs) -> requests.Response:
+    return request("GET", path, **kwargs)
+
+
+def post(path: str, **kwargs) -> requests.Response:
+    return request("POST", path, **kwargs)
+
+
+def put(path: str, **kwargs) -> requests.Response:
+    return request("PUT", path, **kwargs)
+
+
+def patch(path: str, **kwargs) -> requests.Response:
+    return request("PATCH", path, **kwargs)
+
+
+def delete(path: str, **kwargs) -> requests.Response:
+    return request("DELETE", path, **kwargs)
+
+
+# =========================
+# Lecturas en paralelo
+# =========================
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(1, PARALELO), thread_name_prefix="orbe-api")
+        return _pool
+
+
+def _con_contexto(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """Pasa el contexto de Streamlit al hilo (st.cache_data, session_state)."""
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    except ImportError:
+        return fn
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return fn
+
+    def _tarea():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+
+    return _tarea
+
+
+def en_paralelo(tareas: Dict[str, Callable[[], Any]]) -> Dict[str, "Future[Any]"]:
+    """
+    Lanza a la vez las lecturas independientes de una página.
+    Devuelve {nombre: Future}; .result() da el valor o relanza el error de esa
+    lectura, así cada bloque de la página mantiene su propio try/except.
+    Las tareas no deben pintar nada (st.*): solo devolver datos.
+    """
+    pool = _get_pool()
+    return {nombre: pool.submit(_con_contexto(fn)) for nombre, fn in tareas.items()}
+
+
+# =========================
+# Latencias
+# =========================
+def _percentil(tramos: List[int], n: int, q: float) -> float:
+    """Percentil aproximado: límite superior del tramo donde cae."""
+    objetivo = q * n
+    acumulado = 0
+    for i, c in enumerate(tramos):
+        acumulado += c
+        if acumulado >= objetivo:
+            return float(TRAMOS_MS[i]) if i < len(TRAMOS_MS) else float("inf")
+    return float("inf")
+
+
+def latencias() -> List[Dict[str, Any]]:
+    """Histograma de latencias por endpoint (ordenado por tiempo total)."""
+    with _lock:
+        copia = {k: {**v, "tramos": list(v["tramos"])} for k, v in _latencias.items()}
+    res = []
+    for endpoint, h in copia.items():
+        n = h["llamadas"]
+        fila = {
+            "endpoint": endpoint,
+            "llamadas": n,
+            "errores": h["errores"],
+            "media_ms": round(h["total_ms"] / n, 1) if n else 0.0,
+            "p50_ms": _percentil(h["tramos"], n, 0.50),
+            "p95_ms": _percentil(h["tramos"], n, 0.95),
+            "max_ms": round(h["max_ms"], 1),
+            "total_ms": round(h["total_ms"], 1),
+        }
+        etiquetas = [f"<={t}ms" for t in TRAMOS_MS] + [f">{TRAMOS_MS[-1]}ms"]
+        fila.update(dict(zip(etiquetas, h["tramos"])))
+        res.append(fila)
+    return sorted(res, key=lambda f: f["total_ms"], reverse=True)
+
+
+def reset_latencias() -> None:
+    with _lock:
+        _latencias.clear()
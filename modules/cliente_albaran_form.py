@@ -1,8 +1,7 @@
-import requests
+from modules import api_client
 import streamlit as st
 from datetime import date
 
-from modules.api_base import get_api_base
 
 
 def _safe(v, d="-"):
@@ -10,7 +9,7 @@ def _safe(v, d="-"):
 
 
 def _api_get(path: str, params: dict | None = None):
-    r = requests.get(f"{get_api_base()}{path}", params=params, timeout=20)
+    r = api_client.get(path, params=params, timeout=20)
     r.raise_for_status()
     return r.json()
 
@@ -2,8 +2,8 @@ import os
 import re
 from typing import Any, Dict, List, Optional
 
-import requests
 import streamlit as st
+from modules import api_client, data_cache
 from modules.api_base import get_api_base
 
 
@@ -13,7 +13,7 @@ def api_base() -> str:
 
 def api_get(path: str, params: Optional[dict] = None):
     try:
-        r = requests.get(f"{api_base()}{path}", params=params, timeout=20)
+        r = api_client.get(path, params=params, timeout=20)
         r.raise_for_status()
         return r.json()
     except Exception as e:
@@ -23,8 +23,9 @@ def api_get(path: str, params: Optional[dict] = None):
 
 def api_post(path: str, payload: Optional[dict] = None):
     try:
-        r = requests.post(f"{api_base()}{path}", json=payload, timeout=20)
+        r = api_client.post(path, json=payload, timeout=20)
         r.raise_for_status()
+        data_cache.emitir("cliente")
         return r.json()
     except Exception as e:
         st.error(f"Error API: {e}")
@@ -33,8 +34,9 @@ def api_post(path: str, payload: Optional[dict] = None):
 
 def api_put(path: str, payload: dict):
     try:
-        r = requests.put(f"{api_base()}{path}", json=payload, timeout=20)
+        r = api_client.put(path, json=payload, timeout=20)
         r.raise_for_status()
+        data_cache.emitir("cliente")
         return r.json()
     except Exception as e:
         st.error(f"Error API: {e}")
@@ -43,8 +45,9 @@ def api_put(path: str, payload: dict):
 
 def api_delete(path: str):
     try:
-        r = requests.delete(f"{api_base()}{path}", timeout=20)
+        r = api_client.delete(path, timeout=20)
         r.raise_for_status()
+        data_cache.emitir("cliente")
         return r.json()
     except Exception as e:
         st.error(f"Error API: {e}")
@@ -2,9 +2,10 @@ import os
 import math
 from typing import Any, Dict, List, Optional
 
-import requests
 import streamlit as st
+from modules import api_client, data_cache
 from modules.api_base import get_api_base
+from modules.precio_cache import invalidar_cliente_ctx
 
 
 def api_base() -> str:
@@ -13,7 +14,7 @@ def api_base() -> str:
 
 def api_get(path: str, params: Optional[dict] = None):
     try:
-        r = requests.get(f"{api_base()}{path}", params=params, timeout=20)
+        r = api_client.get(path, params=params, timeout=20)
         r.raise_for_status()
         return r.json()
     except Exception as e:
@@ -23,8 +24,9 @@ def api_get(path: str, params: Optional[dict] = None):
 
 def api_post(path: str, payload: Optional[dict] = None):
     try:
-        r = requests.post(f"{api_base()}{path}", json=payload, timeout=20)
+        r = api_client.post(path, json=payload, timeout=20)
         r.raise_for_status()
+        data_cache.emitir("cliente")
         return r.json()
     except Exception as e:
         st.error(f"Error API: {e}")
@@ -33,8 +35,9 @@ def api_post(path: str, payload: Optional[dict] = None):
 
 def api_put(path: str, payload: dict):
     try:
-        r = requests.put(f"{api_base()}{path}", json=payload, timeout=20)
+        r = api_client.put(path, json=payload, timeout=20)
         r.raise_for_status()
+        data_cache.emitir("cliente")
         return r.json()
     except Exception as e:
         st.error(f"Error API: {e}")
@@ -43,8 +46,9 @@ def api_put(path: str, payload: dict):
 
 def api_delete(path: str):
     try:
-        r = requests.delete(f"{api_base()}{path}", timeout=20)
+        r = api_client.delete(path, timeout=20)
         r.raise_for_status()
+        data_cache.emitir("cliente")
         return r.json()
     except Exception as e:
         st.error(f"Error API: {e}")
@@ -136,6 +140,7 @@ def render_direccion_form(clienteid: int, key_prefix: str = ""):
         with c2:
             if st.button("Eliminar", key=f"{kp}del_dir_{dir_id}", width="stretch"):
                 api_delete(f"/api/clientes/{clienteid}/direcciones/{dir_id}")
+                invalidar_cliente_ctx(clienteid)
                 st.toast("Direccion eliminada.")
                 st.rerun()
 
@@ -240,11 +245,13 @@ def _direccion_editor(
             else:
                 api_put(f"/api/clientes/{clienteid}/direcciones/{dir_id}", payload)
                 st.toast("Direccion guardada.")
+            invalidar_cliente_ctx(clienteid)
             st.rerun()
 
     with c2:
         if not is_new:
             if st.button("Eliminar", key=f"{prefix}_delete", width="stretch"):
                 api_delete(f"/api/clientes/{clienteid}/direcciones/{dir_id}")
+                invalidar_cliente_ctx(clienteid)
                 st.toast("Direccion eliminada.")
                 st.rerun()
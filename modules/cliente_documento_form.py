@@ -1,17 +1,16 @@
-import requests
+from modules import api_client
 import streamlit as st
 
-from modules.api_base import get_api_base
 
 
 def _api_get(path: str, params: dict | None = None):
-    r = requests.get(f"{get_api_base()}{path}", params=params, timeout=20)
+    r = api_client.get(path, params=params, timeout=20)
     r.raise_for_status()
     return r.json()
 
 
 def _api_post(path: str, payload: dict):
-    r = requests.post(f"{get_api_base()}{path}", json=payload, timeout=20)
+    r = api_client.post(path, json=payload, timeout=20)
     r.raise_for_status()
     return r.json()
 
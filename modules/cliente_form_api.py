@@ -2,27 +2,24 @@ import os
 import re
 import requests
 import streamlit as st
-from modules.api_base import get_api_base
-
-
-def _api_base() -> str:
-    return get_api_base()
+from modules import api_client, data_cache
+from modules.precio_cache import invalidar_cliente_ctx
 
 
 def _api_get(path: str, params=None):
-    r = requests.get(f"{_api_base()}{path}", params=params, timeout=25)
+    r = api_client.get(path, params=params, timeout=25)
     r.raise_for_status()
     return r.json()
 
 
 def _api_post(path: str, json=None):
-    r = requests.post(f"{_api_base()}{path}", json=json, timeout=40)
+    r = api_client.post(path, json=json, timeout=40)
     r.raise_for_status()
     return r.json()
 
 
 def _api_put(path: str, json=None):
-    r = requests.put(f"{_api_base()}{path}", json=json, timeout=40)
+    r = api_client.put(path, json=json, timeout=40)
     r.raise_for_status()
     return r.json()
 
@@ -34,7 +31,7 @@ def _init_value(key: str, value):
 
 def _buscar_postal(cp: str) -> list[dict]:
     try:
-        r = requests.get(f"{_api_base()}/api/postal/buscar", params={"cp": cp}, timeout=15)
+        r = api_client.get("/api/postal/buscar", params={"cp": cp}, timeout=15)
         r.raise_for_status()
         return r.json() or []
     except Exception:
@@ -298,6 +295,9 @@ def render_cliente_form(modo: str = "cliente"):
                     if direcciones:
                         body["direcciones"] = direcciones
                     res = _api_post("/api/clientes", json=body)
+            if is_edit:
+                invalidar_cliente_ctx(cliente_id)
+            data_cache.emitir("cliente")
             st.toast(res.get("mensaje", "Guardado"), icon="OK")
             if not is_edit:
                 st.session_state["cliente_actual"] = res.get("clienteid")
@@ -8,7 +8,6 @@ from datetime import date
 import pandas as pd
 
 
-import requests
 
 
 import streamlit as st
@@ -19,6 +18,7 @@ import streamlit as st
 
 
 
+from modules import api_client, data_cache
 from modules.orbe_theme import apply_orbe_theme
 from modules.api_base import get_api_base
 
@@ -104,7 +104,7 @@ def _safe(v, d: str = "-"):
     return v if v not in (None, "", "null") else d
 
 
-@st.cache_data(ttl=900)
+@data_cache.cacheado("ventas", ttl_s=900)
 def _cliente_sales_year(clienteid: int, year: int) -> tuple[int, float]:
     base = _api_base()
     start = date(year, 1, 1).isoformat()
@@ -210,7 +210,7 @@ def _api_get(path: str, params: Optional[dict] = None, show_error: bool = True)
     try:
 
 
-        r = requests.get(f"{_api_base()}{path}", params=params, timeout=20)
+        r = api_client.get(path, params=params, timeout=20)
 
 
         r.raise_for_status()
@@ -229,9 +229,13 @@ def _api_get(path: str, params: Optional[dict] = None, show_error: bool = True)
         return {}
 
 
-@st.cache_data(ttl=60)
 def _api_get_cached(path: str, params: Optional[dict] = None) -> dict:
-    return _api_get(path, params=params, show_error=False)
+    return data_cache.obtener(
+        data_cache.espacio_api(path),
+        (path, params),
+        lambda: _api_get(path, params=params, show_error=False),
+        ttl_s=60,
+    )
 
 
 def _clear_filters():
@@ -286,11 +290,10 @@ def _on_filter_change():
     st.session_state["cli_page"] = 1
 
 
-@st.cache_data(ttl=120)
+@data_cache.cacheado("clientes", ttl_s=120)
 def _fetch_cliente_detalle_cached(clienteid: int) -> dict:
-    base = _api_base()
     try:
-        res = requests.get(f"{base}/api/clientes/{clienteid}", timeout=15)
+        res = api_client.get(f"/api/clientes/{clienteid}", timeout=15)
         res.raise_for_status()
         return res.json()
     except Exception as e:
@@ -435,10 +438,10 @@ def _render_compare_panel(main_clienteid: int):
         key=f"cmp_layout_{main_clienteid}",
     )
     entries = [{"id": main_clienteid, "label": "Cliente actual"}] + compare_items
-    payloads = []
-    for item in entries:
-        data = _fetch_cliente_detalle(int(item["id"]))
-        payloads.append((item, data))
+    detalles = api_client.en_paralelo(
+        {str(item["id"]): (lambda cid=int(item["id"]): _fetch_cliente_detalle(cid)) for item in entries}
+    )
+    payloads = [(item, detalles[str(item["id"])].result()) for item in entries]
 
     if layout == "Tabla":
         rows = [
@@ -547,7 +550,12 @@ def render_cliente_lista(API_URL: str):
     for k, v in defaults.items():
         st.session_state.setdefault(k, v)
 
-    cli_catalogos = _api_get_cached("/api/clientes/catalogos")
+    # Lecturas independientes de la cabecera de la página: a la vez
+    lecturas = api_client.en_paralelo({
+        "catalogos": lambda: _api_get_cached("/api/clientes/catalogos"),
+        "top_pres": lambda: _api_get_cached("/api/presupuestos/top-clientes", params={"limit": 5}),
+    })
+    cli_catalogos = lecturas["catalogos"].result()
     grupos = {c["label"]: c["id"] for c in cli_catalogos.get("grupos", [])}
 
     c1, c2, c3, c4, c5 = st.columns([3, 1.2, 1, 1, 1])
@@ -577,7 +585,7 @@ def render_cliente_lista(API_URL: str):
     with c5:
         st.button("Limpiar filtros", on_click=_clear_filters)
 
-    top_pres = _api_get_cached("/api/presupuestos/top-clientes", params={"limit": 5})
+    top_pres = lecturas["top_pres"].result()
     top_pres_items = top_pres.get("data") or []
     if top_pres_items:
         st.caption("Top clientes (presupuestos)")
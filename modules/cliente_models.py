@@ -1,6 +1,8 @@
 import streamlit as st
 from typing import Dict, Any, Optional, List
 
+from modules import data_cache
+
 
 # =========================
 # Helpers comunes
@@ -27,7 +29,7 @@ def _as_options(
 # LOADERS (cacheados)
 # Nota: usar parámetro _supabase para evitar errores de cache hash.
 # =========================
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def load_estados_cliente(_supabase) -> Dict[str, Any]:
     try:
         res = (
@@ -43,7 +45,7 @@ def load_estados_cliente(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def load_categorias(_supabase) -> Dict[str, Any]:
     try:
         res = (
@@ -59,7 +61,7 @@ def load_categorias(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def load_grupos(_supabase) -> Dict[str, Any]:
     try:
         res = (
@@ -75,7 +77,7 @@ def load_grupos(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def load_trabajadores(_supabase) -> Dict[str, Any]:
     try:
         res = (
@@ -101,7 +103,7 @@ def load_trabajadores(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def load_formas_pago(_supabase) -> Dict[str, Any]:
     try:
         res = (
@@ -120,7 +122,7 @@ def load_formas_pago(_supabase) -> Dict[str, Any]:
 # =========================
 # LOOKUPS (id -> etiqueta)
 # =========================
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def get_estado_label(eid: Optional[int], _supabase) -> str:
     if not eid:
         return "-"
@@ -131,7 +133,7 @@ def get_estado_label(eid: Optional[int], _supabase) -> str:
     return "-"
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def get_categoria_label(cid: Optional[int], _supabase) -> str:
     if not cid:
         return "-"
@@ -142,7 +144,7 @@ def get_categoria_label(cid: Optional[int], _supabase) -> str:
     return "-"
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def get_grupo_label(gid: Optional[int], _supabase) -> str:
     if not gid:
         return "-"
@@ -153,7 +155,7 @@ def get_grupo_label(gid: Optional[int], _supabase) -> str:
     return "-"
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def get_formapago_label(fid: Optional[int], _supabase) -> str:
     if not fid:
         return "-"
@@ -164,7 +166,7 @@ def get_formapago_label(fid: Optional[int], _supabase) -> str:
     return "-"
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def get_trabajador_label(tid: Optional[int], _supabase) -> str:
     if not tid:
         return "-"
@@ -1,20 +1,13 @@
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
-import requests
+from modules import api_client
 import streamlit as st
 
 
-def api_base() -> str:
-    try:
-        return st.secrets["ORBE_API_URL"]  # type: ignore[attr-defined]
-    except Exception:
-        return st.session_state.get("ORBE_API_URL") or "http://127.0.0.1:8000"
-
-
 def api_get(path: str, params: Optional[dict] = None):
     try:
-        r = requests.get(f"{api_base()}{path}", params=params, timeout=20)
+        r = api_client.get(path, params=params, timeout=20)
         r.raise_for_status()
         return r.json()
     except Exception as e:
@@ -24,7 +17,7 @@ def api_get(path: str, params: Optional[dict] = None):
 
 def api_post(path: str, payload: dict):
     try:
-        r = requests.post(f"{api_base()}{path}", json=payload, timeout=20)
+        r = api_client.post(path, json=payload, timeout=20)
         r.raise_for_status()
         return r.json()
     except Exception as e:
@@ -1,5 +1,3 @@
-import os
-
 from datetime import date
 
 from typing import Any, Dict, List, Optional
@@ -8,7 +6,6 @@ from typing import Any, Dict, List, Optional
 
 import pandas as pd
 
-import requests
 
 import streamlit as st
 
@@ -16,6 +13,7 @@ from streamlit.components.v1 import html as st_html
 
 
 
+from modules import api_client
 from modules.orbe_theme import apply_orbe_theme
 
 from modules.cliente_form_api import render_cliente_form
@@ -136,33 +134,11 @@ def _normalize_id(v: Any):
 
 
 
-def _api_base() -> str:
-
-    try:
-
-        return st.secrets["ORBE_API_URL"]  # type: ignore[attr-defined]
-
-    except Exception:
-
-        return (
-
-            os.getenv("ORBE_API_URL")
-
-            or st.session_state.get("ORBE_API_URL")
-
-            or "http://127.0.0.1:8000"
-
-        )
-
-
-
-
-
 def _api_get(path: str, params: Optional[dict] = None) -> dict:
 
     try:
 
-        r = requests.get(f"{_api_base()}{path}", params=params, timeout=25)
+        r = api_client.get(path, params=params, timeout=25)
 
         r.raise_for_status()
 
@@ -182,7 +158,7 @@ def _api_post(path: str, json: Optional[dict] = None) -> Optional[dict]:
 
     try:
 
-        r = requests.post(f"{_api_base()}{path}", json=json, timeout=25)
+        r = api_client.post(path, json=json, timeout=25)
 
         r.raise_for_status()
 
@@ -555,7 +531,7 @@ def _render_modal_detalle_potencial(clienteid: int):
 
     if modal.is_open():
         try:
-            res = requests.get(f"{_api_base()}/api/clientes/{clienteid}", timeout=20)
+            res = api_client.get(f"/api/clientes/{clienteid}", timeout=20)
             res.raise_for_status()
             data = res.json()
         except Exception as e:
@@ -1,8 +1,7 @@
 import streamlit as st
 from datetime import datetime, timedelta
-import requests
 
-from modules.api_base import get_api_base
+from modules import api_client
 from modules.crm_api import (
     detalle as api_detalle,
     actualizar as api_actualizar,
@@ -32,7 +31,7 @@ def _trabajadores_map() -> dict:
     if cache_key in st.session_state:
         return st.session_state[cache_key]
     try:
-        r = requests.get(f"{get_api_base()}/api/catalogos/trabajadores", timeout=15)
+        r = api_client.get("/api/catalogos/trabajadores", timeout=15)
         r.raise_for_status()
         rows = r.json() or []
     except Exception:
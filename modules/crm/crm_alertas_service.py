@@ -1,5 +1,5 @@
 import requests
-from modules.api_base import get_api_base
+from modules import api_client
 
 
 def _handle(resp: requests.Response) -> dict:
@@ -22,8 +22,8 @@ def get_alertas_trabajador(_supa_unused, trabajadorid: int) -> dict:
             "seguimiento": [],
         }
     try:
-        r = requests.get(
-            f"{get_api_base()}/api/crm/alertas",
+        r = api_client.get(
+            "/api/crm/alertas",
             params={"trabajadorid": trabajadorid},
             timeout=20,
         )
@@ -43,7 +43,7 @@ def get_alertas_trabajador(_supa_unused, trabajadorid: int) -> dict:
 # ======================================================
 def get_alertas_globales(_supa_unused) -> dict:
     try:
-        r = requests.get(f"{get_api_base()}/api/crm/alertas/globales", timeout=20)
+        r = api_client.get("/api/crm/alertas/globales", timeout=20)
         return _handle(r)
     except Exception:
         return {"total": 0, "criticas": []}
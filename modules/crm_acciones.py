@@ -16,7 +16,6 @@ from modules.crm_api import (
     actualizar as api_actualizar,
     catalogos as api_catalogos,
 )
-from modules.api_base import get_api_base
 from modules.crm_accion_detalle import render_crm_accion_detalle
 
 try:
@@ -83,9 +82,9 @@ def _to_event(row: dict) -> dict:
 
 def _load_trabajadores() -> Dict[str, int]:
     try:
-        import requests
+        from modules import api_client
 
-        r = requests.get(f"{get_api_base()}/api/catalogos/trabajadores", timeout=15)
+        r = api_client.get("/api/catalogos/trabajadores", timeout=15)
         r.raise_for_status()
         rows = r.json() or []
     except Exception:
@@ -116,10 +115,10 @@ def _load_clientes(search: str) -> Dict[str, int]:
     if not search:
         return {}
     try:
-        import requests
+        from modules import api_client
 
-        r = requests.get(
-            f"{get_api_base()}/api/clientes",
+        r = api_client.get(
+            "/api/clientes",
             params={"q": search, "page": 1, "page_size": 40},
             timeout=15,
         )
@@ -9,7 +9,6 @@ from modules.crm_api import (
     actualizar as api_actualizar,
     catalogos as api_catalogos,
 )
-from modules.api_base import get_api_base
 
 
 def _load_estados(_supabase_unused):
@@ -36,9 +35,9 @@ def _load_tipos(_supabase_unused):
 
 def _load_trabajadores(_supabase_unused):
     try:
-        import requests
+        from modules import api_client
 
-        r = requests.get(f"{get_api_base()}/api/catalogos/trabajadores", timeout=15)
+        r = api_client.get("/api/catalogos/trabajadores", timeout=15)
         r.raise_for_status()
         rows = r.json() or []
     except Exception:
@@ -2,8 +2,7 @@
 
 import streamlit as st
 from datetime import datetime, date
-import requests
-from modules.api_base import get_api_base
+from modules import api_client
 
 
 # ==========================================================
@@ -61,8 +60,8 @@ def cliente_autocomplete(
     if search and len(search.strip()) >= 2:
         txt = search.strip()
         try:
-            r = requests.get(
-                f"{get_api_base()}/api/clientes",
+            r = api_client.get(
+                "/api/clientes",
                 params={"q": txt, "page": 1, "page_size": 20},
                 timeout=15,
             )
@@ -115,8 +114,8 @@ def cargar_clientes_map(supabase, acts):
         return {}
     try:
         ids_str = ",".join(str(i) for i in ids)
-        r = requests.get(
-            f"{get_api_base()}/api/clientes/lookup",
+        r = api_client.get(
+            "/api/clientes/lookup",
             params={"ids": ids_str},
             timeout=15,
         )
@@ -4,8 +4,8 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta, date
 from typing import Optional
-import requests
 
+from modules import api_client, ventas_producto
 from modules.orbe_palette import PRIMARY, PRIMARY_DARK, SUCCESS, WARNING, DANGER, SECONDARY, LIGHT, TEXT
 from modules.orbe_theme import apply_orbe_theme
 
@@ -25,13 +25,6 @@ from modules.crm_api import (
 )
 
 
-def _api_base():
-    try:
-        return st.secrets["ORBE_API_URL"]  # type: ignore[attr-defined]
-    except Exception:
-        return st.session_state.get("ORBE_API_URL") or "http://127.0.0.1:8000"
-
-
 def _table_exists(supabase, table: str) -> bool:
     try:
         supabase.table(table).select("*").limit(1).execute()
@@ -68,7 +61,7 @@ def _get_incidencia_estado_id(supabase, estado: str):
 
 def _count_api_presupuestos():
     try:
-        r = requests.get(f"{_api_base()}/api/presupuestos", params={"page": 1, "page_size": 1}, timeout=15)
+        r = api_client.get("/api/presupuestos", params={"page": 1, "page_size": 1}, timeout=15)
         r.raise_for_status()
         return r.json().get("total", 0)
     except Exception:
@@ -77,8 +70,8 @@ def _count_api_presupuestos():
 
 def _count_api_pedidos_activos():
     try:
-        r = requests.get(
-            f"{_api_base()}/api/pedidos",
+        r = api_client.get(
+            "/api/pedidos",
             params={"page": 1, "page_size": 1, "estadoid": 2},
             timeout=15,
         )
@@ -93,7 +86,7 @@ def _count_api_crm_pendientes(trabajadorid: int | None):
         params = {"estado": "Pendiente"}
         if trabajadorid:
             params["trabajador_asignadoid"] = trabajadorid
-        r = requests.get(f"{_api_base()}/api/crm/acciones", params=params, timeout=15)
+        r = api_client.get("/api/crm/acciones", params=params, timeout=15)
         r.raise_for_status()
         return len(r.json().get("data", []))
     except Exception:
@@ -105,8 +98,8 @@ def _load_pedidos_api(fecha_desde: date, page_size: int = 500) -> list:
     Carga pedidos vía API (evitamos acceso directo a Supabase desde el frontend).
     """
     try:
-        r_ped = requests.get(
-            f"{_api_base()}/api/pedidos",
+        r_ped = api_client.get(
+            "/api/pedidos",
             params={"fecha_desde": fecha_desde.isoformat(), "page": 1, "page_size": page_size},
             timeout=20,
         )
@@ -236,49 +229,14 @@ def _count_pedidos_updated_window(rows: list, start: date, end: date, accepted:
     return total, accepted_cnt
 
 
-def _load_producto_sales_year(supabase, year: int, page_size: int = 1000, max_pages: int = 20) -> dict:
-    if not supabase or not _table_exists(supabase, "pedido_linea"):
-        return {}
-    start = date(year, 1, 1).isoformat()
-    end = date(year + 1, 1, 1).isoformat()
-    out: dict[int, dict] = {}
-    page = 0
-    while page < max_pages:
-        start_i = page * page_size
-        end_i = start_i + page_size - 1
-        res = (
-            supabase.table("pedido_linea")
-            .select("producto_id,cantidad,subtotal,created_at")
-            .gte("created_at", start)
-            .lt("created_at", end)
-            .range(start_i, end_i)
-            .execute()
-        )
-        rows = res.data or []
-        if not rows:
-            break
-        for r in rows:
-            pid = r.get("producto_id")
-            if not pid:
-                continue
-            qty = float(r.get("cantidad") or 0)
-            subtotal = float(r.get("subtotal") or 0)
-            acc = out.setdefault(int(pid), {"qty": 0.0, "total": 0.0})
-            acc["qty"] += qty
-            acc["total"] += subtotal
-        page += 1
-    return out
-
-
 def _load_activity_api(fecha_inicio_30: date):
     """
     Fallback de actividad cuando no hay supabase: usa las APIs públicas.
     """
-    base = _api_base()
     try:
         # Pedidos (filtramos por fecha_desde disponible en API)
-        r_ped = requests.get(
-            f"{base}/api/pedidos",
+        r_ped = api_client.get(
+            "/api/pedidos",
             params={"fecha_desde": fecha_inicio_30.isoformat(), "page": 1, "page_size": 500},
             timeout=20,
         )
@@ -288,7 +246,7 @@ def _load_activity_api(fecha_inicio_30: date):
         ped = []
 
     try:
-        r_pres = requests.get(f"{base}/api/presupuestos", params={"page": 1, "page_size": 500, "ordenar_por": "creado_en"}, timeout=20)
+        r_pres = api_client.get("/api/presupuestos", params={"page": 1, "page_size": 500, "ordenar_por": "creado_en"}, timeout=20)
         r_pres.raise_for_status()
         pres = [
             p for p in r_pres.json().get("data", [])
@@ -298,7 +256,7 @@ def _load_activity_api(fecha_inicio_30: date):
         pres = []
 
     try:
-        r_acts = requests.get(f"{base}/api/crm/acciones", timeout=20)
+        r_acts = api_client.get("/api/crm/acciones", timeout=20)
         r_acts.raise_for_status()
         acts = [
             a for a in r_acts.json().get("data", [])
@@ -824,8 +782,10 @@ def render_dashboard(supabase):
     if not supabase or not _table_exists(supabase, "pedido_linea"):
         st.info("Conecta Supabase para ver el top de productos vendidos.")
     else:
-        sales_2025 = _load_producto_sales_year(supabase, 2025)
-        sales_2024 = _load_producto_sales_year(supabase, 2024)
+        # Como en producto_lista, una línea sin producto_id cuenta por su producto_ref_origen
+        por_anio = ventas_producto.ventas_por_anio(supabase, [2024, 2025])
+        sales_2025 = {pid: {"qty": q, "total": t} for pid, (q, t) in por_anio[2025].items()}
+        sales_2024 = {pid: {"qty": q, "total": t} for pid, (q, t) in por_anio[2024].items()}
 
         top_2025 = sorted(sales_2025.items(), key=lambda x: x[1]["qty"], reverse=True)[:10]
         if not top_2025:
@@ -0,0 +1,285 @@
+# ======================================================
+# 🗃️ CACHÉ DE DATOS DE LA UI — EnteNova Gnosis
+# ======================================================
+# Caché de proceso única para las lecturas de las páginas (API y Supabase),
+# en lugar de un @st.cache_data(ttl=...) distinto en cada módulo:
+#   - claves con espacio de nombres ("clientes", "pedidos", "productos", ...);
+#   - LRU acotada (DATA_CACHE_MAXSIZE entradas entre todos los espacios);
+#   - stale-while-revalidate: pasado el TTL, durante stale_s más se sirve el
+#     valor anterior y se recarga en segundo plano;
+#   - invalidación explícita: los formularios emiten un evento al guardar
+#     (emitir("cliente"), emitir("pedido"), ...) y se vacían los espacios
+#     que dependen de él. Una recarga en curso anterior al evento se descarta.
+#     Las cachés propias de otros módulos (índice de reglas, tabla de IVA...)
+#     se apuntan al evento con suscribir(evento, fn).
+#
+# Uso:
+#   @data_cache.cacheado("productos", ttl_s=300)
+#   def load_familias(_supabase): ...
+# Como en st.cache_data, los argumentos que empiezan por "_" no forman parte de la clave;
+# el resto deben ser hashables (o dict / list / tuple / set de hashables): si no, TypeError.
+# Las recargas en segundo plano corren con el contexto de Streamlit de la sesión
+# que las lanzó, así que el loader puede usar st.session_state / st.secrets.
+#
+# Configuración por entorno:
+#   DATA_CACHE_MAXSIZE  (entradas, por defecto 2000)
+#   DATA_CACHE_STALE_S  (segundos de margen stale por defecto, 0 = igual al TTL)
+
+import copy
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # fuera de Streamlit (scripts, tests): las recargas van sin contexto
+    add_script_run_ctx = get_script_run_ctx = None
+
+
+MAXSIZE = int(os.getenv("DATA_CACHE_MAXSIZE", "2000"))
+STALE_S = float(os.getenv("DATA_CACHE_STALE_S", "0"))
+
+# Evento de guardado -> espacios que deja obsoletos
+EVENTOS: Dict[str, Tuple[str, ...]] = {
+    "cliente": ("clientes", "tarifas"),
+    "pedido": ("pedidos", "ventas"),
+    "presupuesto": ("presupuestos",),
+    "producto": ("productos", "ventas", "tarifas"),
+    "tarifa": ("tarifas",),
+    "impuesto": ("productos",),
+    "producto_tipo": ("productos",),
+}
+
+# Evento -> funciones de invalidación de otras cachés (suscribir())
+_suscriptores: Dict[str, List[Callable[[], None]]] = {}
+
+
+def _script_run_ctx():
+    """Contexto de Streamlit del hilo actual (None fuera de una ejecución de página)."""
+    return get_script_run_ctx() if get_script_run_ctx is not None else None
+
+
+class _Contadores:
+    __slots__ = ("hits", "stale_hits", "misses", "recargas", "errores_recarga", "invalidaciones", "evictions")
+
+    def __init__(self):
+        for k in self.__slots__:
+            setattr(self, k, 0)
+
+
+class DataCache:
+    """LRU acotada con TTL, margen stale-while-revalidate e invalidación por espacio."""
+
+    def __init__(self, maxsize: int = 2000):
+        self.maxsize = max(1, int(maxsize))
+        # (espacio, clave) -> (fresco_hasta, stale_hasta, valor)
+        self._data: "OrderedDict[Tuple[str, Hashable], tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generacion: Dict[str, int] = {}
+        self._recargando: set = set()
+        self._contadores: Dict[str, _Contadores] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _cont(self, espacio: str) -> _Contadores:
+        c = self._contadores.get(espacio)
+        if c is None:
+            c = self._contadores[espacio] = _Contadores()
+        return c
+
+    def _guardar(self, espacio: str, clave: Hashable, valor: Any, ttl_s: float, stale_s: float, generacion: int) -> None:
+        with self._lock:
+            if self._generacion.get(espacio, 0) != generacion:
+                return  # invalidado mientras se cargaba
+            ahora = time.monotonic()
+            k = (espacio, clave)
+            self._data[k] = (ahora + ttl_s, ahora + ttl_s + stale_s, copy.deepcopy(valor))
+            self._data.move_to_end(k)
+            while len(self._data) > self.maxsize:
+                (esp_fuera, _), _ = self._data.popitem(last=False)
+                self._cont(esp_fuera).evictions += 1
+
+    def _recargar(self, espacio, clave, loader, ttl_s, stale_s, generacion, ctx=None) -> None:
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            valor = loader()
+            self._guardar(espacio, clave, valor, ttl_s, stale_s, generacion)
+            with self._lock:
+                self._cont(espacio).recargas += 1
+        except Exception:
+            with self._lock:
+                self._cont(espacio).errores_recarga += 1
+        finally:
+            with self._lock:
+                self._recargando.discard((espacio, clave))
+
+    def obtener(
+        self,
+        espacio: str,
+        clave: Hashable,
+        loader: Callable[[], Any],
+        *,
+        ttl_s: float,
+        stale_s: Optional[float] = None,
+    ) -> Any:
+        """Valor de (espacio, clave); si no está o ya no sirve, lo carga con loader()."""
+        stale_s = (STALE_S or ttl_s) if stale_s is None else stale_s
+        k = (espacio, clave)
+        recargar = False
+        with self._lock:
+            generacion = self._generacion.get(espacio, 0)
+            item = self._data.get(k)
+            ahora = time.monotonic()
+            if item is not None and ahora < item[1]:
+                self._data.move_to_end(k)
+                if ahora < item[0]:
+                    self._cont(espacio).hits += 1
+                else:
+                    self._cont(espacio).stale_hits += 1
+                    if k not in self._recargando:
+                        self._recargando.add(k)
+                        recargar = True
+                valor = copy.deepcopy(item[2])
+            else:
+                self._cont(espacio).misses += 1
+                valor = None
+                item = None
+
+        if item is not None:
+            if recargar:
+                self._get_pool().submit(
+                    self._recargar, espacio, clave, loader, ttl_s, stale_s, generacion, _script_run_ctx()
+                )
+            return valor
+
+        # La carga va fuera del lock: dos cargas simultáneas de la misma clave son inocuas
+        valor = loader()
+        self._guardar(espacio, clave, valor, ttl_s, stale_s, generacion)
+        return valor
+
+    def invalidar(self, espacio: str, clave: Optional[Hashable] = None) -> None:
+        """Elimina una clave del espacio, o el espacio entero si clave es None."""
+        with self._lock:
+            if clave is None:
+                self._generacion[espacio] = self._generacion.get(espacio, 0) + 1
+                for k in [k for k in self._data if k[0] == espacio]:
+                    del self._data[k]
+            else:
+                self._data.pop((espacio, clave), None)
+            self._cont(espacio).invalidaciones += 1
+
+    def limpiar(self) -> None:
+        with self._lock:
+            espacios = {k[0] for k in self._data} | set(self._generacion)
+        for espacio in espacios:
+            self.invalidar(espacio)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            tamanos: Dict[str, int] = {}
+            for espacio, _ in self._data:
+                tamanos[espacio] = tamanos.get(espacio, 0) + 1
+            filas = []
+            for espacio, c in sorted(self._contadores.items()):
+                servidas = c.hits + c.stale_hits
+                total = servidas + c.misses
+                filas.append({
+                    "espacio": espacio,
+                    "entradas": tamanos.get(espacio, 0),
+                    "hits": c.hits,
+                    "stale_hits": c.stale_hits,
+                    "misses": c.misses,
+                    "hit_rate": round(servidas / total, 4) if total else 0.0,
+                    "recargas": c.recargas,
+                    "errores_recarga": c.errores_recarga,
+                    "invalidaciones": c.invalidaciones,
+                    "evictions": c.evictions,
+                })
+            return filas
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="data-cache")
+            return self._pool
+
+
+cache = DataCache(MAXSIZE)
+
+
+# =========================
+# API del módulo
+# =========================
+def _hashable(v: Any) -> Hashable:
+    if isinstance(v, dict):
+        return tuple(sorted((str(k), _hashable(x)) for k, x in v.items()))
+    if isinstance(v, (list, tuple, set, frozenset)):
+        items = [_hashable(x) for x in v]
+        return tuple(sorted(items, key=repr)) if isinstance(v, (set, frozenset)) else tuple(items)
+    try:
+        hash(v)
+    except TypeError:
+        # repr() no identifica el valor (dos objetos distintos pueden compartir clave)
+        raise TypeError(f"Argumento no válido para la clave de caché: {type(v).__name__}") from None
+    return v
+
+
+def cacheado(espacio: str, *, ttl_s: float, stale_s: Optional[float] = None):
+    """Decorador: cachea la función en `espacio` (sustituye a @st.cache_data(ttl=...))."""
+
+    def deco(fn: Callable) -> Callable:
+        firma = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = firma.bind(*args, **kwargs)
+            bound.apply_defaults()
+            clave = (fn.__module__, fn.__qualname__) + tuple(
+                (k, _hashable(v)) for k, v in bound.arguments.items() if not k.startswith("_")
+            )
+            return cache.obtener(espacio, clave, lambda: fn(*args, **kwargs), ttl_s=ttl_s, stale_s=stale_s)
+
+        wrapper.invalidar = lambda: cache.invalidar(espacio)  # type: ignore[attr-defined]
+        return wrapper
+
+    return deco
+
+
+def espacio_api(path: str) -> str:
+    """Espacio de una ruta de la API: /api/clientes/catalogos -> "clientes"."""
+    partes = [p for p in path.split("?", 1)[0].split("/") if p]
+    if partes and partes[0] == "api":
+        partes = partes[1:]
+    return partes[0] if partes else "api"
+
+
+def obtener(espacio: str, clave: Hashable, loader: Callable[[], Any], *, ttl_s: float, stale_s: Optional[float] = None) -> Any:
+    return cache.obtener(espacio, _hashable(clave), loader, ttl_s=ttl_s, stale_s=stale_s)
+
+
+def invalidar(espacio: str, clave: Optional[Hashable] = None) -> None:
+    cache.invalidar(espacio, None if clave is None else _hashable(clave))
+
+
+def suscribir(evento: str, fn: Callable[[], None]) -> None:
+    """fn() se llamará en cada emitir(evento)."""
+    fns = _suscriptores.setdefault(evento, [])
+    if fn not in fns:
+        fns.append(fn)
+
+
+def emitir(evento: str) -> None:
+    """Evento de guardado (cliente, pedido, producto, tarifa...): vacía los espacios afectados."""
+    for espacio in EVENTOS.get(evento, (evento,)):
+        cache.invalidar(espacio)
+    for fn in _suscriptores.get(evento, ()):
+        fn()
+
+
+def stats() -> List[Dict[str, Any]]:
+    return cache.stats()
@@ -3,6 +3,8 @@ import streamlit as st
 import pandas as pd
 from datetime import date
 
+from modules import data_cache
+
 def render_impuesto_lista(supabase):
     st.header("🧾 Impuestos")
     st.caption("Catálogo de impuestos. Precio base → tarifas → **impuestos** (al final).")
@@ -21,6 +23,7 @@ def render_impuesto_lista(supabase):
         if ok:
             try:
                 supabase.table("impuesto").insert({"nombre": nombre.strip(), "tipo": tipo, "valor": valor, "habilitado": True}).execute()
+                data_cache.emitir("impuesto")
                 st.success("✅ Impuesto creado.")
                 st.rerun()
             except Exception as e:
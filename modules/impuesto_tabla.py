@@ -0,0 +1,188 @@
+# ======================================================
+# 🧾 TABLA DE RESOLUCIÓN DE IVA — EnteNova Gnosis
+# ======================================================
+# Precalcula, a partir de las tablas impuesto y producto_tipo, la resolución
+# de IVA que usa modules.precio_engine:
+#   1) impuesto del producto (habilitado y vigente)
+#   2) impuesto del producto_tipo (habilitado y vigente)
+#   3) búsqueda por (país, tipo_producto) en la ventana de fechas,
+#      con preferencia a coincidencia exacta y si no la "general" (sin tipo)
+#   4) fallback España (sin ventana): la que contiene "general" o la primera
+#
+# Para (3) cada país tiene tramos de fecha; cada tramo guarda
+# {tipo_producto -> impuesto} y la general, así que la consulta es un bisect
+# y un dict.get. La tabla se guarda a nivel de proceso y solo se recompila
+# cuando cambia el contenido de impuesto/producto_tipo. Guardar un impuesto o
+# un tipo de producto (data_cache.emitir("impuesto" | "producto_tipo")) fuerza
+# la revalidación.
+
+import hashlib
+import json
+import os
+import time
+from typing import Optional, Dict, Any, List
+
+from modules import data_cache
+from modules.tarifa_indice import Intervalos, _is_active_window
+
+
+IMPUESTO_COLUMNAS = "impuestoid, nombre, porcentaje, tipo_producto, pais, habilitado, fecha_inicio, fecha_fin"
+PRODUCTO_TIPO_COLUMNAS = "producto_tipoid, nombre, impuestoid"
+
+_TTL_S = float(os.getenv("IVA_TABLA_TTL_S", "300"))
+_TABLA_CACHED: Dict[str, Any] = {"tabla": None, "ts": float("-inf")}
+
+_SIN_RESULTADO = {"iva_pct": 0.0, "iva_nombre": None, "iva_origen": "desconocido"}
+
+
+def _iva_out(imp: Dict[str, Any], origen: str) -> Dict[str, Any]:
+    return {"iva_pct": float(imp["porcentaje"]), "iva_nombre": imp["nombre"], "iva_origen": origen}
+
+
+class _PorPais:
+    """Impuestos habilitados de un país, resueltos por tramo de fecha y tipo."""
+
+    def __init__(self, imps: List[Dict[str, Any]]):
+        self._iv = Intervalos(imps)
+        self._tramos = []
+        for activos in self._iv.tramos:
+            exactos: Dict[str, Dict[str, Any]] = {}
+            general = None
+            for i in activos:
+                exactos.setdefault((i.get("tipo_producto") or "").lower(), i)
+                if general is None and not i.get("tipo_producto"):
+                    general = i
+            self._tramos.append((exactos, general))
+
+    def buscar(self, tipo_nombre: Optional[str], fecha_iso: str) -> Optional[Dict[str, Any]]:
+        exactos, general = self._tramos[self._iv.tramo(fecha_iso)]
+        imp = exactos.get((tipo_nombre or "").lower())
+        return imp if imp is not None else general
+
+
+class TablaIva:
+    """Resolución de IVA en memoria a partir de impuesto + producto_tipo."""
+
+    def __init__(self, impuestos: List[Dict[str, Any]], tipos: List[Dict[str, Any]], huella: Optional[str] = None):
+        self.huella = huella or huella_tablas(impuestos, tipos)
+        self.impuestos_por_id = {i.get("impuestoid"): i for i in impuestos}
+        self.tipos_por_id = {t.get("producto_tipoid"): t for t in tipos}
+
+        habilitados = [i for i in impuestos if i.get("habilitado") is True]
+        por_pais: Dict[Any, List[Dict[str, Any]]] = {}
+        for i in habilitados:
+            por_pais.setdefault(i.get("pais"), []).append(i)
+        self._por_pais = {p: _PorPais(v) for p, v in por_pais.items()}
+        self._todos = _PorPais(habilitados)
+
+        # Fallback España: no depende de la fecha, se fija al compilar
+        espana = por_pais.get("España") or []
+        try:
+            self._fallback = next(
+                (i for i in espana if "general" in i.get("nombre", "").lower()),
+                espana[0] if espana else None,
+            )
+        except Exception:
+            self._fallback = None
+
+    def _vigente_habilitado(self, impuestoid, fecha_iso: str) -> Optional[Dict[str, Any]]:
+        imp = self.impuestos_por_id.get(impuestoid)
+        if imp and imp.get("habilitado") and _is_active_window(imp, fecha_iso):
+            return imp
+        return None
+
+    def resolver(
+        self,
+        *,
+        product_impuestoid: Optional[int],
+        producto_tipoid: Optional[int],
+        producto_tipo_nombre: Optional[str],
+        region_nombre: Optional[str],
+        fecha_iso: str,
+    ) -> Dict[str, Any]:
+        # 1️⃣ Impuesto del producto
+        if product_impuestoid:
+            imp = self._vigente_habilitado(product_impuestoid, fecha_iso)
+            if imp:
+                try:
+                    return _iva_out(imp, "producto")
+                except Exception:
+                    pass
+
+        # 2️⃣ Impuesto del tipo de producto
+        if producto_tipoid:
+            tipo = self.tipos_por_id.get(producto_tipoid)
+            if tipo and tipo.get("impuestoid"):
+                imp = self._vigente_habilitado(tipo["impuestoid"], fecha_iso)
+                if imp:
+                    try:
+                        return _iva_out(imp, "producto_tipo")
+                    except Exception:
+                        pass
+
+        # 3️⃣ Búsqueda contextual por tipo_producto + país/región
+        pais = self._por_pais.get(region_nombre) if region_nombre else self._todos
+        if pais is not None:
+            imp = pais.buscar(producto_tipo_nombre, fecha_iso)
+            if imp is not None:
+                try:
+                    return _iva_out(imp, "busqueda")
+                except Exception:
+                    pass
+
+        # 4️⃣ Fallback genérico España
+        if self._fallback is not None:
+            try:
+                return _iva_out(self._fallback, "fallback")
+            except Exception:
+                pass
+
+        return dict(_SIN_RESULTADO)
+
+
+def huella_tablas(impuestos: List[Dict[str, Any]], tipos: List[Dict[str, Any]]) -> str:
+    payload = json.dumps([impuestos, tipos], sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+def compilar_tabla_iva(impuestos: List[Dict[str, Any]], tipos: List[Dict[str, Any]]) -> TablaIva:
+    """Devuelve la tabla para estas filas, reutilizando la compilada si no han cambiado."""
+    huella = huella_tablas(impuestos, tipos)
+    actual = _TABLA_CACHED["tabla"]
+    if actual is not None and actual.huella == huella:
+        return actual
+    tabla = TablaIva(impuestos, tipos, huella=huella)
+    _TABLA_CACHED["tabla"] = tabla
+    return tabla
+
+
+def get_tabla_iva(supabase, *, forzar: bool = False) -> TablaIva:
+    """
+    Tabla de IVA a nivel de proceso.
+    Se revalida cada IVA_TABLA_TTL_S segundos (o si forzar=True) con una
+    consulta a impuesto y otra a producto_tipo.
+    """
+    actual = _TABLA_CACHED["tabla"]
+    if not forzar and actual is not None and time.monotonic() - _TABLA_CACHED["ts"] < _TTL_S:
+        return actual
+
+    try:
+        impuestos = supabase.table("impuesto").select(IMPUESTO_COLUMNAS).execute().data or []
+        tipos = supabase.table("producto_tipo").select(PRODUCTO_TIPO_COLUMNAS).execute().data or []
+    except Exception:
+        if actual is not None:
+            return actual
+        impuestos, tipos = [], []
+
+    tabla = compilar_tabla_iva(impuestos, tipos)
+    _TABLA_CACHED["ts"] = time.monotonic()
+    return tabla
+
+
+def invalidar_tabla_iva() -> None:
+    """Fuerza la revalidación en la próxima consulta (llamar tras guardar impuestos o tipos)."""
+    _TABLA_CACHED["ts"] = float("-inf")
+
+
+data_cache.suscribir("impuesto", invalidar_tabla_iva)
+data_cache.suscribir("producto_tipo", invalidar_tabla_iva)
@@ -1,5 +1,6 @@
 import streamlit as st
 
+from modules import api_client, data_cache, precio_cache
 from modules.impuesto_lista import render_impuesto_lista
 from modules.diagramas import render_diagramas
 
@@ -59,6 +60,38 @@ def _render_proveedores(supabase):
     st.dataframe(rows, width="stretch", hide_index=True)
 
 
+def _render_rendimiento_api():
+    st.subheader("Rendimiento API")
+    st.caption("Latencias de las llamadas a la API desde que arranco este proceso (por endpoint).")
+    filas = api_client.latencias()
+    if not filas:
+        st.info("Aun no hay llamadas registradas.")
+        return
+    st.dataframe(filas, width="stretch", hide_index=True)
+    if st.button("Reiniciar contadores"):
+        api_client.reset_latencias()
+        st.rerun()
+
+
+def _render_cache_datos():
+    st.subheader("Cache de datos")
+    st.caption("Aciertos de la cache de lecturas por espacio desde que arranco este proceso.")
+    filas = data_cache.stats()
+    if filas:
+        st.dataframe(filas, width="stretch", hide_index=True)
+    else:
+        st.info("Aun no hay lecturas cacheadas.")
+
+    st.markdown("**Contextos de precio** (cliente y producto del motor de precios)")
+    st.dataframe(list(precio_cache.stats_ctx_cache().values()), width="stretch", hide_index=True)
+
+    if st.button("Vaciar cache"):
+        data_cache.cache.limpiar()
+        precio_cache.invalidar_cliente_ctx()
+        precio_cache.invalidar_producto_ctx()
+        st.rerun()
+
+
 def render_otros(supabase):
     st.header("Otros")
     st.caption("Utilidades, catalogos y analitica general.")
@@ -68,6 +101,8 @@ def render_otros(supabase):
         "Diagramas y metricas",
         "Empresas",
         "Proveedores",
+        "Rendimiento API",
+        "Cache de datos",
     ]
     vista = st.selectbox("Seccion", opciones)
 
@@ -79,3 +114,7 @@ def render_otros(supabase):
         _render_empresas(supabase)
     elif vista == "Proveedores":
         _render_proveedores(supabase)
+    elif vista == "Rendimiento API":
+        _render_rendimiento_api()
+    elif vista == "Cache de datos":
+        _render_cache_datos()
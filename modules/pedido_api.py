@@ -3,7 +3,7 @@ Cliente HTTP para pedidos (FastAPI).
 """
 from typing import Any, Dict, Optional
 import requests
-from modules.api_base import get_api_base
+from modules import api_client
 
 
 def _handle(resp: requests.Response) -> Any:
@@ -14,42 +14,42 @@ def _handle(resp: requests.Response) -> Any:
 
 
 def listar(params: Optional[dict] = None) -> dict:
-    r = requests.get(f"{get_api_base()}/api/pedidos", params=params, timeout=20)
+    r = api_client.get("/api/pedidos", params=params, timeout=20)
     return _handle(r)
 
 def catalogos() -> dict:
-    r = requests.get(f"{get_api_base()}/api/pedidos/catalogos", timeout=20)
+    r = api_client.get("/api/pedidos/catalogos", timeout=20)
     return _handle(r)
 
 def top_clientes(limit: int = 5) -> dict:
-    r = requests.get(f"{get_api_base()}/api/pedidos/top-clientes", params={"limit": limit}, timeout=20)
+    r = api_client.get("/api/pedidos/top-clientes", params={"limit": limit}, timeout=20)
     return _handle(r)
 
 def crear_pedido(payload: dict) -> dict:
-    r = requests.post(f"{get_api_base()}/api/pedidos", json=payload, timeout=20)
+    r = api_client.post("/api/pedidos", json=payload, timeout=20)
     return _handle(r)
 
 def actualizar_pedido(pedidoid: int, payload: dict) -> dict:
-    r = requests.put(f"{get_api_base()}/api/pedidos/{pedidoid}", json=payload, timeout=20)
+    r = api_client.put(f"/api/pedidos/{pedidoid}", json=payload, timeout=20)
     return _handle(r)
 
 def borrar_pedido(pedidoid: int) -> dict:
-    r = requests.delete(f"{get_api_base()}/api/pedidos/{pedidoid}", timeout=20)
+    r = api_client.delete(f"/api/pedidos/{pedidoid}", timeout=20)
     return _handle(r)
 
 
 def detalle(pedidoid: int) -> dict:
-    r = requests.get(f"{get_api_base()}/api/pedidos/{pedidoid}", timeout=15)
+    r = api_client.get(f"/api/pedidos/{pedidoid}", timeout=15)
     return _handle(r)
 
 
 def lineas(pedidoid: int) -> list:
-    r = requests.get(f"{get_api_base()}/api/pedidos/{pedidoid}/lineas", timeout=15)
+    r = api_client.get(f"/api/pedidos/{pedidoid}/lineas", timeout=15)
     return _handle(r)
 
 
 def totales(pedidoid: int) -> dict:
-    r = requests.get(f"{get_api_base()}/api/pedidos/{pedidoid}/totales", timeout=15)
+    r = api_client.get(f"/api/pedidos/{pedidoid}/totales", timeout=15)
     return _handle(r)
 
 
@@ -59,33 +59,33 @@ def recalcular_totales(pedidoid: int, use_iva: bool, gastos_envio: float, envio_
         "gastos_envio": gastos_envio,
         "envio_sin_cargo": envio_sin_cargo,
     }
-    r = requests.post(f"{get_api_base()}/api/pedidos/{pedidoid}/recalcular-totales", params=params, timeout=30)
+    r = api_client.post(f"/api/pedidos/{pedidoid}/recalcular-totales", params=params, timeout=30)
     return _handle(r)
 
 def agregar_linea(pedidoid: int, payload: dict) -> int:
-    r = requests.post(f"{get_api_base()}/api/pedidos/{pedidoid}/lineas", json=payload, timeout=20)
+    r = api_client.post(f"/api/pedidos/{pedidoid}/lineas", json=payload, timeout=20)
     return _handle(r)
 
 def borrar_linea(pedidoid: int, detalleid: int) -> dict:
-    r = requests.delete(f"{get_api_base()}/api/pedidos/{pedidoid}/lineas/{detalleid}", timeout=20)
+    r = api_client.delete(f"/api/pedidos/{pedidoid}/lineas/{detalleid}", timeout=20)
     return _handle(r)
 
 
 def observaciones(pedidoid: int) -> list:
-    r = requests.get(f"{get_api_base()}/api/pedidos/{pedidoid}/observaciones", timeout=15)
+    r = api_client.get(f"/api/pedidos/{pedidoid}/observaciones", timeout=15)
     return _handle(r)
 
 
 def crear_observacion(pedidoid: int, payload: dict) -> dict:
-    r = requests.post(f"{get_api_base()}/api/pedidos/{pedidoid}/observaciones", json=payload, timeout=15)
+    r = api_client.post(f"/api/pedidos/{pedidoid}/observaciones", json=payload, timeout=15)
     return _handle(r)
 
 
 def incidencias(pedidoid: int) -> list:
-    r = requests.get(f"{get_api_base()}/api/pedidos/{pedidoid}/incidencias", timeout=15)
+    r = api_client.get(f"/api/pedidos/{pedidoid}/incidencias", timeout=15)
     return _handle(r)
 
 
 def crear_incidencia(pedidoid: int, payload: dict) -> dict:
-    r = requests.post(f"{get_api_base()}/api/pedidos/{pedidoid}/incidencias", json=payload, timeout=15)
+    r = api_client.post(f"/api/pedidos/{pedidoid}/incidencias", json=payload, timeout=15)
     return _handle(r)
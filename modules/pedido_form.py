@@ -3,6 +3,7 @@
 # ======================================================
 import streamlit as st
 from datetime import date
+from modules import data_cache
 from modules.pedido_api import catalogos, detalle, crear_pedido, actualizar_pedido
 
 
@@ -122,6 +123,7 @@ def render_pedido_form(_supabase_unused, pedidoid: int | None = None, on_saved_r
                     res = crear_pedido(payload)
                     nuevo_id = res.get("pedido_id")
                     st.toast(f"✅ Pedido creado (ID {nuevo_id}).", icon="✅")
+                data_cache.emitir("pedido")
                 if on_saved_rerun:
                     st.rerun()
             except Exception as e:
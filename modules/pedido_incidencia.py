@@ -1,12 +1,11 @@
-import requests
 import streamlit as st
-from modules.api_base import get_api_base
+from modules import api_client
 from modules.pedido_api import incidencias, crear_incidencia
 
 
 def _load_trabajadores_api() -> dict:
     try:
-        r = requests.get(f"{get_api_base()}/api/catalogos/trabajadores", timeout=15)
+        r = api_client.get("/api/catalogos/trabajadores", timeout=15)
         r.raise_for_status()
         rows = r.json() or []
     except Exception:
@@ -16,6 +16,7 @@ from modules.pedido_api import (
     agregar_linea,
     borrar_linea,
 )
+from modules import api_client, data_cache
 from modules.pedido_form import render_pedido_form
 
 
@@ -163,8 +164,14 @@ def render_pedido_lista(_supabase=None):
 
     page_size_cards, page_size_table = 12, 30
 
+    # Catálogos y top clientes son independientes: se piden a la vez
+    lecturas = api_client.en_paralelo({
+        "catalogos": catalogos,
+        "top": lambda: pedidos_top_clientes(5),
+    })
+
     try:
-        cats = catalogos()
+        cats = lecturas["catalogos"].result()
         clientes_map = {c["label"]: c["id"] for c in cats.get("clientes", [])}
         clientes_rev = {c["id"]: c["label"] for c in cats.get("clientes", [])}
         estados_map = {e["label"]: e["id"] for e in cats.get("estados", [])}
@@ -180,7 +187,7 @@ def render_pedido_lista(_supabase=None):
         formas_pago_rev = {}
 
     try:
-        top = pedidos_top_clientes(5)
+        top = lecturas["top"].result()
         top_items = top.get("data") or []
     except Exception:
         top_items = []
@@ -428,8 +435,15 @@ def _render_pedido_modal(
     st.markdown("---")
     st.markdown("### 📄 Detalle del pedido")
 
+    lecturas = api_client.en_paralelo({
+        "detalle": lambda: detalle(pedido_id),
+        "lineas": lambda: lineas(pedido_id),
+        "totales": lambda: totales(pedido_id),
+        "observaciones": lambda: observaciones(pedido_id),
+    })
+
     try:
-        p = detalle(pedido_id)
+        p = lecturas["detalle"].result()
     except Exception as e:
         st.error(f"❌ Error cargando pedido: {e}")
         return
@@ -480,7 +494,7 @@ def _render_pedido_modal(
     st.markdown("---")
     st.subheader("📦 Líneas del pedido")
     try:
-        lineas_data = lineas(pedido_id)
+        lineas_data = lecturas["lineas"].result()
     except Exception as e:
         st.error(f"❌ Error cargando líneas: {e}")
         lineas_data = []
@@ -510,6 +524,7 @@ def _render_pedido_modal(
                     "descuento_pct": float(desc_manual),
                 }
                 agregar_linea(pedido_id, payload)
+                data_cache.emitir("pedido")
                 st.success("✅ Línea añadida.")
                 st.rerun()
             except Exception as e:
@@ -522,6 +537,7 @@ def _render_pedido_modal(
             if st.button("Eliminar línea seleccionada"):
                 try:
                     borrar_linea(pedido_id, opciones[sel])
+                    data_cache.emitir("pedido")
                     st.success("🗑️ Línea eliminada.")
                     st.rerun()
                 except Exception as e:
@@ -530,7 +546,7 @@ def _render_pedido_modal(
     st.markdown("---")
     st.subheader("💰 Totales del pedido")
     try:
-        tot = totales(pedido_id)
+        tot = lecturas["totales"].result()
     except Exception:
         tot = None
 
@@ -569,7 +585,7 @@ def _render_pedido_modal(
     st.subheader("📝 Observaciones")
 
     try:
-        obs = observaciones(pedido_id)
+        obs = lecturas["observaciones"].result()
         if not obs:
             st.info("No hay observaciones registradas.")
         else:
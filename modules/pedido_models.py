@@ -2,6 +2,8 @@ import streamlit as st
 from dataclasses import dataclass
 from typing import Optional, Dict, Any, List
 
+from modules import data_cache
+
 
 # ==================================================
 # 📦 MODELO DE PEDIDO
@@ -39,7 +41,7 @@ def _as_options(rows: List[Dict[str, Any]], label="nombre", value="id") -> Dict[
 # ==================================================
 # Catálogos cacheados
 # ==================================================
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def load_estados_pedido(_supabase) -> Dict[str, Any]:
     """Carga estados de pedido."""
     try:
@@ -55,7 +57,7 @@ def load_estados_pedido(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def load_tipos_pedido(_supabase) -> Dict[str, Any]:
     """Carga tipos de pedido."""
     try:
@@ -72,7 +74,7 @@ def load_tipos_pedido(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def load_procedencias_pedido(_supabase) -> Dict[str, Any]:
     """Carga procedencias de pedido."""
     try:
@@ -89,7 +91,7 @@ def load_procedencias_pedido(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def load_transportistas(_supabase) -> Dict[str, Any]:
     """Carga transportistas."""
     try:
@@ -106,7 +108,7 @@ def load_transportistas(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def load_formas_pago(_supabase) -> Dict[str, Any]:
     """Carga formas de pago."""
     try:
@@ -122,7 +124,7 @@ def load_formas_pago(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("catalogos", ttl_s=300)
 def load_trabajadores(_supabase) -> Dict[str, Any]:
     """Carga trabajadores."""
     try:
@@ -147,7 +149,7 @@ def load_trabajadores(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("clientes", ttl_s=300)
 def load_clientes(_supabase) -> Dict[str, Any]:
     """Carga clientes activos."""
     try:
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 import os
 import sys
 import subprocess
@@ -7,6 +8,8 @@ from datetime import date, datetime
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
+import pandas as pd
+
 TZ = ZoneInfo("Europe/Madrid")
 
 BASE_DIR = Path(__file__).resolve().parents[1]
@@ -14,6 +17,21 @@ PIPELINE_DIR = BASE_DIR / "Transforms"
 PIPELINE_SCRIPT = PIPELINE_DIR / "main_pipeline.py"
 LOG_FILE = PIPELINE_DIR / "pipeline_daily.log"
 LAST_RUN_FILE = PIPELINE_DIR / "pipeline_last_run.txt"
+METRICS_FILE = PIPELINE_DIR / "pipeline_metrics.jsonl"
+
+# Contadores por paso que escribe Transforms/pipeline_metrics
+METRIC_COLUMNS = [
+    "api_paginas",
+    "api_filas",
+    "bytes_recibidos",
+    "http_reintentos",
+    "bytes_enviados",
+    "filas_subidas",
+    "filas_staging",
+    "cache_hits",
+    "cache_304",
+    "rollup_filas",
+]
 
 
 def _today() -> date:
@@ -71,3 +89,62 @@ def tail_log(n_lines: int = 200) -> str:
         return "\n".join(lines[-n_lines:])
     except Exception:
         return ""
+
+
+def load_metrics(n_runs: int = 30) -> list[dict]:
+    """Registros de metricas (pasos y ejecuciones) de las ultimas n_runs ejecuciones."""
+    try:
+        lines = METRICS_FILE.read_text(encoding="utf-8", errors="ignore").splitlines()
+    except Exception:
+        return []
+
+    registros = []
+    for line in lines:
+        try:
+            registros.append(json.loads(line))
+        except ValueError:
+            continue
+
+    ejecuciones = []
+    for r in registros:
+        clave = (r.get("pipeline"), r.get("ejecucion"))
+        if clave not in ejecuciones:
+            ejecuciones.append(clave)
+    recientes = set(ejecuciones[-n_runs:])
+    return [r for r in registros if (r.get("pipeline"), r.get("ejecucion")) in recientes]
+
+
+def step_history(n_runs: int = 30) -> pd.DataFrame:
+    """Una fila por paso ejecutado, con filas/s de descarga y de subida."""
+    df = pd.DataFrame([r for r in load_metrics(n_runs) if r.get("tipo") == "paso"])
+    if df.empty:
+        return df
+    for col in METRIC_COLUMNS + ["rss_pico_mb"]:
+        if col not in df.columns:
+            df[col] = 0
+    df[METRIC_COLUMNS] = df[METRIC_COLUMNS].fillna(0).astype("int64")
+    dur = df["dur_s"].where(df["dur_s"] > 0)
+    df["api_filas_s"] = (df["api_filas"] / dur).round(1)
+    df["subidas_filas_s"] = (df["filas_subidas"] / dur).round(1)
+    return df.sort_values(["ejecucion", "inicio"], ascending=[False, True]).reset_index(drop=True)
+
+
+def run_history(n_runs: int = 30) -> pd.DataFrame:
+    """Una fila por ejecucion del pipeline (la mas reciente primero) con los totales de sus pasos."""
+    registros = load_metrics(n_runs)
+    runs = pd.DataFrame([r for r in registros if r.get("tipo") == "pipeline"])
+    if runs.empty:
+        return runs
+    runs = runs[["pipeline", "ejecucion", "modo", "estado", "dur_s", "pasos"]]
+
+    pasos = step_history(n_runs)
+    if not pasos.empty:
+        totales = pasos.groupby(["pipeline", "ejecucion"]).agg(
+            **{col: (col, "sum") for col in METRIC_COLUMNS},
+            rss_pico_mb=("rss_pico_mb", "max"),
+            pasos_error=("estado", lambda s: int((s != "ok").sum())),
+        ).reset_index()
+        runs = runs.merge(totales, on=["pipeline", "ejecucion"], how="left")
+        dur = runs["dur_s"].where(runs["dur_s"] > 0)
+        runs["filas_s"] = ((runs["api_filas"] + runs["filas_subidas"]) / dur).round(1)
+    return runs.sort_values("ejecucion", ascending=False).reset_index(drop=True)
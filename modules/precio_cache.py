@@ -0,0 +1,140 @@
+# ======================================================
+# 🧠 CACHÉ DE CONTEXTOS DE PRECIO — EnteNova Gnosis
+# ======================================================
+# Caché de proceso (LRU + TTL) para los contextos de cliente y producto
+# que usa modules.precio_engine. Los formularios que modifican clientes,
+# direcciones o productos llaman a los hooks invalidar_* al guardar.
+#
+# Configuración por entorno:
+#   PRECIO_CTX_TTL_S    (segundos, por defecto 300)
+#   PRECIO_CTX_MAXSIZE  (entradas por caché, por defecto 5000)
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# Marca que pone un loader a un contexto construido tras un error de consulta
+# (con valores por defecto): get_or_load lo devuelve sin la marca pero no lo guarda.
+PARCIAL = "_parcial"
+
+
+class ContextCache:
+    """LRU acotada con caducidad por entrada y contadores de aciertos/fallos."""
+
+    def __init__(self, nombre: str, maxsize: int = 5000, ttl_s: float = 300.0):
+        self.nombre = nombre
+        self.maxsize = max(1, int(maxsize))
+        self.ttl_s = float(ttl_s)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.parciales = 0
+        # Sube en cada invalidate: una carga empezada antes no se guarda
+        self._generacion = 0
+        self.descartadas = 0
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """Copia del valor vigente, o None si no está o ha caducado."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(item[1])
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, valor: Dict[str, Any], generacion: Optional[int] = None) -> None:
+        """Guarda una copia; si se pasa generacion y ha habido un invalidate desde entonces, no guarda."""
+        with self._lock:
+            if generacion is not None and generacion != self._generacion:
+                self.descartadas += 1
+                return
+            self._data[key] = (time.monotonic() + self.ttl_s, copy.deepcopy(valor))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        with self._lock:
+            generacion = self._generacion
+        valor = self.get(key)
+        if valor is not None:
+            return valor
+        # La carga va fuera del lock: dos cargas simultáneas de la misma clave son inocuas
+        valor = loader()
+        if valor.pop(PARCIAL, False):
+            with self._lock:
+                self.parciales += 1
+            return valor
+        # Si se invalidó durante la carga, el valor puede ser anterior al guardado: no se cachea
+        self.put(key, valor, generacion=generacion)
+        return valor
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Elimina una clave, o toda la caché si key es None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+            self.invalidations += 1
+            self._generacion += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "cache": self.nombre,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "parciales": self.parciales,
+                "descartadas": self.descartadas,
+            }
+
+
+_TTL_S = float(os.getenv("PRECIO_CTX_TTL_S", "300"))
+_MAXSIZE = int(os.getenv("PRECIO_CTX_MAXSIZE", "5000"))
+
+cliente_ctx_cache = ContextCache("cliente_ctx", maxsize=_MAXSIZE, ttl_s=_TTL_S)
+producto_ctx_cache = ContextCache("producto_ctx", maxsize=_MAXSIZE, ttl_s=_TTL_S)
+
+
+def invalidar_cliente_ctx(clienteid: Optional[int] = None) -> None:
+    """Llamar al guardar cliente o direcciones (None = todos)."""
+    cliente_ctx_cache.invalidate(clave_ctx(clienteid))
+
+
+def invalidar_producto_ctx(productoid: Optional[int] = None) -> None:
+    """Llamar al guardar producto o producto_tipo (None = todos)."""
+    producto_ctx_cache.invalidate(clave_ctx(productoid))
+
+
+def stats_ctx_cache() -> Dict[str, Dict[str, Any]]:
+    """Contadores de las dos cachés (parciales: contextos no guardados por un error de consulta)."""
+    return {
+        "cliente_ctx": cliente_ctx_cache.stats(),
+        "producto_ctx": producto_ctx_cache.stats(),
+    }
+
+
+def clave_ctx(v) -> Optional[Hashable]:
+    if v is None:
+        return None
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return v
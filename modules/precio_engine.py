@@ -22,27 +22,36 @@
 #   dando preferencia a coincidencia exacta de tipo_producto; fallback a "general" (tipo null)
 #
 # Redondeo a 2 decimales en todos los importes.
+#
+# Las reglas se consultan a través de un índice compilado (modules.tarifa_indice).
+# Los contextos de cliente/producto pasan por la caché de modules.precio_cache.
+# El IVA se resuelve con la tabla precalculada de modules.impuesto_tabla.
 
 from datetime import date
-from math import prod
-from turtle import st
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable
+
+from modules.impuesto_tabla import (
+    IMPUESTO_COLUMNAS,
+    PRODUCTO_TIPO_COLUMNAS,
+    compilar_tabla_iva,
+    get_tabla_iva,
+)
+from modules.precio_cache import PARCIAL, clave_ctx, cliente_ctx_cache, producto_ctx_cache
+from modules.tarifa_indice import (
+    NIVELES,
+    REGLA_COLUMNAS,
+    IndiceReglas,
+    _is_active_window,
+    compilar_indice,
+    get_indice_reglas,
+    leer_paginado,
+)
 
 
 def _today_iso(d: Optional[date] = None) -> str:
     return (d or date.today()).isoformat()
 
 
-def _is_active_window(row: Dict[str, Any], fecha_iso: str) -> bool:
-    fi = row.get("fecha_inicio")
-    ff = row.get("fecha_fin")
-    if fi and fi > fecha_iso:
-        return False
-    if ff and ff < fecha_iso:
-        return False
-    return True
-
-
 def _first_or_none(rows):
     return rows[0] if rows else None
 
@@ -51,30 +60,42 @@ def _round2(x: float) -> float:
     return round(float(x or 0.0) + 1e-12, 2)  # evitar artefactos binarios
 
 def _fetch_cliente_ctx(supabase, clienteid: Optional[int]) -> Dict[str, Any]:
-    ctx = {
+    if not clienteid:
+        return _query_cliente_ctx(supabase, clienteid)
+    return cliente_ctx_cache.get_or_load(
+        clave_ctx(clienteid), lambda: _query_cliente_ctx(supabase, clienteid)
+    )
+
+
+def _cliente_ctx_vacio() -> Dict[str, Any]:
+    return {
         "grupoid": 0,
         "regionid": None,
         "region_nombre": "España",
         "region_origen": None
     }
 
+
+def _query_cliente_ctx(supabase, clienteid: Optional[int]) -> Dict[str, Any]:
+    ctx = _cliente_ctx_vacio()
+
     if not clienteid:
         return ctx
 
     # grupo
     try:
-        cli = (
+        cli = _first_or_none(
             supabase.table("cliente")
             .select("clienteid, grupoid")
             .eq("clienteid", clienteid)
-            .single()
+            .limit(1)
             .execute()
             .data
         )
         if cli and cli.get("grupoid"):
             ctx["grupoid"] = cli["grupoid"]
-    except:
-        pass
+    except Exception:
+        ctx[PARCIAL] = True
 
     # dirección de envío
     try:
@@ -90,8 +111,8 @@ def _fetch_cliente_ctx(supabase, clienteid: Optional[int]) -> Dict[str, Any]:
         if env:
             ctx["regionid"] = env[0]["regionid"]
             ctx["region_origen"] = "envio"
-    except:
-        pass
+    except Exception:
+        ctx[PARCIAL] = True
 
     # dirección fiscal si no hay envío
     if ctx["regionid"] is None:
@@ -108,25 +129,137 @@ def _fetch_cliente_ctx(supabase, clienteid: Optional[int]) -> Dict[str, Any]:
             if fac:
                 ctx["regionid"] = fac[0]["regionid"]
                 ctx["region_origen"] = "fiscal"
-        except:
-            pass
+        except Exception:
+            ctx[PARCIAL] = True
 
     # nombre región
     if ctx["regionid"]:
-        reg = (
-            supabase.table("region")
-            .select("nombre")
-            .eq("regionid", ctx["regionid"])
-            .single()
-            .execute()
-            .data
-        )
-        if reg:
-            ctx["region_nombre"] = reg["nombre"]
+        try:
+            reg = _first_or_none(
+                supabase.table("region")
+                .select("nombre")
+                .eq("regionid", ctx["regionid"])
+                .limit(1)
+                .execute()
+                .data
+            )
+            if reg:
+                ctx["region_nombre"] = reg["nombre"]
+        except Exception:
+            ctx[PARCIAL] = True
 
     return ctx
 
+def _in_chunks(
+    supabase,
+    tabla: str,
+    columnas: str,
+    col: str,
+    ids: List[Any],
+    size: int = 200,
+    errores: Optional[List[Exception]] = None,
+    orden: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Filas con col IN ids, por trozos de ids; cada trozo se pagina (PostgREST
+    devuelve como mucho 1000 filas por respuesta) ordenando por `orden`, por
+    defecto la primera de las columnas. Un trozo que falla se salta (y se anota
+    en errores).
+    """
+    orden = orden or columnas.split(",")[0].strip()
+    rows: List[Dict[str, Any]] = []
+    for i in range(0, len(ids), size):
+        trozo = ids[i:i + size]
+        try:
+            rows.extend(
+                leer_paginado(lambda: supabase.table(tabla).select(columnas).in_(col, trozo), orden)
+            )
+        except Exception as e:
+            if errores is not None:
+                errores.append(e)
+            continue
+    return rows
+
+
+def _fetch_cliente_ctxs(supabase, clienteids: List[Any]) -> Dict[Any, Dict[str, Any]]:
+    """
+    Contextos de varios clientes: usa la caché y carga los que faltan con
+    una consulta por tabla (cliente, cliente_direccion, region).
+    """
+    out: Dict[Any, Dict[str, Any]] = {}
+    faltan = []
+    for cid in dict.fromkeys(clienteids):
+        if not cid:
+            out[cid] = _cliente_ctx_vacio()
+            continue
+        ctx = cliente_ctx_cache.get(clave_ctx(cid))
+        if ctx is None:
+            faltan.append(cid)
+        else:
+            out[cid] = ctx
+    if not faltan:
+        return out
+
+    ids = [clave_ctx(c) for c in faltan]
+    errores: List[Exception] = []
+    grupos = {
+        r["clienteid"]: r.get("grupoid")
+        for r in _in_chunks(supabase, "cliente", "clienteid, grupoid", "clienteid", ids, errores=errores)
+    }
+    envio: Dict[Any, Any] = {}
+    fiscal: Dict[Any, Any] = {}
+    for r in _in_chunks(supabase, "cliente_direccion", "clienteid, tipo, regionid", "clienteid", ids, errores=errores):
+        destino = envio if r.get("tipo") == "envio" else fiscal if r.get("tipo") == "fiscal" else None
+        if destino is not None:
+            destino.setdefault(r["clienteid"], r.get("regionid"))
+
+    ctxs = {}
+    for cid, key in zip(faltan, ids):
+        ctx = _cliente_ctx_vacio()
+        if grupos.get(key):
+            ctx["grupoid"] = grupos[key]
+        if key in envio:
+            ctx["regionid"] = envio[key]
+            ctx["region_origen"] = "envio"
+        if ctx["regionid"] is None and key in fiscal:
+            ctx["regionid"] = fiscal[key]
+            ctx["region_origen"] = "fiscal"
+        ctxs[cid] = ctx
+
+    region_ids = sorted({c["regionid"] for c in ctxs.values() if c["regionid"]})
+    regiones = {
+        r["regionid"]: r.get("nombre")
+        for r in _in_chunks(supabase, "region", "regionid, nombre", "regionid", region_ids, errores=errores)
+    }
+    for cid, ctx in ctxs.items():
+        if ctx["regionid"] and regiones.get(ctx["regionid"]):
+            ctx["region_nombre"] = regiones[ctx["regionid"]]
+        # Con algún trozo fallido los contextos pueden llevar valores por defecto: no se guardan
+        if not errores:
+            cliente_ctx_cache.put(clave_ctx(cid), ctx)
+        out[cid] = ctx
+    return out
+
+
+def _producto_ctx_vacio() -> Dict[str, Any]:
+    return {
+        "familia_productoid": None,
+        "precio_generico": 0.0,
+        "impuestoid": None,
+        "producto_tipoid": None,
+        "tipo_producto_nombre": None,
+    }
+
+
 def _fetch_producto_ctx(supabase, productoid: Optional[int]) -> Dict[str, Any]:
+    if not productoid:
+        return _producto_ctx_vacio()
+    return producto_ctx_cache.get_or_load(
+        clave_ctx(productoid), lambda: _query_producto_ctx(supabase, productoid)
+    )
+
+
+def _query_producto_ctx(supabase, productoid: Optional[int]) -> Dict[str, Any]:
     """
     Devuelve datos base del producto:
     - familia_productoid
@@ -135,21 +268,15 @@ def _fetch_producto_ctx(supabase, productoid: Optional[int]) -> Dict[str, Any]:
     - producto_tipoid
     - nombre_tipo_producto (para IVA por tipo)
     """
-    ctx = {
-        "familia_productoid": None,
-        "precio_generico": 0.0,
-        "impuestoid": None,
-        "producto_tipoid": None,
-        "tipo_producto_nombre": None,
-    }
+    ctx = _producto_ctx_vacio()
     if not productoid:
         return ctx
     try:
-        prod = (
+        prod = _first_or_none(
             supabase.table("producto")
             .select("familia_productoid, precio_generico, impuestoid, producto_tipoid")
             .eq("productoid", productoid)
-            .single()
+            .limit(1)
             .execute()
             .data
         )
@@ -161,11 +288,11 @@ def _fetch_producto_ctx(supabase, productoid: Optional[int]) -> Dict[str, Any]:
 
             # nombre del tipo (para búsqueda de IVA por tipo)
             if ctx["producto_tipoid"]:
-                trow = (
+                trow = _first_or_none(
                     supabase.table("producto_tipo")
                     .select("nombre, impuestoid")
                     .eq("producto_tipoid", ctx["producto_tipoid"])
-                    .single()
+                    .limit(1)
                     .execute()
                     .data
                 )
@@ -174,6 +301,34 @@ def _fetch_producto_ctx(supabase, productoid: Optional[int]) -> Dict[str, Any]:
                     # si producto no trae impuestoid, heredar del tipo
                     if not ctx["impuestoid"] and trow.get("impuestoid"):
                         ctx["impuestoid"] = trow.get("impuestoid")
+    except Exception:
+        ctx[PARCIAL] = True
+    return ctx
+
+
+def _producto_ctx_desde_snapshot(snapshot: Dict[str, Any], productoid: Optional[int]) -> Dict[str, Any]:
+    """Mismo contrato que _fetch_producto_ctx, pero leyendo del snapshot en memoria."""
+    ctx = _producto_ctx_vacio()
+    if not productoid:
+        return ctx
+    try:
+        prod = snapshot["productos"].get(int(productoid))
+    except (TypeError, ValueError):
+        prod = None
+    if not prod:
+        return ctx
+    try:
+        ctx["familia_productoid"] = prod.get("familia_productoid")
+        ctx["precio_generico"] = float(prod.get("precio_generico") or 0.0)
+        ctx["impuestoid"] = prod.get("impuestoid")
+        ctx["producto_tipoid"] = prod.get("producto_tipoid")
+
+        if ctx["producto_tipoid"]:
+            trow = snapshot["producto_tipos"].get(ctx["producto_tipoid"])
+            if trow:
+                ctx["tipo_producto_nombre"] = trow.get("nombre")
+                if not ctx["impuestoid"] and trow.get("impuestoid"):
+                    ctx["impuestoid"] = trow.get("impuestoid")
     except Exception:
         pass
     return ctx
@@ -191,145 +346,61 @@ def _resolve_impuesto_pct(
     fecha_iso: str,
 ) -> Dict[str, Any]:
     """
-    Determina el IVA aplicable según producto, tipo y región.
+    Determina el IVA aplicable según producto, tipo y región
+    (tabla precalculada en modules.impuesto_tabla).
     """
-    # 1️⃣ Impuesto del producto
-    if product_impuestoid:
-        try:
-            imp = (
-                supabase.table("impuesto")
-                .select("impuestoid, nombre, porcentaje, pais, habilitado, fecha_inicio, fecha_fin")
-                .eq("impuestoid", product_impuestoid)
-                .single()
-                .execute()
-                .data
-            )
-            if imp and imp.get("habilitado") and _is_active_window(imp, fecha_iso):
-                return {"iva_pct": float(imp["porcentaje"]), "iva_nombre": imp["nombre"], "iva_origen": "producto"}
-        except Exception:
-            pass
-
-    # 2️⃣ Impuesto del tipo de producto (si no tiene propio)
-    if producto_tipoid:
-        try:
-            tipo = (
-                supabase.table("producto_tipo")
-                .select("impuestoid, nombre")
-                .eq("producto_tipoid", producto_tipoid)
-                .single()
-                .execute()
-                .data
-            )
-            if tipo and tipo.get("impuestoid"):
-                imp = (
-                    supabase.table("impuesto")
-                    .select("nombre, porcentaje, pais, habilitado, fecha_inicio, fecha_fin")
-                    .eq("impuestoid", tipo["impuestoid"])
-                    .single()
-                    .execute()
-                    .data
-                )
-                if imp and imp.get("habilitado") and _is_active_window(imp, fecha_iso):
-                    return {"iva_pct": float(imp["porcentaje"]), "iva_nombre": imp["nombre"], "iva_origen": "producto_tipo"}
-        except Exception:
-            pass
-
-    # 3️⃣ Búsqueda contextual por tipo_producto + país/región
-    try:
-        q = supabase.table("impuesto").select("nombre, porcentaje, tipo_producto, pais, habilitado, fecha_inicio, fecha_fin")
-        q = q.eq("habilitado", True)
-        if region_nombre:
-            q = q.eq("pais", region_nombre)
-        imps = q.execute().data or []
-        imps = [i for i in imps if _is_active_window(i, fecha_iso)]
-
-        exact = [i for i in imps if (i.get("tipo_producto") or "").lower() == (producto_tipo_nombre or "").lower()]
-        if exact:
-            i0 = exact[0]
-            return {"iva_pct": float(i0["porcentaje"]), "iva_nombre": i0["nombre"], "iva_origen": "busqueda"}
-
-        general = [i for i in imps if not i.get("tipo_producto")]
-        if general:
-            i0 = general[0]
-            return {"iva_pct": float(i0["porcentaje"]), "iva_nombre": i0["nombre"], "iva_origen": "busqueda"}
-    except Exception:
-        pass
-
-    # 4️⃣ Fallback genérico España 21%
-    try:
-        imp_es = (
-            supabase.table("impuesto")
-            .select("nombre, porcentaje")
-            .eq("pais", "España")
-            .eq("habilitado", True)
-            .execute()
-            .data
-        )
-        if imp_es:
-            gen = next((i for i in imp_es if "general" in i.get("nombre", "").lower()), imp_es[0])
-            return {"iva_pct": float(gen["porcentaje"]), "iva_nombre": gen["nombre"], "iva_origen": "fallback"}
-    except Exception:
-        pass
-
-    return {"iva_pct": 0.0, "iva_nombre": None, "iva_origen": "desconocido"}
+    return get_tabla_iva(supabase).resolver(
+        product_impuestoid=product_impuestoid,
+        producto_tipoid=producto_tipoid,
+        producto_tipo_nombre=producto_tipo_nombre,
+        region_nombre=region_nombre,
+        fecha_iso=fecha_iso,
+    )
 
 # ======================================================
 # 🧮 Resolver tarifa aplicable según jerarquía
 # ======================================================
-def _resolve_tarifa(
-    supabase,
+_TARIFA_FALLBACK = {
+    "nivel_tarifa": "fallback_general",
+    "tarifaid": 5,
+    "tarifa_aplicada": "Tarifa General",
+    "descuento_pct": 5.0,
+    "regla_id": None,
+}
+
+
+def _elegir_tarifa(
+    indice: IndiceReglas,
     fecha_iso: str,
     *,
+    get_tarifa: Callable[[int], Optional[Dict[str, Any]]],
+    listar_cliente_tarifa: Callable[[Optional[int]], List[Dict[str, Any]]],
     clienteid: Optional[int],
     grupoid: Optional[int],
     productoid: Optional[int],
     familiaid: Optional[int],
 ) -> Dict[str, Any]:
     """
-    Devuelve la mejor tarifa aplicable respetando jerarquía, fechas y prioridad.
-    Si no encuentra ninguna válida, devuelve la Tarifa General (5%).
+    Aplica la jerarquía sobre el índice de reglas habilitadas.
+    Las tarifas y cliente_tarifa se obtienen mediante callables.
     """
+    out = dict(_TARIFA_FALLBACK)
 
-    out = {
-        "nivel_tarifa": "fallback_general",
-        "tarifaid": 5,
-        "tarifa_aplicada": "Tarifa General",
-        "descuento_pct": 5.0,
-        "regla_id": None,
-    }
-
-    try:
-        # Cargar todas las reglas activas
-        reglas = (
-            supabase.table("tarifa_regla")
-            .select(
-                "tarifa_reglaid, tarifaid, clienteid, grupoid, productoid, familia_productoid, "
-                "fecha_inicio, fecha_fin, prioridad, habilitada"
-            )
-            .eq("habilitada", True)
-            .execute()
-            .data
-            or []
-        )
-    except Exception:
-        reglas = []
-
-    # Filtrar por fecha vigente
-    reglas = [r for r in reglas if _is_active_window(r, fecha_iso)]
-    if not reglas:
+    # Sin ninguna regla vigente en la fecha no se consulta nada más
+    if not indice.hay_vigentes(fecha_iso):
         return out
 
-    # 🔹 Definir jerarquía (más específica a menos)
-    jerarquia = [
-        ("producto+cliente", lambda r: r["clienteid"] == clienteid and r["productoid"] == productoid),
-        ("familia+cliente",  lambda r: r["clienteid"] == clienteid and r["familia_productoid"] == familiaid),
-        ("producto+grupo",   lambda r: r["grupoid"] == grupoid and r["productoid"] == productoid),
-        ("familia+grupo",    lambda r: r["grupoid"] == grupoid and r["familia_productoid"] == familiaid),
-    ]
+    # 🔹 Jerarquía (más específica a menos): clave de búsqueda por nivel
+    claves = {
+        "clienteid": clienteid,
+        "grupoid": grupoid,
+        "productoid": productoid,
+        "familia_productoid": familiaid,
+    }
 
     # 🔹 Buscar mejor regla según jerarquía
-    for nivel, cond in jerarquia:
-        candidatas = [r for r in reglas if cond(r)]
+    for nivel, col_a, col_b in NIVELES:
+        candidatas = indice.candidatas(nivel, claves[col_a], claves[col_b], fecha_iso)
         if not candidatas:
             continue
 
@@ -337,14 +408,7 @@ def _resolve_tarifa(
         enriched = []
         for r in candidatas:
             try:
-                t = (
-                    supabase.table("tarifa")
-                    .select("tarifaid, nombre, descuento_pct, habilitada")
-                    .eq("tarifaid", r["tarifaid"])
-                    .single()
-                    .execute()
-                    .data
-                )
+                t = get_tarifa(r["tarifaid"])
                 if not t or not t.get("habilitada"):
                     continue
 
@@ -370,24 +434,10 @@ def _resolve_tarifa(
 
     # 🔹 Cliente_tarifa (directa) si tiene alguna vigente
     try:
-        cts = (
-            supabase.table("cliente_tarifa")
-            .select("tarifaid, fecha_desde, fecha_hasta")
-            .eq("clienteid", clienteid)
-            .execute()
-            .data
-            or []
-        )
+        cts = listar_cliente_tarifa(clienteid)
         cts = [c for c in cts if _is_active_window({"fecha_inicio": c.get("fecha_desde"), "fecha_fin": c.get("fecha_hasta")}, fecha_iso)]
         if cts:
-            t = (
-                supabase.table("tarifa")
-                .select("tarifaid, nombre, descuento_pct, habilitada")
-                .eq("tarifaid", cts[0]["tarifaid"])
-                .single()
-                .execute()
-                .data
-            )
+            t = get_tarifa(cts[0]["tarifaid"])
             if t and t.get("habilitada"):
                 return {
                     "nivel_tarifa": "cliente_tarifa",
@@ -403,49 +453,71 @@ def _resolve_tarifa(
     return out
 
 
-# ======================================================
-# 💸 FUNCIÓN PRINCIPAL — Cálculo completo de línea
-# ======================================================
-def calcular_precio_linea(
+def _resolve_tarifa(
     supabase,
-    clienteid: Optional[int] = None,
-    productoid: Optional[int] = None,
-    precio_base_unit: Optional[float] = None,
-    cantidad: float = 1.0,
-    fecha: Optional[date] = None,
+    fecha_iso: str,
+    *,
+    clienteid: Optional[int],
+    grupoid: Optional[int],
+    productoid: Optional[int],
+    familiaid: Optional[int],
 ) -> Dict[str, Any]:
-    fecha_iso = _today_iso(fecha)
-    cli_ctx = _fetch_cliente_ctx(supabase, clienteid)
-    pr_ctx = _fetch_producto_ctx(supabase, productoid)
+    """
+    Devuelve la mejor tarifa aplicable respetando jerarquía, fechas y prioridad.
+    Si no encuentra ninguna válida, devuelve la Tarifa General (5%).
+    """
+    indice = get_indice_reglas(supabase)
 
-    grupoid = cli_ctx.get("grupoid")
-    familiaid = pr_ctx.get("familia_productoid")
+    def get_tarifa(tarifaid):
+        return (
+            supabase.table("tarifa")
+            .select("tarifaid, nombre, descuento_pct, habilitada")
+            .eq("tarifaid", tarifaid)
+            .single()
+            .execute()
+            .data
+        )
 
-    unit_bruto = float(precio_base_unit or pr_ctx.get("precio_generico") or 0.0)
+    def listar_cliente_tarifa(cid):
+        return (
+            supabase.table("cliente_tarifa")
+            .select("tarifaid, fecha_desde, fecha_hasta")
+            .eq("clienteid", cid)
+            .execute()
+            .data
+            or []
+        )
 
-    # 🔹 Resolver tarifa según jerarquía
-    tarifa = _resolve_tarifa(
-        supabase,
+    return _elegir_tarifa(
+        indice,
         fecha_iso,
+        get_tarifa=get_tarifa,
+        listar_cliente_tarifa=listar_cliente_tarifa,
         clienteid=clienteid,
         grupoid=grupoid,
         productoid=productoid,
         familiaid=familiaid,
     )
 
+
+# ======================================================
+# 🧩 Composición del resultado (compartida por línea y lote)
+# ======================================================
+def _componer_resultado(
+    *,
+    cli_ctx: Dict[str, Any],
+    pr_ctx: Dict[str, Any],
+    tarifa: Dict[str, Any],
+    ivx: Dict[str, Any],
+    precio_base_unit: Optional[float],
+    cantidad: float,
+) -> Dict[str, Any]:
+    unit_bruto = float(precio_base_unit or pr_ctx.get("precio_generico") or 0.0)
+
     descuento_pct = float(tarifa.get("descuento_pct") or 0.0)
     unit_neto = _round2(unit_bruto * (1 - descuento_pct / 100.0))
     subtotal = _round2(unit_neto * cantidad)
 
-    # 🔹 Resolver IVA
-    ivx = _resolve_impuesto_pct(
-        supabase,
-        product_impuestoid=pr_ctx.get("impuestoid"),
-        producto_tipoid=pr_ctx.get("producto_tipoid"),
-        producto_tipo_nombre=pr_ctx.get("tipo_producto_nombre"),
-        region_nombre=cli_ctx.get("region_nombre") or "España",
-        fecha_iso=fecha_iso,
-    )
     iva_pct = float(ivx.get("iva_pct") or 0.0)
     iva_importe = _round2(subtotal * iva_pct / 100.0)
     total_con_iva = _round2(subtotal + iva_importe)
@@ -467,3 +539,206 @@ def calcular_precio_linea(
         "region": cli_ctx.get("region_nombre") or "España",
         "region_origen": cli_ctx.get("region_origen"),
     }
+
+
+# ======================================================
+# 💸 FUNCIÓN PRINCIPAL — Cálculo completo de línea
+# ======================================================
+def calcular_precio_linea(
+    supabase,
+    clienteid: Optional[int] = None,
+    productoid: Optional[int] = None,
+    precio_base_unit: Optional[float] = None,
+    cantidad: float = 1.0,
+    fecha: Optional[date] = None,
+) -> Dict[str, Any]:
+    fecha_iso = _today_iso(fecha)
+    cli_ctx = _fetch_cliente_ctx(supabase, clienteid)
+    pr_ctx = _fetch_producto_ctx(supabase, productoid)
+
+    # 🔹 Resolver tarifa según jerarquía
+    tarifa = _resolve_tarifa(
+        supabase,
+        fecha_iso,
+        clienteid=clienteid,
+        grupoid=cli_ctx.get("grupoid"),
+        productoid=productoid,
+        familiaid=pr_ctx.get("familia_productoid"),
+    )
+
+    # 🔹 Resolver IVA
+    ivx = _resolve_impuesto_pct(
+        supabase,
+        product_impuestoid=pr_ctx.get("impuestoid"),
+        producto_tipoid=pr_ctx.get("producto_tipoid"),
+        producto_tipo_nombre=pr_ctx.get("tipo_producto_nombre"),
+        region_nombre=cli_ctx.get("region_nombre") or "España",
+        fecha_iso=fecha_iso,
+    )
+
+    return _componer_resultado(
+        cli_ctx=cli_ctx,
+        pr_ctx=pr_ctx,
+        tarifa=tarifa,
+        ivx=ivx,
+        precio_base_unit=precio_base_unit,
+        cantidad=cantidad,
+    )
+
+
+# ======================================================
+# 📦 CÁLCULO EN LOTE — snapshot de reglas en memoria
+# ======================================================
+def _select_all(supabase, tabla: str, columnas: str, **eq) -> List[Dict[str, Any]]:
+    """Todas las filas de la tabla (paginadas por la primera columna) con los filtros eq."""
+    def consulta():
+        q = supabase.table(tabla).select(columnas)
+        for col, val in eq.items():
+            q = q.eq(col, val)
+        return q
+
+    try:
+        return leer_paginado(consulta, columnas.split(",")[0].strip())
+    except Exception:
+        return []
+
+
+def cargar_snapshot_precios(
+    supabase,
+    clienteid: Optional[int] = None,
+    productoids: Optional[List[int]] = None,
+    clienteids: Optional[List[int]] = None,
+) -> Dict[str, Any]:
+    """
+    Carga de una vez las tablas que usa el motor de precios:
+    tarifa, tarifa_regla (habilitadas), cliente_tarifa, impuesto y producto_tipo,
+    más los productos indicados. Cada tabla cuesta una sola consulta.
+    clienteids permite cargar cliente_tarifa de varios clientes a la vez.
+    """
+    reglas = _select_all(supabase, "tarifa_regla", REGLA_COLUMNAS, habilitada=True)
+    tarifas = _select_all(supabase, "tarifa", "tarifaid, nombre, descuento_pct, habilitada")
+    impuestos = _select_all(supabase, "impuesto", IMPUESTO_COLUMNAS)
+    tipos = _select_all(supabase, "producto_tipo", PRODUCTO_TIPO_COLUMNAS)
+    tabla_iva = compilar_tabla_iva(impuestos, tipos)
+
+    cliente_tarifas: Dict[Any, List[Dict[str, Any]]] = {}
+    if clienteid:
+        cliente_tarifas[clienteid] = _select_all(
+            supabase, "cliente_tarifa", "tarifaid, fecha_desde, fecha_hasta", clienteid=clienteid
+        )
+
+    snapshot = {
+        "indice_reglas": compilar_indice(reglas),
+        "tarifas": {t["tarifaid"]: t for t in tarifas},
+        "cliente_tarifas": cliente_tarifas,
+        "tabla_iva": tabla_iva,
+        "producto_tipos": tabla_iva.tipos_por_id,
+        "productos": {},
+        "clientes_cargados": {clave_ctx(clienteid)} if clienteid else set(),
+    }
+    completar_snapshot(supabase, snapshot, productoids=productoids, clienteids=clienteids)
+    return snapshot
+
+
+def completar_snapshot(
+    supabase,
+    snapshot: Dict[str, Any],
+    *,
+    productoids: Optional[List[int]] = None,
+    clienteids: Optional[List[int]] = None,
+) -> Dict[str, Any]:
+    """
+    Añade al snapshot los productos y cliente_tarifa que aún no tenga
+    (para procesos por lotes que van descubriendo ids).
+    """
+    nuevos_cli = sorted({int(c) for c in (clienteids or []) if c} - snapshot["clientes_cargados"])
+    for r in _in_chunks(
+        supabase, "cliente_tarifa", "clienteid, tarifaid, fecha_desde, fecha_hasta", "clienteid", nuevos_cli
+    ):
+        snapshot["cliente_tarifas"].setdefault(r["clienteid"], []).append(r)
+    snapshot["clientes_cargados"].update(nuevos_cli)
+
+    nuevos_prod = sorted({int(p) for p in (productoids or []) if p} - set(snapshot["productos"]))
+    for r in _in_chunks(
+        supabase,
+        "producto",
+        "productoid, familia_productoid, precio_generico, impuestoid, producto_tipoid",
+        "productoid",
+        nuevos_prod,
+    ):
+        snapshot["productos"][r["productoid"]] = r
+    return snapshot
+
+
+def _calcular_desde_snapshot(
+    snapshot: Dict[str, Any],
+    cli_ctx: Dict[str, Any],
+    *,
+    clienteid: Optional[int],
+    productoid: Optional[int],
+    precio_base_unit: Optional[float],
+    cantidad: float,
+    fecha_iso: str,
+) -> Dict[str, Any]:
+    pr_ctx = _producto_ctx_desde_snapshot(snapshot, productoid)
+
+    tarifa = _elegir_tarifa(
+        snapshot["indice_reglas"],
+        fecha_iso,
+        get_tarifa=snapshot["tarifas"].get,
+        listar_cliente_tarifa=lambda cid: snapshot["cliente_tarifas"].get(cid, []),
+        clienteid=clienteid,
+        grupoid=cli_ctx.get("grupoid"),
+        productoid=productoid,
+        familiaid=pr_ctx.get("familia_productoid"),
+    )
+
+    ivx = snapshot["tabla_iva"].resolver(
+        product_impuestoid=pr_ctx.get("impuestoid"),
+        producto_tipoid=pr_ctx.get("producto_tipoid"),
+        producto_tipo_nombre=pr_ctx.get("tipo_producto_nombre"),
+        region_nombre=cli_ctx.get("region_nombre") or "España",
+        fecha_iso=fecha_iso,
+    )
+
+    return _componer_resultado(
+        cli_ctx=cli_ctx,
+        pr_ctx=pr_ctx,
+        tarifa=tarifa,
+        ivx=ivx,
+        precio_base_unit=precio_base_unit,
+        cantidad=cantidad,
+    )
+
+
+def calcular_precios_lote(
+    supabase,
+    clienteid: Optional[int],
+    lineas: List[Dict[str, Any]],
+    fecha: Optional[date] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Calcula el precio de varias líneas de un mismo cliente.
+    Cada línea: {"productoid", "cantidad", "precio_base_unit"(opcional)}.
+    Devuelve una lista (mismo orden) con el mismo formato que calcular_precio_linea.
+    """
+    fecha_iso = _today_iso(fecha)
+    cli_ctx = _fetch_cliente_ctx(supabase, clienteid)
+    snapshot = cargar_snapshot_precios(
+        supabase,
+        clienteid=clienteid,
+        productoids=[l.get("productoid") for l in lineas],
+    )
+
+    return [
+        _calcular_desde_snapshot(
+            snapshot,
+            cli_ctx,
+            clienteid=clienteid,
+            productoid=l.get("productoid"),
+            precio_base_unit=l.get("precio_base_unit"),
+            cantidad=float(l.get("cantidad") if l.get("cantidad") is not None else 1.0),
+            fecha_iso=fecha_iso,
+        )
+        for l in lineas
+    ]
@@ -0,0 +1,187 @@
+# ======================================================
+# ⚡ MOTOR DE PRECIOS VECTORIZADO — EnteNova Gnosis
+# ======================================================
+# Camino masivo del motor de modules.precio_engine para repreciar catálogos
+# o simular tarifas sobre cientos de miles de líneas:
+# - La tarifa y el IVA se resuelven una vez por combinación única
+#   (clienteid, productoid, fecha) usando el snapshot en memoria.
+# - Los importes (descuento, neto, subtotal, IVA, total) se calculan con
+#   NumPy sobre arrays, con el mismo redondeo que _round2.
+
+from datetime import date
+from typing import Any, Dict, Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from modules.precio_engine import (
+    _elegir_tarifa,
+    _fetch_cliente_ctxs,
+    _producto_ctx_desde_snapshot,
+    _today_iso,
+    cargar_snapshot_precios,
+    completar_snapshot,
+)
+from modules.tarifa_indice import as_iso_date
+
+
+def round2(x) -> np.ndarray:
+    """
+    Equivalente vectorizado de precio_engine._round2.
+    np.round coincide con round() salvo en empates .xx5; esos pocos
+    valores se recalculan con round() para dar exactamente el mismo resultado.
+    """
+    v = np.asarray(x, dtype=float)
+    v = np.where(np.isnan(v), 0.0, v) + 1e-12
+    out = np.round(v, 2)
+    escalado = v * 100.0
+    empate = np.abs(escalado - np.floor(escalado) - 0.5) < 1e-6
+    if empate.any():
+        out[empate] = [round(float(t), 2) for t in v[empate]]
+    return out
+
+
+def kernel_importes(unit_bruto, descuento_pct, cantidad, iva_pct) -> Dict[str, np.ndarray]:
+    """Cálculo de importes de calcular_precio_linea sobre arrays alineados."""
+    unit_bruto = np.asarray(unit_bruto, dtype=float)
+    descuento_pct = np.asarray(descuento_pct, dtype=float)
+    cantidad = np.asarray(cantidad, dtype=float)
+    iva_pct = np.asarray(iva_pct, dtype=float)
+
+    unit_neto = round2(unit_bruto * (1 - descuento_pct / 100.0))
+    subtotal = round2(unit_neto * cantidad)
+    iva_importe = round2(subtotal * iva_pct / 100.0)
+    total_con_iva = round2(subtotal + iva_importe)
+
+    return {
+        "unit_bruto": round2(unit_bruto),
+        "descuento_pct": round2(descuento_pct),
+        "unit_neto_sin_iva": unit_neto,
+        "subtotal_sin_iva": subtotal,
+        "iva_pct": iva_pct,
+        "iva_importe": iva_importe,
+        "total_con_iva": total_con_iva,
+    }
+
+
+def _id_o_none(v) -> Optional[int]:
+    if v is None or (isinstance(v, float) and np.isnan(v)) or v is pd.NA:
+        return None
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def resolver_condiciones(
+    snapshot: Dict[str, Any],
+    cli_ctxs: Dict[Any, Dict[str, Any]],
+    claves: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Para cada fila única (clienteid, productoid, fecha_iso) devuelve
+    precio_generico, descuento_pct, iva_pct y la trazabilidad de tarifa/IVA.
+    """
+    filas = []
+    for clienteid, productoid, fecha_iso in claves.itertuples(index=False, name=None):
+        cli_ctx = cli_ctxs.get(clienteid) or {}
+        pr_ctx = _producto_ctx_desde_snapshot(snapshot, productoid)
+        tarifa = _elegir_tarifa(
+            snapshot["indice_reglas"],
+            fecha_iso,
+            get_tarifa=snapshot["tarifas"].get,
+            listar_cliente_tarifa=lambda cid: snapshot["cliente_tarifas"].get(cid, []),
+            clienteid=clienteid,
+            grupoid=cli_ctx.get("grupoid"),
+            productoid=productoid,
+            familiaid=pr_ctx.get("familia_productoid"),
+        )
+        ivx = snapshot["tabla_iva"].resolver(
+            product_impuestoid=pr_ctx.get("impuestoid"),
+            producto_tipoid=pr_ctx.get("producto_tipoid"),
+            producto_tipo_nombre=pr_ctx.get("tipo_producto_nombre"),
+            region_nombre=cli_ctx.get("region_nombre") or "España",
+            fecha_iso=fecha_iso,
+        )
+        filas.append({
+            "clienteid": clienteid,
+            "productoid": productoid,
+            "fecha_iso": fecha_iso,
+            "grupoid": cli_ctx.get("grupoid"),
+            "familia_productoid": pr_ctx.get("familia_productoid"),
+            "precio_generico": float(pr_ctx.get("precio_generico") or 0.0),
+            "descuento_pct": float(tarifa.get("descuento_pct") or 0.0),
+            "iva_pct": float(ivx.get("iva_pct") or 0.0),
+            "tarifaid": tarifa.get("tarifaid"),
+            "nivel_tarifa": tarifa.get("nivel_tarifa"),
+            "regla_id": tarifa.get("regla_id"),
+            "iva_origen": ivx.get("iva_origen"),
+        })
+    return pd.DataFrame(filas)
+
+
+def calcular_precios_vectorizado(
+    supabase,
+    clienteids: Iterable[Any],
+    productoids: Iterable[Any],
+    cantidades: Iterable[Any],
+    precios_base: Optional[Iterable[Any]] = None,
+    fechas: Union[None, date, str, Iterable[Any]] = None,
+    *,
+    snapshot: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """
+    Precio de muchas líneas (varios clientes y productos) en bloque.
+    precios_base puede contener None/NaN (se usa precio_generico); fechas puede
+    ser una fecha única o un array alineado (por defecto, hoy).
+    Devuelve un DataFrame con las columnas de importes de calcular_precio_linea
+    más tarifaid, nivel_tarifa, regla_id e iva_origen, en el orden de entrada.
+    """
+    df = pd.DataFrame({
+        "clienteid": pd.Series([_id_o_none(c) for c in clienteids], dtype=object),
+        "productoid": pd.Series([_id_o_none(p) for p in productoids], dtype=object),
+    })
+    df["cantidad"] = pd.to_numeric(pd.Series(list(cantidades), dtype=object), errors="coerce").to_numpy(dtype=float)
+    if precios_base is None:
+        df["precio_base_unit"] = np.nan
+    else:
+        df["precio_base_unit"] = pd.to_numeric(pd.Series(list(precios_base), dtype=object), errors="coerce").to_numpy(dtype=float)
+
+    if fechas is None or isinstance(fechas, (date, str)):
+        df["fecha_iso"] = as_iso_date(fechas) or _today_iso()
+    else:
+        df["fecha_iso"] = [as_iso_date(f) or _today_iso() for f in fechas]
+
+    if df.empty:
+        return df
+
+    ids_cli = [c for c in df["clienteid"].unique().tolist() if c is not None]
+    ids_prod = [p for p in df["productoid"].unique().tolist() if p is not None]
+    if snapshot is None:
+        snapshot = cargar_snapshot_precios(supabase, productoids=ids_prod, clienteids=ids_cli)
+    else:
+        completar_snapshot(supabase, snapshot, productoids=ids_prod, clienteids=ids_cli)
+    cli_ctxs = _fetch_cliente_ctxs(supabase, [None] + ids_cli)
+
+    claves = df[["clienteid", "productoid", "fecha_iso"]].drop_duplicates()
+    cond = resolver_condiciones(snapshot, cli_ctxs, claves)
+    df = df.merge(cond, on=["clienteid", "productoid", "fecha_iso"], how="left", sort=False)
+
+    # unit_bruto = precio_base_unit or precio_generico or 0.0
+    base = df["precio_base_unit"].to_numpy(dtype=float)
+    usar_base = ~np.isnan(base) & (base != 0)
+    unit_bruto = np.where(usar_base, base, df["precio_generico"].to_numpy(dtype=float))
+
+    cantidad = df["cantidad"].to_numpy(dtype=float)
+    cantidad = np.where(np.isnan(cantidad), 1.0, cantidad)
+
+    importes = kernel_importes(
+        unit_bruto,
+        df["descuento_pct"].to_numpy(dtype=float),
+        cantidad,
+        df["iva_pct"].to_numpy(dtype=float),
+    )
+    for col, valores in importes.items():
+        df[col] = valores
+    df["cantidad"] = cantidad
+    return df
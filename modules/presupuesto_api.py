@@ -6,11 +6,7 @@ from datetime import date
 from typing import Any, Dict, Optional
 
 import requests
-from modules.api_base import get_api_base
-
-
-def _base_url() -> str:
-    return get_api_base()
+from modules import api_client
 
 
 def _handle_response(resp: requests.Response) -> Any:
@@ -24,49 +20,48 @@ def _handle_response(resp: requests.Response) -> Any:
 
 
 def list_presupuestos(params: Optional[dict] = None) -> dict:
-    r = requests.get(f"{get_api_base()}/api/presupuestos", params=params, timeout=20)
+    r = api_client.get("/api/presupuestos", params=params, timeout=20)
     return _handle_response(r)
 
 
 def get_catalogos() -> dict:
-    r = requests.get(f"{get_api_base()}/api/presupuestos/catalogos", timeout=20)
+    r = api_client.get("/api/presupuestos/catalogos", timeout=20)
     return _handle_response(r)
 
 
 def get_presupuesto(presupuestoid: int) -> dict:
-    r = requests.get(f"{get_api_base()}/api/presupuestos/{presupuestoid}", timeout=20)
+    r = api_client.get(f"/api/presupuestos/{presupuestoid}", timeout=20)
     return _handle_response(r)
 
 
 def crear_presupuesto(payload: dict) -> dict:
-    r = requests.post(f"{_base_url()}/api/presupuestos", json=payload, timeout=20)
+    r = api_client.post("/api/presupuestos", json=payload, timeout=20)
     return _handle_response(r)
 
 
 def actualizar_presupuesto(presupuestoid: int, payload: dict) -> dict:
-    r = requests.put(f"{_base_url()}/api/presupuestos/{presupuestoid}", json=payload, timeout=20)
+    r = api_client.put(f"/api/presupuestos/{presupuestoid}", json=payload, timeout=20)
     return _handle_response(r)
 
 
 def borrar_presupuesto(presupuestoid: int) -> dict:
-    r = requests.delete(f"{_base_url()}/api/presupuestos/{presupuestoid}", timeout=20)
+    r = api_client.delete(f"/api/presupuestos/{presupuestoid}", timeout=20)
     return _handle_response(r)
 
 
 def listar_lineas(presupuestoid: int) -> list:
-    r = requests.get(f"{_base_url()}/api/presupuestos/{presupuestoid}/lineas", timeout=20)
+    r = api_client.get(f"/api/presupuestos/{presupuestoid}/lineas", timeout=20)
     return _handle_response(r)
 
 
 def agregar_linea(presupuestoid: int, payload: dict) -> int:
-    r = requests.post(f"{_base_url()}/api/presupuestos/{presupuestoid}/lineas", json=payload, timeout=20)
+    r = api_client.post(f"/api/presupuestos/{presupuestoid}/lineas", json=payload, timeout=20)
     return _handle_response(r)
 
 
 def recalcular_lineas(presupuestoid: int, fecha_calculo: Optional[date] = None) -> dict:
     params = {"fecha_calculo": fecha_calculo.isoformat()} if fecha_calculo else None
-    r = requests.post(
-        f"{_base_url()}/api/presupuestos/{presupuestoid}/recalcular",
+    r = api_client.post(f"/api/presupuestos/{presupuestoid}/recalcular",
         params=params,
         timeout=30,
     )
@@ -74,10 +69,10 @@ def recalcular_lineas(presupuestoid: int, fecha_calculo: Optional[date] = None)
 
 
 def convertir_a_pedido(presupuestoid: int) -> dict:
-    r = requests.post(f"{_base_url()}/api/presupuestos/{presupuestoid}/convertir-a-pedido", timeout=30)
+    r = api_client.post(f"/api/presupuestos/{presupuestoid}/convertir-a-pedido", timeout=30)
     return _handle_response(r)
 
 
 def cliente_basico(clienteid: int) -> dict:
-    r = requests.get(f"{_base_url()}/api/presupuestos/cliente/{clienteid}/basico", timeout=15)
+    r = api_client.get(f"/api/presupuestos/cliente/{clienteid}/basico", timeout=15)
     return _handle_response(r)
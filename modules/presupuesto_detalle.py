@@ -1,14 +1,14 @@
 import pandas as pd
-import requests
 import streamlit as st
 
-from modules.presupuesto_api import agregar_linea, listar_lineas, _base_url
+from modules import api_client
+from modules.presupuesto_api import agregar_linea, listar_lineas
 
 
 def _productos_options():
     try:
-        r = requests.get(
-            f"{_base_url()}/api/productos",
+        r = api_client.get(
+            "/api/productos",
             params={"page": 1, "page_size": 200, "sort_field": "nombre"},
             timeout=20,
         )
@@ -1,8 +1,8 @@
-import requests
 from datetime import date
 
 import streamlit as st
 
+from modules import api_client, data_cache
 from modules.presupuesto_api import (
     actualizar_presupuesto,
     cliente_basico,
@@ -10,7 +10,6 @@ from modules.presupuesto_api import (
     get_catalogos,
     get_presupuesto,
 )
-from modules.presupuesto_api import _base_url
 
 
 def _pick(row: dict, *keys, default=None):
@@ -23,7 +22,7 @@ def _pick(row: dict, *keys, default=None):
 def _load_direcciones(clienteid: int):
     """Devuelve (envio_options, env_by_id, fiscal_row)."""
     try:
-        r = requests.get(f"{_base_url()}/api/clientes/{clienteid}/direcciones", timeout=20)
+        r = api_client.get(f"/api/clientes/{clienteid}/direcciones", timeout=20)
         r.raise_for_status()
         rows = r.json() or []
     except Exception:
@@ -267,6 +266,7 @@ def render_presupuesto_form(presupuestoid=None, bloqueado=False, on_saved_rerun=
                 creado = crear_presupuesto(payload)
                 presupuestoid = creado.get("presupuestoid")
                 st.toast("Presupuesto creado.")
+            data_cache.emitir("presupuesto")
 
             if on_saved_rerun:
                 st.rerun()
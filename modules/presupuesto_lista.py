@@ -4,9 +4,9 @@ from datetime import date, datetime, timedelta
 from typing import Any, Dict, List, Optional
 
 import pandas as pd
-import requests
 import streamlit as st
 
+from modules import api_client, data_cache
 from modules.orbe_theme import apply_orbe_theme
 from modules.presupuesto_api import (
     list_presupuestos,
@@ -22,7 +22,6 @@ from modules.presupuesto_detalle import render_presupuesto_detalle
 from modules.presupuesto_form import render_presupuesto_form
 from modules.presupuesto_convert import convertir_presupuesto_a_pedido
 from modules.presupuesto_pdf import generate_pdf_for_download, build_pdf_bytes, upload_pdf_to_storage, _build_data_real
-from modules.presupuesto_api import _base_url
 from modules.ui.page import page
 from modules.ui.section import section
 from modules.ui.card import card
@@ -109,16 +108,24 @@ def _clear_pres_filters():
     st.session_state["pres_page"] = 1
 
 
-@st.cache_data(ttl=60)
-def _api_get_cached(path: str, params: Optional[dict] = None) -> dict:
+def _api_get(path: str, params: Optional[dict] = None) -> dict:
     try:
-        r = requests.get(f"{_base_url()}{path}", params=params, timeout=20)
+        r = api_client.get(path, params=params, timeout=20)
         r.raise_for_status()
         return r.json()
     except Exception:
         return {}
 
 
+def _api_get_cached(path: str, params: Optional[dict] = None) -> dict:
+    return data_cache.obtener(
+        data_cache.espacio_api(path),
+        (path, params),
+        lambda: _api_get(path, params=params),
+        ttl_s=60,
+    )
+
+
 def _estado_bucket(label: str):
     v = (label or "").lower()
     if any(k in v for k in ["acept", "convert"]):
@@ -174,6 +181,7 @@ def _emitir_pdf_presupuesto(supabase, presupuestoid: int, estados_map: dict):
     else:
         try:
             actualizar_presupuesto(presupuestoid, {"estado_presupuestoid": enviado_id})
+            data_cache.emitir("presupuesto")
         except Exception as e:
             st.error(f"Error actualizando estado: {e}")
             return
@@ -212,8 +220,8 @@ def _render_presupuesto_timeline(estado: str | None):
 
 def _api_products():
     try:
-        r = requests.get(
-            f"{_base_url()}/api/productos",
+        r = api_client.get(
+            "/api/productos",
             params={"page": 1, "page_size": 200, "sort_field": "nombre"},
             timeout=20,
         )
@@ -313,6 +321,7 @@ def _render_nuevo_presupuesto_inline():
                 except Exception as e:
                     st.warning(f"Presupuesto creado sin linea inicial: {e}")
 
+        data_cache.emitir("presupuesto")
         st.session_state["presupuesto_modal_id"] = pid
         st.session_state["show_presupuesto_modal"] = True
         st.session_state["show_creator"] = False
@@ -607,7 +616,12 @@ def render_presupuesto_lista(api_base: Optional[str] = None):
 
     page_size_cards, page_size_table = 12, 30
 
-    catalogos = get_catalogos()
+    # Catálogos y top clientes son independientes: se piden a la vez (el modal no usa el top)
+    tareas = {"catalogos": get_catalogos}
+    if not (st.session_state.get("show_presupuesto_modal") and st.session_state.get("presupuesto_modal_id")):
+        tareas["top"] = lambda: _api_get_cached("/api/presupuestos/top-clientes", params={"limit": 5})
+    lecturas = api_client.en_paralelo(tareas)
+    catalogos = lecturas["catalogos"].result()
     estados_map = {c["id"]: c["label"] for c in catalogos.get("estados", [])}
     clientes_map = {c["label"]: c["id"] for c in catalogos.get("clientes", [])}
 
@@ -635,7 +649,7 @@ def render_presupuesto_lista(api_base: Optional[str] = None):
 
         _render_estado_quick_filters(list(estados_map.values()))
 
-        top = _api_get_cached("/api/presupuestos/top-clientes", params={"limit": 5})
+        top = lecturas["top"].result()
         top_items = top.get("data") or []
         if top_items:
             st.subheader("Top 5 clientes con más presupuestos")
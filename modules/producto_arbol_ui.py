@@ -3,6 +3,7 @@ from typing import Any, Dict, List, Optional, Tuple
 
 import streamlit as st
 
+from modules import data_cache
 from modules.orbe_theme import apply_orbe_theme
 
 
@@ -34,7 +35,7 @@ def _price(v: Any) -> str:
         return "-"
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("productos", ttl_s=300)
 def _load_tree_data(_supabase) -> Tuple[List[dict], List[dict], List[dict]]:
     categorias = (
         _supabase.table("producto_categoria")
@@ -5,6 +5,8 @@ import streamlit as st
 from datetime import date
 
 from modules.ui.section import section
+from modules import data_cache
+from modules.precio_cache import invalidar_producto_ctx
 from modules.producto_models import (
     load_familias,
     load_tipos_producto,
@@ -205,6 +207,10 @@ def render_producto_form(supabase, productoid=None, on_saved_rerun=True):
                         icon="✅",
                     )
 
+                if productoid:
+                    invalidar_producto_ctx(productoid)
+                data_cache.emitir("producto")
+
                 if "prefill_familia_productoid" in st.session_state:
                     del st.session_state["prefill_familia_productoid"]
 
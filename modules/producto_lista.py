@@ -1,32 +1,20 @@
 import math
-import os
 from datetime import date, timedelta
 from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
-import requests
 import pandas as pd
 import streamlit as st
 from streamlit.components.v1 import html as st_html
 
+from modules import api_client, data_cache, ventas_producto
 from modules.orbe_theme import apply_orbe_theme
 from modules.producto_arbol_ui import render_arbol_productos
 from modules.producto_form import render_producto_form
 
 
-def _api_base() -> str:
-    try:
-        return st.secrets["ORBE_API_URL"]  # type: ignore[attr-defined]
-    except Exception:
-        return (
-            os.getenv("ORBE_API_URL")
-            or st.session_state.get("ORBE_API_URL")
-            or "http://127.0.0.1:8000"
-        )
-
-
 def _api_get(path: str, params: Optional[dict] = None, show_error: bool = True) -> dict:
     try:
-        r = requests.get(f"{_api_base()}{path}", params=params, timeout=20)
+        r = api_client.get(path, params=params, timeout=20)
         r.raise_for_status()
         return r.json()
     except Exception as e:
@@ -35,9 +23,13 @@ def _api_get(path: str, params: Optional[dict] = None, show_error: bool = True)
         return {}
 
 
-@st.cache_data(ttl=60)
 def _api_get_cached(path: str, params: Optional[dict] = None) -> dict:
-    return _api_get(path, params=params, show_error=False)
+    return data_cache.obtener(
+        data_cache.espacio_api(path),
+        (path, params),
+        lambda: _api_get(path, params=params, show_error=False),
+        ttl_s=60,
+    )
 
 
 def _ensure_icon_css():
@@ -141,10 +133,10 @@ def _sync_prod_compare_state():
         st.session_state["prod_detalle_id"] = items[0]["id"]
 
 
-@st.cache_data(ttl=120)
+@data_cache.cacheado("productos", ttl_s=120)
 def _fetch_producto_detalle_cached(productoid: int) -> dict:
     try:
-        res = requests.get(f"{_api_base()}/api/productos/{productoid}", timeout=15)
+        res = api_client.get(f"/api/productos/{productoid}", timeout=15)
         res.raise_for_status()
         return res.json() or {}
     except Exception as e:
@@ -390,72 +382,17 @@ def _load_pedido_lineas_for_producto(supa, product_id: int, since: date) -> List
     return res.data or []
 
 
-@st.cache_data(ttl=900)
 def _producto_sales_year(supa, product_id: int, year: int) -> tuple[float, float]:
-    start = date(year, 1, 1).isoformat()
-    end = date(year + 1, 1, 1).isoformat()
-    rows: List[dict] = []
-    page = 0
-    page_size = 1000
-    while page < 10:
-        start_i = page * page_size
-        end_i = start_i + page_size - 1
-        q = (
-            supa.table("pedido_linea")
-            .select("cantidad, subtotal, created_at, producto_id, producto_ref_origen")
-            .gte("created_at", start)
-            .lt("created_at", end)
-            .range(start_i, end_i)
-        )
-        try:
-            q = q.or_(f"producto_id.eq.{product_id},producto_ref_origen.eq.{product_id}")
-            res = q.execute()
-        except Exception:
-            res = q.eq("producto_id", product_id).execute()
-        data = res.data or []
-        if not data:
-            break
-        rows.extend(data)
-        page += 1
-    qty = sum(float(r.get("cantidad") or 0) for r in rows)
-    total = sum(float(r.get("subtotal") or 0) for r in rows)
-    return qty, total
+    ventas = ventas_producto.ventas_por_producto(supa, date(year, 1, 1), date(year + 1, 1, 1), [product_id])
+    return ventas.get(int(product_id), (0.0, 0.0))
 
 
-@st.cache_data(ttl=900)
 def _producto_sales_last_12m(supa, product_ids: List[int]) -> Dict[int, Tuple[float, float]]:
     if not supa or not product_ids:
         return {}
-    since = (date.today() - timedelta(days=365)).isoformat()
-    sales: Dict[int, Tuple[float, float]] = {pid: (0.0, 0.0) for pid in product_ids}
-    for chunk in _chunked(product_ids, size=200):
-        ids_csv = ",".join(str(i) for i in chunk)
-        q = (
-            supa.table("pedido_linea")
-            .select("producto_id, producto_ref_origen, cantidad, subtotal, created_at")
-            .gte("created_at", since)
-        )
-        try:
-            q = q.or_(f"producto_id.in.({ids_csv}),producto_ref_origen.in.({ids_csv})")
-            res = q.execute()
-        except Exception:
-            try:
-                res = q.in_("producto_id", chunk).execute()
-            except Exception as e:
-                st.warning(f"No se pudieron cargar ventas 12m: {e}")
-                continue
-        for r in res.data or []:
-            pid = r.get("producto_id") or r.get("producto_ref_origen")
-            if pid is None:
-                continue
-            pid = int(pid)
-            if pid not in sales:
-                continue
-            qty, total = sales.get(pid, (0.0, 0.0))
-            qty += float(r.get("cantidad") or 0)
-            total += float(r.get("subtotal") or 0)
-            sales[pid] = (qty, total)
-    return sales
+    since = date.today() - timedelta(days=365)
+    ventas = ventas_producto.ventas_por_producto(supa, since, date.today() + timedelta(days=1), product_ids)
+    return {pid: ventas.get(pid, (0.0, 0.0)) for pid in product_ids}
 
 
 # ======================================================
@@ -852,7 +789,7 @@ def _render_tabla_productos(productos: list):
 
 def _render_modal_producto(productoid: int, supabase=None):
     try:
-        res = requests.get(f"{_api_base()}/api/productos/{productoid}", timeout=15)
+        res = api_client.get(f"/api/productos/{productoid}", timeout=15)
         res.raise_for_status()
         data = res.json() or {}
     except Exception as e:
@@ -909,8 +846,9 @@ def _render_modal_producto(productoid: int, supabase=None):
 
         if supabase:
             year = date.today().year
-            qty_y, total_y = _producto_sales_year(supabase, int(productoid), year)
-            qty_prev, total_prev = _producto_sales_year(supabase, int(productoid), year - 1)
+            por_anio = ventas_producto.ventas_por_anio(supabase, [year - 1, year], [int(productoid)])
+            qty_y, total_y = por_anio[year].get(int(productoid), (0.0, 0.0))
+            qty_prev, total_prev = por_anio[year - 1].get(int(productoid), (0.0, 0.0))
             s1, s2, s3 = st.columns(3)
             s1.metric(f"Ventas {year}", f"{qty_y:,.0f}".replace(",", "."))
             s2.metric(f"Importe {year}", f"{total_y:,.2f} €".replace(",", "."))
@@ -2,6 +2,8 @@ import streamlit as st
 from dataclasses import dataclass
 from typing import Optional, Dict, Any, List
 
+from modules import data_cache
+
 # ==================================================
 # 📦 Modelo de producto + catálogos
 # ==================================================
@@ -39,7 +41,7 @@ def _as_options(rows: List[Dict[str, Any]], label="nombre", value="id") -> Dict[
 # ==================================================
 # Catálogos cacheados
 # ==================================================
-@st.cache_data(ttl=300)
+@data_cache.cacheado("productos", ttl_s=300)
 def load_familias(_supabase) -> Dict[str, Any]:
     """Carga familias de producto (tabla: producto_familia)."""
     try:
@@ -56,7 +58,7 @@ def load_familias(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("productos", ttl_s=300)
 def load_tipos_producto(_supabase) -> Dict[str, Any]:
     """Carga tipos de producto (tabla: producto_tipo)."""
     try:
@@ -72,7 +74,7 @@ def load_tipos_producto(_supabase) -> Dict[str, Any]:
         st.warning(f"⚠️ No se pudieron cargar tipos de producto: {e}")
         return {}
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("productos", ttl_s=300)
 def load_impuestos(_supabase) -> Dict[str, Any]:
     """
     Carga impuestos (tabla: impuesto).
@@ -103,7 +105,7 @@ def load_impuestos(_supabase) -> Dict[str, Any]:
         return {}
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("productos", ttl_s=300)
 def load_estados_producto(_supabase) -> Dict[str, Any]:
     """Carga estados del producto (tabla: estado_producto)."""
     try:
@@ -123,7 +125,7 @@ def load_estados_producto(_supabase) -> Dict[str, Any]:
 # ==================================================
 # Lookups por ID
 # ==================================================
-@st.cache_data(ttl=300)
+@data_cache.cacheado("productos", ttl_s=300)
 def get_familia_label(fid: Optional[int], _supabase) -> str:
     if not fid:
         return "-"
@@ -131,7 +133,7 @@ def get_familia_label(fid: Optional[int], _supabase) -> str:
     return next((name for name, vid in mapping.items() if vid == fid), "-")
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("productos", ttl_s=300)
 def get_tipo_label(tid: Optional[int], _supabase) -> str:
     if not tid:
         return "-"
@@ -139,7 +141,7 @@ def get_tipo_label(tid: Optional[int], _supabase) -> str:
     return next((name for name, vid in mapping.items() if vid == tid), "-")
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("productos", ttl_s=300)
 def get_impuesto_label(iid: Optional[int], _supabase) -> str:
     if not iid:
         return "-"
@@ -147,7 +149,7 @@ def get_impuesto_label(iid: Optional[int], _supabase) -> str:
     return next((name for name, vid in mapping.items() if vid == iid), "-")
 
 
-@st.cache_data(ttl=300)
+@data_cache.cacheado("productos", ttl_s=300)
 def get_estado_label(eid: Optional[int], _supabase) -> str:
     if not eid:
         return "-"
@@ -20,6 +20,16 @@ def render_simulador_pedido(_supabase=None):
         st.error(f"❌ No se pudieron cargar catálogos: {e}")
         return
 
+    modo = st.radio(
+        "Modo",
+        ["🧮 Línea individual", "📈 Simulación masiva (histórico)"],
+        horizontal=True,
+        key="sim_modo",
+    )
+    if modo.startswith("📈"):
+        _render_simulacion_masiva(_supabase, cats)
+        return
+
     clientes = {c["label"]: c for c in cats.get("clientes", [])}
     productos = {p["label"]: p for p in cats.get("productos", [])}
 
@@ -119,3 +129,125 @@ def render_simulador_pedido(_supabase=None):
 
     except Exception as e:
         st.error(f"❌ Error durante la simulación: {e}")
+
+
+# ======================================================
+# 📈 SIMULACIÓN MASIVA — borrador de reglas sobre histórico
+# ======================================================
+def _render_simulacion_masiva(supabase, cats: dict):
+    from modules.tarifa_simulacion import simular_tarifas
+
+    st.caption(
+        "Define un borrador de reglas y compara la facturación histórica "
+        "con las reglas actuales frente al borrador."
+    )
+
+    mapas = {
+        k: {i["label"]: i["id"] for i in cats.get(k, []) or []}
+        for k in ("tarifas", "clientes", "grupos", "productos", "familias")
+    }
+
+    base = pd.DataFrame(
+        [{"Tarifa": None, "Cliente": None, "Grupo": None, "Producto": None, "Familia": None,
+          "Desde": None, "Hasta": None, "Prioridad": 1}]
+    )
+    editado = st.data_editor(
+        base,
+        num_rows="dynamic",
+        width="stretch",
+        hide_index=True,
+        key="sim_borrador_reglas",
+        column_config={
+            "Tarifa": st.column_config.SelectboxColumn(options=list(mapas["tarifas"].keys()), required=True),
+            "Cliente": st.column_config.SelectboxColumn(options=list(mapas["clientes"].keys())),
+            "Grupo": st.column_config.SelectboxColumn(options=list(mapas["grupos"].keys())),
+            "Producto": st.column_config.SelectboxColumn(options=list(mapas["productos"].keys())),
+            "Familia": st.column_config.SelectboxColumn(options=list(mapas["familias"].keys())),
+            "Desde": st.column_config.DateColumn(),
+            "Hasta": st.column_config.DateColumn(),
+            "Prioridad": st.column_config.NumberColumn(min_value=1, step=1),
+        },
+    )
+
+    c1, c2, c3, c4 = st.columns([1, 1, 1, 1])
+    with c1:
+        desde = st.date_input("Desde", value=date(date.today().year - 1, 1, 1), key="sim_desde")
+    with c2:
+        hasta = st.date_input("Hasta", value=date(date.today().year - 1, 12, 31), key="sim_hasta")
+    with c3:
+        origenes = st.multiselect("Origen", ["albaran", "pedido"], default=["albaran"], key="sim_origenes")
+    with c4:
+        sobre_actuales = st.toggle("Añadir a reglas actuales", value=True, key="sim_sobre_actuales")
+
+    reglas = []
+    for _, r in editado.iterrows():
+        if not r.get("Tarifa"):
+            continue
+        reglas.append({
+            "tarifaid": mapas["tarifas"].get(r.get("Tarifa")),
+            "clienteid": mapas["clientes"].get(r.get("Cliente")),
+            "grupoid": mapas["grupos"].get(r.get("Grupo")),
+            "productoid": mapas["productos"].get(r.get("Producto")),
+            "familia_productoid": mapas["familias"].get(r.get("Familia")),
+            "fecha_inicio": r.get("Desde"),
+            "fecha_fin": r.get("Hasta"),
+            "prioridad": r.get("Prioridad"),
+        })
+
+    lanzar = st.button(
+        "▶️ Ejecutar simulación",
+        width="stretch",
+        disabled=not (reglas and origenes and desde <= hasta),
+        key="sim_lanzar",
+    )
+    if not lanzar:
+        return
+
+    if supabase is None:
+        from modules.supa_client import get_supabase_client
+        supabase = get_supabase_client()
+
+    etiquetas = {
+        "clienteid": {v: k for k, v in mapas["clientes"].items()},
+        "grupoid": {v: k for k, v in mapas["grupos"].items()},
+        "familia_productoid": {v: k for k, v in mapas["familias"].items()},
+    }
+
+    estado = st.empty()
+    metricas = st.empty()
+    tablas = st.empty()
+    try:
+        for parcial in simular_tarifas(
+            supabase,
+            reglas,
+            desde,
+            hasta,
+            origenes=origenes,
+            sobre_actuales=sobre_actuales,
+        ):
+            tot = parcial["totales"]
+            estado.caption(
+                ("✅ Completado" if parcial["terminado"] else "⏳ Procesando…")
+                + f" · {parcial['lineas']:,} líneas"
+                + (f" · {parcial['lineas_sin_cabecera']:,} sin cabecera (descartadas)" if parcial["lineas_sin_cabecera"] else "")
+            )
+            with metricas.container():
+                m1, m2, m3 = st.columns(3)
+                m1.metric("Subtotal con reglas actuales", f"{tot['subtotal_actual']:,.2f} €")
+                m2.metric("Subtotal con borrador", f"{tot['subtotal_borrador']:,.2f} €")
+                m3.metric("Diferencia", f"{tot['delta']:,.2f} €")
+            with tablas.container():
+                for clave, titulo, col in (
+                    ("por_cliente", "Por cliente", "clienteid"),
+                    ("por_grupo", "Por grupo", "grupoid"),
+                    ("por_familia", "Por familia", "familia_productoid"),
+                ):
+                    df = parcial[clave]
+                    if df.empty:
+                        continue
+                    df = df.copy()
+                    df.insert(0, "Nombre", df[col].map(lambda v, m=etiquetas[col]: m.get(v, v if v is not None else "-")))
+                    st.markdown(f"**{titulo}**")
+                    st.dataframe(df.head(50), width="stretch", hide_index=True)
+    except Exception as e:
+        st.error(f"❌ Error durante la simulación masiva: {e}")
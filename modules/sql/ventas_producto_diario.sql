@@ -0,0 +1,224 @@
+-- ventas_producto_diario
+-- Acumulado diario de ventas por producto y cliente (cantidad, importe, líneas)
+-- a partir de pedido_linea y albaran_linea. Ejecutar antes que
+-- ventas_producto_periodo.sql, que lo lee.
+--
+--   origen 'pedido':  pedido_linea por día de created_at, cliente = pedido.clienteid
+--   origen 'albaran': albaran_linea por día de albaran.fecha_albaran,
+--                     cliente = cliente.clienteid con idtercero = albaran.id_tercero
+--   clienteid = 0 cuando la línea no tiene cliente resoluble.
+--
+-- Lo mantiene el pipeline de Transforms (sync_ventas_producto_diario.py) después
+-- de cada carga: refrescar_ventas_producto_diario(desde, hasta) recalcula solo los
+-- días [desde, hasta) de un origen (borrar + insertar agregado), así que repetirlo
+-- es inocuo. Si desde queda por delante del corte actual (refrescado_hasta), el
+-- recálculo empieza en el corte: los días intermedios no se quedan sin acumular
+-- (p.ej. si el pipeline no ha corrido en una semana). La primera vez de cada
+-- origen recalcula toda la historia; a mano:
+--   select * from public.refrescar_ventas_producto_diario(null, current_date);
+--
+-- ventas_producto_diario_estado.refrescado_hasta: primer día NO cubierto por el
+-- acumulado; lo posterior se lee de las líneas (ventas_producto_periodo).
+--
+-- Los pedidos se crean y editan desde la app, a cualquier fecha: unos triggers
+-- sobre pedido_linea (alta, cambio, baja) y sobre pedido (cambio de cliente)
+-- recalculan en la misma transacción los días ya acumulados que toca cada
+-- sentencia, así que el origen 'pedido' no depende de la ventana del pipeline.
+
+create table if not exists public.ventas_producto_diario (
+    origen text not null check (origen in ('pedido', 'albaran')),
+    fecha date not null,
+    producto_id bigint not null,
+    clienteid bigint not null default 0,
+    qty numeric not null default 0,
+    total numeric not null default 0,
+    lineas integer not null default 0,
+    primary key (origen, fecha, producto_id, clienteid)
+);
+
+create index if not exists ventas_producto_diario_producto_idx
+    on public.ventas_producto_diario (origen, producto_id, fecha);
+
+create table if not exists public.ventas_producto_diario_estado (
+    origen text primary key,
+    refrescado_hasta date not null,
+    actualizado timestamptz not null default now()
+);
+
+create or replace function public.refrescar_ventas_producto_diario(
+    p_desde date,
+    p_hasta date,
+    p_origenes text[] default array['pedido', 'albaran']
+)
+returns table (origen text, desde date, hasta date, filas integer)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+    v_origen text;
+    v_corte date;
+    v_desde date;
+    v_filas integer;
+begin
+    foreach v_origen in array p_origenes loop
+        select e.refrescado_hasta into v_corte
+        from public.ventas_producto_diario_estado e
+        where e.origen = v_origen;
+        -- Sin estado todavía: historia completa. Con estado, nunca después del
+        -- corte: lo que hay entre el corte y p_desde tampoco está acumulado
+        if found then
+            v_desde := least(coalesce(p_desde, date '-infinity'), v_corte);
+        else
+            v_desde := date '-infinity';
+        end if;
+
+        delete from public.ventas_producto_diario v
+        where v.origen = v_origen and v.fecha >= v_desde and v.fecha < p_hasta;
+
+        if v_origen = 'pedido' then
+            insert into public.ventas_producto_diario (origen, fecha, producto_id, clienteid, qty, total, lineas)
+            select
+                'pedido',
+                pl.created_at::date,
+                coalesce(pl.producto_id, pl.producto_ref_origen)::bigint,
+                coalesce(p.clienteid, 0)::bigint,
+                sum(coalesce(pl.cantidad, 0)),
+                sum(coalesce(pl.subtotal, 0)),
+                count(*)
+            from public.pedido_linea pl
+            left join public.pedido p on p.pedido_id = pl.pedido_id
+            where pl.created_at >= v_desde
+              and pl.created_at < p_hasta
+              and coalesce(pl.producto_id, pl.producto_ref_origen) is not null
+            group by 2, 3, 4;
+        elsif v_origen = 'albaran' then
+            insert into public.ventas_producto_diario (origen, fecha, producto_id, clienteid, qty, total, lineas)
+            select
+                'albaran',
+                a.fecha_albaran::date,
+                coalesce(al.producto_id, al.idproducto, al.producto_id_origen)::bigint,
+                coalesce(c.clienteid, 0)::bigint,
+                sum(coalesce(al.cantidad, 0)),
+                sum(coalesce(al.subtotal, 0)),
+                count(*)
+            from public.albaran_linea al
+            join public.albaran a on a.albaran_id = al.albaran_id::bigint
+            left join public.cliente c on c.idtercero = a.id_tercero
+            where a.fecha_albaran >= v_desde
+              and a.fecha_albaran < p_hasta
+              and coalesce(al.producto_id, al.idproducto, al.producto_id_origen) is not null
+            group by 2, 3, 4;
+        else
+            raise exception 'Origen no valido: %', v_origen;
+        end if;
+        get diagnostics v_filas = row_count;
+
+        insert into public.ventas_producto_diario_estado as e (origen, refrescado_hasta, actualizado)
+        values (v_origen, p_hasta, now())
+        on conflict (origen) do update
+            set refrescado_hasta = greatest(e.refrescado_hasta, excluded.refrescado_hasta),
+                actualizado = now();
+
+        origen := v_origen;
+        desde := case when v_desde = date '-infinity' then null else v_desde end;
+        hasta := p_hasta;
+        filas := v_filas;
+        return next;
+    end loop;
+end
+$$;
+
+-- =========================
+-- Pedidos: recalcular los días que toca cada cambio
+-- =========================
+create or replace function public.recalcular_ventas_pedido_dias(p_dias date[])
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_hasta date;
+    v_dia date;
+begin
+    select e.refrescado_hasta into v_hasta
+    from public.ventas_producto_diario_estado e
+    where e.origen = 'pedido';
+    if v_hasta is null then
+        return;  -- sin acumulado todavía: todo se lee de las líneas
+    end if;
+    -- Solo los días ya acumulados; los posteriores se leen en vivo
+    for v_dia in
+        select distinct d from unnest(p_dias) d where d is not null and d < v_hasta
+    loop
+        perform public.refrescar_ventas_producto_diario(v_dia, v_dia + 1, array['pedido']);
+    end loop;
+end
+$$;
+
+create or replace function public.ventas_pedido_linea_trg()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op = 'INSERT' then
+        perform public.recalcular_ventas_pedido_dias(array(select n.created_at::date from nuevas n));
+    elsif tg_op = 'UPDATE' then
+        perform public.recalcular_ventas_pedido_dias(array(
+            select n.created_at::date from nuevas n
+            union
+            select v.created_at::date from viejas v
+        ));
+    else
+        perform public.recalcular_ventas_pedido_dias(array(select v.created_at::date from viejas v));
+    end if;
+    return null;
+end
+$$;
+
+-- Un trigger por evento: las tablas de transición no admiten varios eventos
+drop trigger if exists ventas_pedido_linea_ins on public.pedido_linea;
+create trigger ventas_pedido_linea_ins
+    after insert on public.pedido_linea
+    referencing new table as nuevas
+    for each statement execute function public.ventas_pedido_linea_trg();
+
+drop trigger if exists ventas_pedido_linea_upd on public.pedido_linea;
+create trigger ventas_pedido_linea_upd
+    after update on public.pedido_linea
+    referencing old table as viejas new table as nuevas
+    for each statement execute function public.ventas_pedido_linea_trg();
+
+drop trigger if exists ventas_pedido_linea_del on public.pedido_linea;
+create trigger ventas_pedido_linea_del
+    after delete on public.pedido_linea
+    referencing old table as viejas
+    for each statement execute function public.ventas_pedido_linea_trg();
+
+-- El cliente de las líneas sale de la cabecera
+create or replace function public.ventas_pedido_cliente_trg()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    perform public.recalcular_ventas_pedido_dias(array(
+        select pl.created_at::date from public.pedido_linea pl where pl.pedido_id = new.pedido_id
+    ));
+    return null;
+end
+$$;
+
+drop trigger if exists ventas_pedido_cliente_upd on public.pedido;
+create trigger ventas_pedido_cliente_upd
+    after update of clienteid on public.pedido
+    for each row
+    when (old.clienteid is distinct from new.clienteid)
+    execute function public.ventas_pedido_cliente_trg();
+
+revoke execute on function public.refrescar_ventas_producto_diario(date, date, text[]) from public, anon, authenticated;
+revoke execute on function public.recalcular_ventas_pedido_dias(date[]) from public, anon, authenticated;
+grant select on public.ventas_producto_diario, public.ventas_producto_diario_estado to anon, authenticated;
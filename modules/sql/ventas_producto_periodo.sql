@@ -0,0 +1,72 @@
+-- ventas_producto_periodo
+-- Ventas (cantidad, importe) agrupadas por producto y periodo.
+-- La usa modules/ventas_producto.py vía supabase.rpc(...).
+--
+--   p_desde, p_hasta  rango [desde, hasta) de fechas
+--   p_producto_ids    productos a incluir (NULL = todos)
+--   p_periodo         'total' | 'anio' | 'mes'  (periodo = primer día, NULL en 'total')
+--   p_origen          'pedido' (pedido_linea, por created_at) | 'albaran'
+--
+-- Los días ya cubiertos por ventas_producto_diario (ventas_producto_diario.sql,
+-- ejecutarlo antes) se leen de ahí: una fila por producto, día y cliente en lugar
+-- de una por línea. Los pedidos posteriores al último refresco se suman desde
+-- pedido_linea; los albaranes solo entran por el pipeline, así que para ellos
+-- basta el acumulado.
+--
+-- El producto de una línea de pedido es producto_id, o producto_ref_origen si no lo tiene.
+
+drop function if exists public.ventas_producto_periodo(date, date, bigint[], text);
+
+create or replace function public.ventas_producto_periodo(
+    p_desde date,
+    p_hasta date,
+    p_producto_ids bigint[] default null,
+    p_periodo text default 'total',
+    p_origen text default 'pedido'
+)
+returns table (producto_id bigint, periodo date, qty numeric, total numeric)
+language sql
+stable
+as $$
+    with corte as (
+        select coalesce(
+            (select e.refrescado_hasta from public.ventas_producto_diario_estado e where e.origen = p_origen),
+            date '-infinity'
+        ) as hasta
+    ),
+    dias as (
+        select v.producto_id, v.fecha, v.qty, v.total
+        from public.ventas_producto_diario v, corte
+        where v.origen = p_origen
+          and v.fecha >= p_desde
+          and v.fecha < least(p_hasta, corte.hasta)
+          and (p_producto_ids is null or v.producto_id = any (p_producto_ids))
+        union all
+        select
+            coalesce(pl.producto_id, pl.producto_ref_origen)::bigint,
+            pl.created_at::date,
+            coalesce(pl.cantidad, 0),
+            coalesce(pl.subtotal, 0)
+        from public.pedido_linea pl, corte
+        where p_origen = 'pedido'
+          and pl.created_at >= greatest(p_desde, corte.hasta)
+          and pl.created_at < p_hasta
+          and coalesce(pl.producto_id, pl.producto_ref_origen) is not null
+          and (p_producto_ids is null or coalesce(pl.producto_id, pl.producto_ref_origen) = any (p_producto_ids))
+    )
+    select
+        d.producto_id,
+        case p_periodo
+            when 'anio' then date_trunc('year', d.fecha)::date
+            when 'mes' then date_trunc('month', d.fecha)::date
+        end as periodo,
+        sum(d.qty)::numeric as qty,
+        sum(d.total)::numeric as total
+    from dias d
+    group by 1, 2
+$$;
+
+-- El tramo sin acumular se acota por fecha
+create index if not exists pedido_linea_created_at_idx on public.pedido_linea (created_at);
+
+grant execute on function public.ventas_producto_periodo(date, date, bigint[], text, text) to anon, authenticated;
@@ -5,6 +5,7 @@ import pandas as pd
 import streamlit as st
 from datetime import date
 
+from modules import data_cache
 from modules.tarifa_api import (
     catalogos,
     listar_reglas,
@@ -152,6 +153,7 @@ def render_tarifa_admin():
             if bool(row["Habilitada"]) != bool(orig.get("habilitada", True)):
                 try:
                     actualizar_regla(int(orig["tarifa_reglaid"]), {"habilitada": bool(row["Habilitada"])})
+                    data_cache.emitir("tarifa")
                     st.toast(f"✅ Regla {orig['tarifa_reglaid']} actualizada.")
                 except Exception as e:
                     st.error(f"❌ No se pudo actualizar la regla: {e}")
@@ -204,6 +206,7 @@ def render_tarifa_admin():
                     if st.button("💾 Guardar vigencia", width="stretch"):
                         try:
                             actualizar_regla(int(regla_sel), {"fecha_fin": nueva_fin.isoformat()})
+                            data_cache.emitir("tarifa")
                             st.success("✅ Vigencia actualizada.")
                             st.rerun()
                         except Exception as e:
@@ -212,6 +215,7 @@ def render_tarifa_admin():
                     if st.button("🗑️ Eliminar regla", width="stretch"):
                         try:
                             borrar_regla(int(regla_sel))
+                            data_cache.emitir("tarifa")
                             st.success("🗑️ Regla eliminada.")
                             st.rerun()
                         except Exception as e:
@@ -283,6 +287,7 @@ def render_tarifa_admin():
                         "fecha_hasta": fecha_hasta.isoformat() if fecha_hasta else None,
                     }
                 )
+                data_cache.emitir("tarifa")
                 st.success("✅ Tarifa general asignada.")
                 st.rerun()
 
@@ -307,6 +312,7 @@ def render_tarifa_admin():
                 payload["familia_productoid"] = familias[sel_familia]
 
             crear_regla(payload)
+            data_cache.emitir("tarifa")
             st.success("✅ Asignación registrada correctamente.")
             st.rerun()
 
@@ -5,7 +5,7 @@ Centraliza las llamadas para mantener la UI libre de Supabase.
 from typing import Any, Dict, Optional
 
 import requests
-from modules.api_base import get_api_base
+from modules import api_client, data_cache
 
 
 def _handle(resp: requests.Response) -> Any:
@@ -15,36 +15,37 @@ def _handle(resp: requests.Response) -> Any:
     return resp.json()
 
 
+@data_cache.cacheado("tarifas", ttl_s=300)
 def catalogos() -> dict:
-    r = requests.get(f"{get_api_base()}/api/tarifas/catalogos", timeout=20)
+    r = api_client.get("/api/tarifas/catalogos", timeout=20)
     return _handle(r)
 
 
 def listar_reglas(params: Optional[dict] = None) -> dict:
-    r = requests.get(f"{get_api_base()}/api/tarifas/reglas", params=params, timeout=20)
+    r = api_client.get("/api/tarifas/reglas", params=params, timeout=20)
     return _handle(r)
 
 
 def crear_regla(payload: dict) -> dict:
-    r = requests.post(f"{get_api_base()}/api/tarifas/reglas", json=payload, timeout=20)
+    r = api_client.post("/api/tarifas/reglas", json=payload, timeout=20)
     return _handle(r)
 
 
 def actualizar_regla(reglaid: int, payload: dict) -> dict:
-    r = requests.patch(f"{get_api_base()}/api/tarifas/reglas/{reglaid}", json=payload, timeout=20)
+    r = api_client.patch(f"/api/tarifas/reglas/{reglaid}", json=payload, timeout=20)
     return _handle(r)
 
 
 def borrar_regla(reglaid: int) -> dict:
-    r = requests.delete(f"{get_api_base()}/api/tarifas/reglas/{reglaid}", timeout=20)
+    r = api_client.delete(f"/api/tarifas/reglas/{reglaid}", timeout=20)
     return _handle(r)
 
 
 def asignar_cliente_tarifa(payload: dict) -> dict:
-    r = requests.post(f"{get_api_base()}/api/tarifas/cliente-tarifa", json=payload, timeout=20)
+    r = api_client.post("/api/tarifas/cliente-tarifa", json=payload, timeout=20)
     return _handle(r)
 
 
 def calcular_precio(payload: dict) -> dict:
-    r = requests.post(f"{get_api_base()}/api/tarifas/calcular-precio", json=payload, timeout=20)
+    r = api_client.post("/api/tarifas/calcular-precio", json=payload, timeout=20)
     return _handle(r)
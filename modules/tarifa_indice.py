@@ -0,0 +1,220 @@
+# ======================================================
+# 🗂️ ÍNDICE DE REGLAS DE TARIFA — EnteNova Gnosis
+# ======================================================
+# Compila tarifa_regla en un índice por nivel de jerarquía:
+#   producto+cliente -> (clienteid, productoid)
+#   familia+cliente  -> (clienteid, familia_productoid)
+#   producto+grupo   -> (grupoid, productoid)
+#   familia+grupo    -> (grupoid, familia_productoid)
+#
+# Cada clave apunta a una estructura de intervalos: los límites
+# fecha_inicio / fecha_fin se ordenan y cada tramo guarda las reglas vigentes,
+# de modo que la consulta por fecha es un bisect (O(log n)) en lugar de
+# recorrer todas las reglas.
+#
+# El índice compilado se guarda a nivel de proceso y solo se recompila
+# cuando cambia el contenido de la tabla (huella de las filas). Guardar una
+# regla (data_cache.emitir("tarifa")) fuerza la revalidación.
+
+import hashlib
+import json
+import os
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+from modules import data_cache
+
+
+NIVELES = [
+    ("producto+cliente", "clienteid", "productoid"),
+    ("familia+cliente", "clienteid", "familia_productoid"),
+    ("producto+grupo", "grupoid", "productoid"),
+    ("familia+grupo", "grupoid", "familia_productoid"),
+]
+
+REGLA_COLUMNAS = (
+    "tarifa_reglaid, tarifaid, clienteid, grupoid, productoid, familia_productoid, "
+    "fecha_inicio, fecha_fin, prioridad, habilitada"
+)
+
+# PostgREST corta cada respuesta en este número de filas (max-rows)
+PAGINA_FILAS = 1000
+
+_TTL_S = float(os.getenv("TARIFA_INDICE_TTL_S", "60"))
+_INDICE_CACHED: Dict[str, Any] = {"indice": None, "ts": float("-inf")}
+
+
+def as_iso_date(v) -> Optional[str]:
+    """Normaliza date/datetime/'YYYY-MM-DD[...]' a 'YYYY-MM-DD' (o None)."""
+    if v in (None, ""):
+        return None
+    if isinstance(v, datetime):
+        return v.date().isoformat()
+    if isinstance(v, date):
+        return v.isoformat()
+    return str(v)[:10]
+
+
+def _is_active_window(row: Dict[str, Any], fecha_iso: str) -> bool:
+    """True si fecha_iso cae en [fecha_inicio, fecha_fin] de la fila (extremos opcionales)."""
+    fi = as_iso_date(row.get("fecha_inicio"))
+    ff = as_iso_date(row.get("fecha_fin"))
+    if fi and fi > fecha_iso:
+        return False
+    if ff and ff < fecha_iso:
+        return False
+    return True
+
+
+def leer_paginado(consulta: Callable[[], Any], orden: str, size: int = PAGINA_FILAS) -> List[Dict[str, Any]]:
+    """
+    Todas las filas de consulta() (una query de supabase sin ejecutar), por
+    páginas .range() ordenadas por `orden` hasta una página incompleta.
+    consulta se llama en cada página: los builders no se pueden reutilizar.
+    """
+    rows: List[Dict[str, Any]] = []
+    off = 0
+    while True:
+        pagina = consulta().order(orden).range(off, off + size - 1).execute().data or []
+        rows.extend(pagina)
+        if len(pagina) < size:
+            return rows
+        off += size
+
+
+def _siguiente(iso: str) -> str:
+    # Menor cadena estrictamente mayor que iso: marca el fin inclusivo de fecha_fin
+    return iso + "\x00"
+
+
+def _limites(filas: List[Dict[str, Any]]) -> List[str]:
+    limites = set()
+    for r in filas:
+        fi = as_iso_date(r.get("fecha_inicio"))
+        ff = as_iso_date(r.get("fecha_fin"))
+        if fi:
+            limites.add(fi)
+        if ff:
+            limites.add(_siguiente(ff))
+    return sorted(limites)
+
+
+class Intervalos:
+    """Filas con fecha_inicio/fecha_fin repartidas en tramos de fecha contiguos."""
+
+    def __init__(self, filas: List[Dict[str, Any]]):
+        self.limites: List[str] = _limites(filas)
+        self.tramos: List[List[Dict[str, Any]]] = [[] for _ in range(len(self.limites) + 1)]
+
+        # Las filas se añaden en su orden original (el desempate posterior es estable)
+        for r in filas:
+            desde, hasta = _rango_tramos(self.limites, r)
+            for i in range(desde, hasta):
+                self.tramos[i].append(r)
+
+    def tramo(self, fecha_iso: str) -> int:
+        return bisect_right(self.limites, fecha_iso)
+
+    def vigentes(self, fecha_iso: str) -> List[Dict[str, Any]]:
+        return self.tramos[self.tramo(fecha_iso)]
+
+
+def _rango_tramos(limites: List[str], r: Dict[str, Any]) -> Tuple[int, int]:
+    # El tramo i cubre [limites[i-1], limites[i]); el tramo 0 es (-inf, limites[0])
+    fi = as_iso_date(r.get("fecha_inicio"))
+    ff = as_iso_date(r.get("fecha_fin"))
+    desde = 0 if not fi else bisect_left(limites, fi) + 1
+    hasta = len(limites) + 1 if not ff else bisect_left(limites, _siguiente(ff)) + 1
+    return desde, hasta
+
+
+class IndiceReglas:
+    """Índice compilado de reglas habilitadas de tarifa_regla."""
+
+    def __init__(self, reglas: List[Dict[str, Any]], huella: Optional[str] = None):
+        self.huella = huella or huella_reglas(reglas)
+        self.total = len(reglas)
+
+        grupos: Dict[Tuple[str, Any, Any], List[Dict[str, Any]]] = {}
+        for r in reglas:
+            for nivel, col_a, col_b in NIVELES:
+                grupos.setdefault((nivel, r.get(col_a), r.get(col_b)), []).append(r)
+        self._por_clave = {k: Intervalos(v) for k, v in grupos.items()}
+
+        # "¿Hay alguna regla vigente?" por tramo, con array de diferencias
+        self._limites_global = _limites(reglas)
+        diff = [0] * (len(self._limites_global) + 2)
+        for r in reglas:
+            desde, hasta = _rango_tramos(self._limites_global, r)
+            if desde >= hasta:
+                # fecha_fin < fecha_inicio: la regla no está vigente en ningún tramo
+                continue
+            diff[desde] += 1
+            diff[hasta] -= 1
+        acumulado, self._hay_vigentes = 0, []
+        for i in range(len(self._limites_global) + 1):
+            acumulado += diff[i]
+            self._hay_vigentes.append(acumulado > 0)
+
+    def hay_vigentes(self, fecha_iso: str) -> bool:
+        if not self.total:
+            return False
+        return self._hay_vigentes[bisect_right(self._limites_global, fecha_iso)]
+
+    def candidatas(self, nivel: str, a, b, fecha_iso: str) -> List[Dict[str, Any]]:
+        iv = self._por_clave.get((nivel, a, b))
+        return iv.vigentes(fecha_iso) if iv else []
+
+
+def huella_reglas(reglas: List[Dict[str, Any]]) -> str:
+    payload = json.dumps(reglas, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+def compilar_indice(reglas: List[Dict[str, Any]]) -> IndiceReglas:
+    """
+    Devuelve el índice para estas reglas, reutilizando el compilado en
+    memoria si la tabla no ha cambiado.
+    """
+    huella = huella_reglas(reglas)
+    actual = _INDICE_CACHED["indice"]
+    if actual is not None and actual.huella == huella:
+        return actual
+    indice = IndiceReglas(reglas, huella=huella)
+    _INDICE_CACHED["indice"] = indice
+    return indice
+
+
+def get_indice_reglas(supabase, *, forzar: bool = False) -> IndiceReglas:
+    """
+    Índice de reglas habilitadas a nivel de proceso.
+    Se revalida contra Supabase cada TARIFA_INDICE_TTL_S segundos (o si forzar=True);
+    solo se recompila si el contenido de la tabla ha cambiado.
+    """
+    actual = _INDICE_CACHED["indice"]
+    if not forzar and actual is not None and time.monotonic() - _INDICE_CACHED["ts"] < _TTL_S:
+        return actual
+
+    try:
+        reglas = leer_paginado(
+            lambda: supabase.table("tarifa_regla").select(REGLA_COLUMNAS).eq("habilitada", True),
+            "tarifa_reglaid",
+        )
+    except Exception:
+        if actual is not None:
+            return actual
+        reglas = []
+
+    indice = compilar_indice(reglas)
+    _INDICE_CACHED["ts"] = time.monotonic()
+    return indice
+
+
+def invalidar_indice_reglas() -> None:
+    """Fuerza la revalidación en la próxima consulta (llamar tras guardar reglas)."""
+    _INDICE_CACHED["ts"] = float("-inf")
+
+
+data_cache.suscribir("tarifa", invalidar_indice_reglas)
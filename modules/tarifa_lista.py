@@ -3,6 +3,8 @@ import streamlit as st
 import pandas as pd
 from datetime import date
 
+from modules import data_cache
+
 # ======================================================
 # 🧩 Helpers visuales
 # ======================================================
@@ -177,6 +179,7 @@ def render_tarifa_lista(supabase):
                         "prioridad": 1,
                         "habilitada": True
                     }).execute()
+                    data_cache.emitir("tarifa")
 
                     st.success(f"✅ Combinación '{cliente_nom} · {producto_nom}' promovida a **{nueva_tarifa}**.")
                     st.rerun()
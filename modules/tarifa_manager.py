@@ -5,6 +5,7 @@ import streamlit as st
 import pandas as pd
 from datetime import date
 
+from modules import data_cache
 from modules.tarifa_api import catalogos, listar_reglas, crear_regla, asignar_cliente_tarifa
 from modules.simulador_pedido import render_simulador_pedido
 
@@ -141,6 +142,7 @@ def render_tarifa_manager():
                             "fecha_hasta": fecha_hasta.isoformat() if fecha_hasta else None,
                         }
                     )
+                    data_cache.emitir("tarifa")
                     st.success("✅ Tarifa general asignada.")
                     st.rerun()
 
@@ -164,6 +166,7 @@ def render_tarifa_manager():
                     payload["familia_productoid"] = familias[sel_familia]
 
                 crear_regla(payload)
+                data_cache.emitir("tarifa")
                 st.success("✅ Regla creada/asignada correctamente.")
                 st.rerun()
             except Exception as e:
@@ -0,0 +1,290 @@
+# ======================================================
+# 🔮 SIMULACIÓN DE TARIFAS SOBRE HISTÓRICO — EnteNova Gnosis
+# ======================================================
+# Reproduce las líneas de albaran_linea / pedido_linea de un rango de fechas
+# con las reglas actuales y con un borrador de tarifa_regla, y acumula la
+# diferencia de facturación (subtotal sin IVA) por cliente, grupo y familia.
+#
+# simular_tarifas() es un generador: procesa las líneas en lotes y produce
+# un resultado parcial tras cada lote, para poder pintarlo en Streamlit
+# mientras avanza.
+
+from datetime import date
+from typing import Any, Dict, Iterable, Iterator, List
+
+import pandas as pd
+
+from modules.precio_engine import _in_chunks, cargar_snapshot_precios
+from modules.precio_vectorizado import _id_o_none, calcular_precios_vectorizado
+from modules.tarifa_indice import IndiceReglas, REGLA_COLUMNAS, as_iso_date
+
+
+# Cómo leer cada origen: cabecera (fecha + cliente) y líneas
+ORIGENES: Dict[str, Dict[str, str]] = {
+    "albaran": {
+        "cabecera": "albaran",
+        "cab_id": "albaran_id",
+        "cab_fecha": "fecha_albaran",
+        "cab_cliente": "id_tercero",
+        "cliente_por": "idtercero",
+        "lineas": "albaran_linea",
+        "lin_id": "linea_id",
+        "lin_producto": "producto_id",
+    },
+    "pedido": {
+        "cabecera": "pedido",
+        "cab_id": "pedido_id",
+        "cab_fecha": "fecha_pedido",
+        "cab_cliente": "clienteid",
+        "cliente_por": "clienteid",
+        "lineas": "pedido_linea",
+        "lin_id": "pedido_linea_id",
+        "lin_producto": "producto_id",
+    },
+}
+
+_AGRUPACIONES = {
+    "por_cliente": "clienteid",
+    "por_grupo": "grupoid",
+    "por_familia": "familia_productoid",
+}
+
+
+def _rango_iso(d) -> str:
+    return d.isoformat() if isinstance(d, date) else str(d)[:10]
+
+
+def _cabeceras(supabase, cfg: Dict[str, str], desde: str, hasta: str, page_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Páginas de cabeceras en [desde, hasta] (hasta inclusivo)."""
+    page = 0
+    while True:
+        rows = (
+            supabase.table(cfg["cabecera"])
+            .select(f"{cfg['cab_id']}, {cfg['cab_fecha']}, {cfg['cab_cliente']}")
+            .gte(cfg["cab_fecha"], desde)
+            .lte(cfg["cab_fecha"], f"{hasta}T23:59:59")
+            .order(cfg["cab_id"])
+            .range(page * page_size, (page + 1) * page_size - 1)
+            .execute()
+            .data
+            or []
+        )
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        page += 1
+
+
+def _clave_cab(v: Any) -> Any:
+    """Id de cabecera como texto: albaran_linea.albaran_id es texto y albaran.albaran_id entero."""
+    if v is None:
+        return None
+    s = str(v).strip()
+    return s[:-2] if s.endswith(".0") else s
+
+
+def _mapa_clientes(supabase, cfg: Dict[str, str], valores: List[Any]) -> Dict[Any, Any]:
+    """Traduce el identificador de cliente de la cabecera a cliente.clienteid."""
+    if cfg["cliente_por"] == "clienteid":
+        return {v: v for v in valores}
+    rows = _in_chunks(supabase, "cliente", f"clienteid, {cfg['cliente_por']}", cfg["cliente_por"], valores)
+    return {r[cfg["cliente_por"]]: r["clienteid"] for r in rows}
+
+
+def iterar_lineas_historicas(
+    supabase,
+    origen: str,
+    desde,
+    hasta,
+    *,
+    page_size: int = 1000,
+) -> Iterator[pd.DataFrame]:
+    """
+    Devuelve DataFrames (uno por página de cabeceras) con
+    clienteid, productoid, cantidad, precio, subtotal, fecha.
+    Las líneas sin cabecera en la página se descartan; cuántas, en
+    df.attrs["sin_cabecera"].
+    """
+    cfg = ORIGENES[origen]
+    for cabs in _cabeceras(supabase, cfg, _rango_iso(desde), _rango_iso(hasta), page_size):
+        ids = [c[cfg["cab_id"]] for c in cabs]
+        clientes = _mapa_clientes(
+            supabase, cfg, sorted({c[cfg["cab_cliente"]] for c in cabs if c.get(cfg["cab_cliente"])})
+        )
+        info = {
+            _clave_cab(c[cfg["cab_id"]]): (clientes.get(c.get(cfg["cab_cliente"])), str(c.get(cfg["cab_fecha"]) or "")[:10])
+            for c in cabs
+        }
+        errores: List[Exception] = []
+        lineas = _in_chunks(
+            supabase,
+            cfg["lineas"],
+            f"{cfg['cab_id']}, {cfg['lin_producto']}, cantidad, precio, subtotal",
+            cfg["cab_id"],
+            ids,
+            errores=errores,
+            orden=cfg["lin_id"],
+        )
+        if errores:
+            # Un trozo sin leer daría totales falsos: mejor fallar
+            raise RuntimeError(f"No se pudieron leer las líneas de {cfg['lineas']}: {errores[0]}")
+        if not lineas:
+            continue
+        df = pd.DataFrame(lineas)
+        cab = df[cfg["cab_id"]].map(_clave_cab)
+        casan = cab.isin(info.keys())
+        if not casan.any():
+            raise RuntimeError(
+                f"Ninguna de las {len(df)} líneas de {cfg['lineas']} casa con su {cfg['cabecera']} "
+                f"por {cfg['cab_id']} (ej. {cab.iloc[0]!r})"
+            )
+        sin_cabecera = int((~casan).sum())
+        df, cab = df[casan].copy(), cab[casan]
+        df["clienteid"] = cab.map(lambda i: info[i][0])
+        df["fecha"] = cab.map(lambda i: info[i][1])
+        df = df.rename(columns={cfg["lin_producto"]: "productoid"})
+        df["origen"] = origen
+        out = df[["origen", "clienteid", "productoid", "cantidad", "precio", "subtotal", "fecha"]]
+        out.attrs["sin_cabecera"] = sin_cabecera
+        yield out
+
+
+def combinar_reglas(
+    actuales: List[Dict[str, Any]],
+    borrador: List[Dict[str, Any]],
+    *,
+    quitar_ids: Iterable[int] = (),
+) -> List[Dict[str, Any]]:
+    """
+    Reglas para la simulación: las actuales (menos quitar_ids y las que el
+    borrador sustituye por tarifa_reglaid) más las del borrador.
+    """
+    quitar = set(quitar_ids)
+    sustituidas = {r.get("tarifa_reglaid") for r in borrador if r.get("tarifa_reglaid") is not None}
+    base = [
+        r for r in actuales
+        if r.get("tarifa_reglaid") not in quitar and r.get("tarifa_reglaid") not in sustituidas
+    ]
+    nuevas = []
+    for i, r in enumerate(borrador):
+        if r.get("habilitada") is False:
+            continue
+        regla = {c.strip(): r.get(c.strip()) for c in REGLA_COLUMNAS.split(",")}
+        # Filas de st.data_editor: NaN/NaT -> None, ids a int, fechas a ISO
+        for col in ("tarifa_reglaid", "tarifaid", "clienteid", "grupoid", "productoid", "familia_productoid", "prioridad"):
+            regla[col] = _id_o_none(regla[col])
+        for col in ("fecha_inicio", "fecha_fin"):
+            regla[col] = None if pd.isna(regla[col]) else as_iso_date(regla[col])
+        if regla["tarifa_reglaid"] is None:
+            regla["tarifa_reglaid"] = f"borrador-{i + 1}"
+        regla["habilitada"] = True
+        nuevas.append(regla)
+    return base + nuevas
+
+
+def _acumular(acum: Dict[str, pd.DataFrame], df: pd.DataFrame) -> None:
+    for nombre, col in _AGRUPACIONES.items():
+        parcial = (
+            df.groupby(df[col].astype(object).where(df[col].notna(), None), dropna=False)[
+                ["lineas", "subtotal_historico", "subtotal_actual", "subtotal_borrador"]
+            ]
+            .sum()
+        )
+        parcial.index.name = col
+        previo = acum.get(nombre)
+        acum[nombre] = parcial if previo is None else previo.add(parcial, fill_value=0)
+
+
+def _resumen(acum: Dict[str, pd.DataFrame], lineas: int, terminado: bool, sin_cabecera: int = 0) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"lineas": lineas, "terminado": terminado, "lineas_sin_cabecera": sin_cabecera}
+    tot = {"subtotal_historico": 0.0, "subtotal_actual": 0.0, "subtotal_borrador": 0.0}
+    for nombre in _AGRUPACIONES:
+        df = acum.get(nombre)
+        if df is None:
+            out[nombre] = pd.DataFrame()
+            continue
+        df = df.reset_index()
+        df["delta"] = (df["subtotal_borrador"] - df["subtotal_actual"]).round(2)
+        df["delta_pct"] = (df["delta"] / df["subtotal_actual"].where(df["subtotal_actual"] != 0) * 100).round(2)
+        out[nombre] = df.sort_values("delta", key=lambda s: s.abs(), ascending=False).reset_index(drop=True)
+    if acum.get("por_cliente") is not None:
+        for k in tot:
+            tot[k] = round(float(acum["por_cliente"][k].sum()), 2)
+    tot["delta"] = round(tot["subtotal_borrador"] - tot["subtotal_actual"], 2)
+    out["totales"] = tot
+    return out
+
+
+def simular_tarifas(
+    supabase,
+    reglas_borrador: List[Dict[str, Any]],
+    desde,
+    hasta,
+    *,
+    origenes: Iterable[str] = ("albaran", "pedido"),
+    sobre_actuales: bool = True,
+    quitar_ids: Iterable[int] = (),
+    lote: int = 5000,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Simula un borrador de reglas sobre el histórico [desde, hasta].
+    Cada línea se precia dos veces con el motor vectorizado (reglas actuales y
+    borrador) usando su fecha y su precio unitario histórico como base.
+    Produce un resumen parcial tras cada lote:
+      {"lineas", "lineas_sin_cabecera", "terminado", "totales", "por_cliente", "por_grupo", "por_familia"}
+    """
+    snap_actual = cargar_snapshot_precios(supabase)
+    reglas_actuales = (
+        supabase.table("tarifa_regla").select(REGLA_COLUMNAS).eq("habilitada", True).execute().data or []
+        if sobre_actuales
+        else []
+    )
+    reglas = combinar_reglas(reglas_actuales, reglas_borrador, quitar_ids=quitar_ids)
+    # El borrador comparte tarifas, IVA y productos; solo cambia el índice de reglas
+    snap_borrador = dict(snap_actual, indice_reglas=IndiceReglas(reglas))
+
+    acum: Dict[str, pd.DataFrame] = {}
+    procesadas = 0
+    sin_cabecera = 0
+    pendiente: List[pd.DataFrame] = []
+    pendientes_n = 0
+
+    def _procesar(df: pd.DataFrame) -> None:
+        nonlocal procesadas
+        args = dict(
+            clienteids=df["clienteid"].tolist(),
+            productoids=df["productoid"].tolist(),
+            cantidades=df["cantidad"].tolist(),
+            precios_base=df["precio"].tolist(),
+            fechas=df["fecha"].tolist(),
+        )
+        actual = calcular_precios_vectorizado(supabase, snapshot=snap_actual, **args)
+        # snap_borrador comparte dicts con snap_actual: ya tiene productos y clientes cargados
+        borrador = calcular_precios_vectorizado(supabase, snapshot=snap_borrador, **args)
+        res = pd.DataFrame({
+            "clienteid": pd.Series([_id_o_none(v) for v in actual["clienteid"]], dtype=object),
+            "grupoid": pd.Series([_id_o_none(v) for v in actual["grupoid"]], dtype=object),
+            "familia_productoid": pd.Series([_id_o_none(v) for v in actual["familia_productoid"]], dtype=object),
+            "lineas": 1,
+            "subtotal_historico": pd.to_numeric(df["subtotal"], errors="coerce").fillna(0.0).to_numpy(),
+            "subtotal_actual": actual["subtotal_sin_iva"],
+            "subtotal_borrador": borrador["subtotal_sin_iva"],
+        })
+        _acumular(acum, res)
+        procesadas += len(df)
+
+    for origen in origenes:
+        for df in iterar_lineas_historicas(supabase, origen, desde, hasta):
+            sin_cabecera += df.attrs.get("sin_cabecera", 0)
+            pendiente.append(df)
+            pendientes_n += len(df)
+            if pendientes_n >= lote:
+                _procesar(pd.concat(pendiente, ignore_index=True))
+                pendiente, pendientes_n = [], 0
+                yield _resumen(acum, procesadas, False, sin_cabecera)
+
+    if pendiente:
+        _procesar(pd.concat(pendiente, ignore_index=True))
+    yield _resumen(acum, procesadas, True, sin_cabecera)
@@ -0,0 +1,170 @@
+# ======================================================
+# 📈 VENTAS AGREGADAS POR PRODUCTO — EnteNova Gnosis
+# ======================================================
+# Cantidad e importe vendidos por producto (y periodo) de pedidos o albaranes.
+# La agregación la hace Postgres con la RPC ventas_producto_periodo
+# (modules/sql/ventas_producto_periodo.sql): una consulta con GROUP BY que
+# devuelve una fila por producto y periodo, en lugar de paginar miles de líneas
+# y sumarlas en Python en cada página. La RPC lee el acumulado diario
+# ventas_producto_diario que mantiene el pipeline de Transforms
+# (modules/sql/ventas_producto_diario.sql) y solo suma líneas de pedido para
+# los días que aún no están acumulados.
+#
+# Si la RPC aún no está creada en la base (PostgREST responde 404 / PGRST202),
+# se cae al recorrido por páginas de antes sobre pedido_linea (una sola vez por
+# proceso se detecta y se deja de intentar la RPC). Cualquier otro error
+# (red, timeout, permisos) se propaga y la RPC se vuelve a intentar después.
+#
+# Periodos: "total" (todo el rango), "anio" o "mes" (clave = primer día, ISO).
+# El producto de una línea es producto_id, o producto_ref_origen si no lo tiene.
+
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from modules import data_cache
+
+
+RPC = "ventas_producto_periodo"
+PERIODOS = ("total", "anio", "mes")
+ORIGENES = ("pedido", "albaran")
+
+# Recorrido por páginas (solo sin RPC)
+PAGE_SIZE = 1000
+MAX_PAGES = 20
+
+_rpc_disponible: Optional[bool] = None
+
+
+# =========================
+# Helpers
+# =========================
+def _periodo(raw, periodo: str) -> Optional[str]:
+    if periodo == "total" or not raw:
+        return None
+    s = str(raw)[:10]
+    return f"{s[:4]}-01-01" if periodo == "anio" else f"{s[:7]}-01"
+
+
+def _falta_rpc(e: Exception) -> bool:
+    """True si el error de PostgREST es que la función no existe."""
+    codigo = str(getattr(e, "code", "") or "")
+    return codigo in ("PGRST202", "404") or "PGRST202" in str(e)
+
+
+def _por_rpc(
+    supa, desde: date, hasta: date, producto_ids: Optional[List[int]], periodo: str, origen: str
+) -> List[dict]:
+    params = {
+        "p_desde": desde.isoformat(),
+        "p_hasta": hasta.isoformat(),
+        "p_producto_ids": producto_ids,
+        "p_periodo": periodo,
+    }
+    if origen != "pedido":
+        params["p_origen"] = origen
+    res = supa.rpc(RPC, params).execute()
+    return [
+        {
+            "producto_id": int(r["producto_id"]),
+            "periodo": str(r["periodo"])[:10] if r.get("periodo") else None,
+            "qty": float(r.get("qty") or 0),
+            "total": float(r.get("total") or 0),
+        }
+        for r in res.data or []
+        if r.get("producto_id") is not None
+    ]
+
+
+def _por_paginas(supa, desde: date, hasta: date, producto_ids: Optional[List[int]], periodo: str) -> List[dict]:
+    """Lo que hacía cada página por su cuenta: leer las líneas del rango y sumar aquí."""
+    ids_csv = ",".join(str(i) for i in producto_ids) if producto_ids else None
+    ids_set = set(producto_ids or ())
+    acc: Dict[Tuple[int, Optional[str]], List[float]] = {}
+    for page in range(MAX_PAGES):
+        q = (
+            supa.table("pedido_linea")
+            .select("producto_id, producto_ref_origen, cantidad, subtotal, created_at")
+            .gte("created_at", desde.isoformat())
+            .lt("created_at", hasta.isoformat())
+        )
+        if ids_csv:
+            q = q.or_(f"producto_id.in.({ids_csv}),producto_ref_origen.in.({ids_csv})")
+        rows = q.range(page * PAGE_SIZE, (page + 1) * PAGE_SIZE - 1).execute().data or []
+        for r in rows:
+            pid = r.get("producto_id") or r.get("producto_ref_origen")
+            if pid is None:
+                continue
+            pid = int(pid)
+            if ids_set and pid not in ids_set:
+                continue
+            k = (pid, _periodo(r.get("created_at"), periodo))
+            a = acc.setdefault(k, [0.0, 0.0])
+            a[0] += float(r.get("cantidad") or 0)
+            a[1] += float(r.get("subtotal") or 0)
+        if len(rows) < PAGE_SIZE:
+            break
+    return [{"producto_id": pid, "periodo": per, "qty": q, "total": t} for (pid, per), (q, t) in acc.items()]
+
+
+# =========================
+# API
+# =========================
+@data_cache.cacheado("ventas", ttl_s=900)
+def ventas_agregadas(
+    _supa,
+    desde: date,
+    hasta: date,
+    producto_ids: Optional[Sequence[int]] = None,
+    periodo: str = "total",
+    origen: str = "pedido",
+) -> List[dict]:
+    """Filas {producto_id, periodo, qty, total} de pedidos (o albaranes) en [desde, hasta)."""
+    global _rpc_disponible
+    if periodo not in PERIODOS:
+        raise ValueError(f"Periodo no valido: {periodo} (validos: {', '.join(PERIODOS)})")
+    if origen not in ORIGENES:
+        raise ValueError(f"Origen no valido: {origen} (validos: {', '.join(ORIGENES)})")
+    if not _supa:
+        return []
+    ids = sorted({int(i) for i in producto_ids}) if producto_ids is not None else None
+    if ids is not None and not ids:
+        return []
+
+    if _rpc_disponible is not False:
+        try:
+            filas = _por_rpc(_supa, desde, hasta, ids, periodo, origen)
+            _rpc_disponible = True
+            return filas
+        except Exception as e:
+            if _rpc_disponible or not _falta_rpc(e):
+                raise  # la RPC existe (o no se sabe): el error es de esta consulta
+            _rpc_disponible = False
+    if origen != "pedido":
+        return []  # sin RPC no hay acumulado de albaranes
+    return _por_paginas(_supa, desde, hasta, ids, periodo)
+
+
+def ventas_por_producto(
+    supa, desde: date, hasta: date, producto_ids: Optional[Sequence[int]] = None, origen: str = "pedido"
+) -> Dict[int, Tuple[float, float]]:
+    """{producto_id: (cantidad, importe)} del rango."""
+    return {
+        r["producto_id"]: (r["qty"], r["total"])
+        for r in ventas_agregadas(supa, desde, hasta, producto_ids, "total", origen)
+    }
+
+
+def ventas_por_anio(
+    supa, anios: Sequence[int], producto_ids: Optional[Sequence[int]] = None, origen: str = "pedido"
+) -> Dict[int, Dict[int, Tuple[float, float]]]:
+    """{año: {producto_id: (cantidad, importe)}} de los años pedidos, en una sola consulta."""
+    anios = sorted(set(int(a) for a in anios))
+    out: Dict[int, Dict[int, Tuple[float, float]]] = {a: {} for a in anios}
+    if not anios:
+        return out
+    filas = ventas_agregadas(supa, date(anios[0], 1, 1), date(anios[-1] + 1, 1, 1), producto_ids, "anio", origen)
+    for r in filas:
+        anio = int(r["periodo"][:4]) if r["periodo"] else None
+        if anio in out:
+            out[anio][r["producto_id"]] = (r["qty"], r["total"])
+    return out